@@ -0,0 +1,77 @@
+"""
+Custo do RowTransformer (features de um imóvel sem pandas, usado na API) contra o
+caminho antigo (DataFrame de uma linha + feature_engineering + reindex às colunas).
+
+A paridade está em tests/test_row_features.py (python -m pytest tests).
+
+Uso:
+    cd MLEngine/ML_Training/
+    python bench_row_features.py                          # dataset da BD, vocabulário do próprio dataset
+    python bench_row_features.py --columns models/columns_terreno.pkl
+    python bench_row_features.py --synthetic 20000        # sem BD (imóveis do bench_features)
+"""
+import argparse
+import os
+import sys
+import time
+
+import joblib
+import numpy as np
+
+root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(root_dir)
+from common.encoding import CATEGORICAL_PREFIXES, SparseEncoder
+from common.processing import build_base_features, feature_engineering, get_data_from_db
+from common.row_features import RowTransformer
+
+NUMERIC = [
+    'area_relevante_m2', 'area_bruta_m2', 'area_util_m2', 'area_terreno_m2', 'ano_construcao',
+    'num_quartos', 'num_wc', 'score_estado', 'flag_urgente', 'flag_ruina', 'flag_novo',
+    'flag_urbano', 'flag_rustico', 'flag_viabilidade', 'tem_elevador', 'tem_estacionamento',
+]
+
+
+def pandas_row(df_row, columns):
+    """Caminho antigo da API: DataFrame de uma linha, feature_engineering e reindex."""
+    return feature_engineering(df_row).reindex(columns=columns, fill_value=0).fillna(0).astype(float).to_numpy()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Custo do RowTransformer")
+    parser.add_argument('--columns', help="columns_*.pkl de um modelo (por omissão: vocabulário do dataset)")
+    parser.add_argument('--synthetic', type=int, help="Usa N imóveis sintéticos em vez da BD")
+    parser.add_argument('--sample', type=int, default=500, help="Imóveis usados na medição de tempo")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        from bench_features import make_frame
+        df = make_frame(args.synthetic)
+        df['certificado_energetico'] = np.random.default_rng(0).choice(['A', 'B', 'C', 'D', None], len(df))
+    else:
+        df = get_data_from_db()
+    if df.empty:
+        print("❌ Sem dados.")
+        return
+
+    if args.columns:
+        encoder = SparseEncoder(joblib.load(args.columns))
+    else:
+        encoder = SparseEncoder.fit(build_base_features(df.copy()), NUMERIC, categorical=list(CATEGORICAL_PREFIXES))
+    transformer = RowTransformer(encoder)
+    records = df.to_dict('records')
+
+    # Custo por imóvel (um pedido da API = um imóvel)
+    amostra = records[:args.sample]
+    t0 = time.perf_counter()
+    for i in range(len(amostra)):
+        pandas_row(df.iloc[[i]].copy(), encoder.columns)
+    t_pandas = (time.perf_counter() - t0) / len(amostra) * 1000
+    t0 = time.perf_counter()
+    for r in amostra:
+        transformer.transform(r)
+    t_row = (time.perf_counter() - t0) / len(amostra) * 1000
+    print(f"⏱️ pandas {t_pandas:.3f} ms/imóvel | RowTransformer {t_row:.3f} ms/imóvel | {t_pandas / t_row:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -11,37 +11,23 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 root_dir = os.path.abspath(os.path.join(current_dir, '..'))
 sys.path.append(root_dir)
 
-# Importar o processador centralizado
-from common.processing import get_data_from_db, feature_engineering
+# Importar o feature store (features já calculadas pelo processador centralizado)
+from common.encoding import load_encoder
+from common.feature_store import load_features
+from common.model_registry import MODELO_MAPPING
 
 MODEL_DIR = os.path.join(current_dir, 'models')
 
-# Mapa para saber que modelo usar para cada tipo de imóvel
-MODELO_MAPPING = {
-    'apartamento': 'habitacional',
-    'moradia': 'habitacional',
-    'duplex': 'habitacional',
-    'predio': 'habitacional',
-    'quinta': 'habitacional',
-    'terreno': 'terreno',
-    'lote': 'terreno',
-    'garagem': 'garagem',
-    'arrecadacao': 'garagem'
-}
 
 def main():
-    # 1. CARREGAR DADOS
-    print("🚀 A carregar dados da Base de Dados (SQL)...")
-    df_raw = get_data_from_db()
+    # 1 + 2. CARREGAR FEATURES (o feature store só recalcula os imóveis alterados)
+    print("🚀 A carregar features da Base de Dados (SQL)...")
+    df_features = load_features(encode=False)
     
-    if df_raw.empty:
+    if df_features.empty:
         print("❌ Sem dados. Verifica se o scraper e o enrich_data.py já correram.")
         return
 
-    # 2. PROCESSAMENTO (Calcula Areas Relevantes e Scores IA)
-    print("⚙️ A processar features e inteligência artificial...")
-    df_features = feature_engineering(df_raw.copy())
-
     # =========================================================================
     # 3. FILTRO INTERATIVO (FREGUESIAS)
     # =========================================================================
@@ -86,6 +72,7 @@ def main():
         # Carregar o Cérebro Especialista
         path_model = os.path.join(MODEL_DIR, f"modelo_{modelo_nome}.pkl")
         path_cols = os.path.join(MODEL_DIR, f"columns_{modelo_nome}.pkl")
+        path_encoder = os.path.join(MODEL_DIR, f"encoder_{modelo_nome}.pkl")
         
         if not os.path.exists(path_model):
             print(f"⚠️ Modelo '{modelo_nome}' não encontrado. (Corre o treino_modelo.py primeiro)")
@@ -93,13 +80,13 @@ def main():
 
         try:
             model = joblib.load(path_model)
-            train_cols = joblib.load(path_cols)
+            encoder = load_encoder(path_encoder, path_cols)
         except Exception as e:
             print(f"❌ Erro modelo {modelo_nome}: {e}")
             continue
 
-        # Preparar dados para o modelo (Garante as mesmas colunas do treino)
-        X = df_grupo.reindex(columns=train_cols, fill_value=0)
+        # Preparar dados para o modelo (mesmas colunas do treino, matriz esparsa)
+        X = encoder.transform(df_grupo)
         
         # PREDIÇÃO: O modelo devolve o Preço Justo por m²
         pred_preco_m2 = model.predict(X)
@@ -2,7 +2,6 @@ import sys
 import os
 import pandas as pd
 import numpy as np
-import joblib
 from sklearn.model_selection import train_test_split
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.metrics import mean_absolute_error, r2_score
@@ -10,7 +9,9 @@ from sklearn.metrics import mean_absolute_error, r2_score
 # Setup de caminhos para importar o common
 root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 sys.path.append(root_dir)
-from common.processing import get_data_from_db, feature_engineering
+from common.encoding import SparseEncoder
+from common.feature_store import load_features
+from common.model_registry import dump_atomic
 
 # Diretoria para guardar os modelos
 MODEL_DIR = os.path.join(os.path.dirname(__file__), 'models')
@@ -50,10 +51,12 @@ def treinar_especialista(df_total, tipo_nome, filtros_tipo, features_cols, targe
             df = df[(df[target_col] > 200) & (df[target_col] < 5000)]
 
     # 4. Seleção de Features
-    # Garante que só usamos colunas que existem
-    cols_disponiveis = [c for c in df.columns if c in features_cols or c.startswith('freg_') or c.startswith('tipo_')]
-    
-    X = df[cols_disponiveis].fillna(0)
+    # Garante que só usamos colunas que existem. O one-hot de freguesia/tipologia usa o
+    # vocabulário do conjunto inteiro (matriz esparsa, sem colunas densas de zeros)
+    cols_disponiveis = [c for c in features_cols if c in df.columns]
+    encoder = SparseEncoder.fit(df_total, cols_disponiveis)
+
+    X = encoder.transform(df)
     y = df[target_col]
 
     # 5. Treino
@@ -75,22 +78,21 @@ def treinar_especialista(df_total, tipo_nome, filtros_tipo, features_cols, targe
         indices = np.argsort(importances)[::-1]
         print("   🔝 Top 3 Fatores mais importantes:")
         for i in range(min(3, len(indices))):
-            print(f"      {i+1}. {X.columns[indices[i]]} ({importances[indices[i]]:.1%})")
+            print(f"      {i+1}. {encoder.columns[indices[i]]} ({importances[indices[i]]:.1%})")
     except: pass
 
-    # Guardar
-    joblib.dump(model, os.path.join(MODEL_DIR, f'modelo_{tipo_nome}.pkl'))
-    joblib.dump(list(X.columns), os.path.join(MODEL_DIR, f'columns_{tipo_nome}.pkl'))
+    # Guardar (o modelo por último: é a mudança dele que a API usa como nova versão)
+    dump_atomic(encoder.columns, os.path.join(MODEL_DIR, f'columns_{tipo_nome}.pkl'))
+    encoder.save(os.path.join(MODEL_DIR, f'encoder_{tipo_nome}.pkl'))
+    dump_atomic(model, os.path.join(MODEL_DIR, f'modelo_{tipo_nome}.pkl'))
 
 # ============================
 # EXECUÇÃO
 # ============================
 if __name__ == "__main__":
-    # 1. Carregar dados frescos (com IA)
-    df_raw = get_data_from_db()
-    
-    # 2. Processamento (Cria area_relevante_m2, score_estado, etc.)
-    df_full = feature_engineering(df_raw)
+    # 1 + 2. Features do feature store (só os imóveis alterados desde o último run são
+    # recalculados: area_relevante_m2, score_estado, etc.). O one-hot é feito por especialista
+    df_full = load_features(encode=False)
 
     # 3. Definição das Features Inteligentes
     # NOTA: Agora usamos 'area_relevante_m2' para tudo, porque ela adapta-se.
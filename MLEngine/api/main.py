@@ -1,11 +1,18 @@
 # api/main.py
 import sys
 import os
+import json
+import tempfile
+from itertools import islice
+import unicodedata
+from contextlib import asynccontextmanager
+import numpy as np
 import pandas as pd
-import joblib
-from fastapi import FastAPI
-from pydantic import BaseModel,ConfigDict
-from typing import Optional # Para o float
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel,ConfigDict,ValidationError
+from starlette.concurrency import run_in_threadpool
+from typing import List, Optional # Para o float
 
 # --- CONFIGURAÇÃO DE CAMINHOS ---
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -15,20 +22,65 @@ sys.path.append(root_dir)
 # Caminho para onde o modelo foi guardado (ML_Training/models)
 MODEL_PATH = os.path.join(root_dir, 'ML_Training', 'models')
 
+# Imóveis por model.predict em /predict/batch e /predict/stream (limita a memória por pedido)
+PREDICT_CHUNK_SIZE = int(os.getenv('PREDICT_CHUNK_SIZE', '1000'))
+# Limites do /predict/batch (o corpo é lido e validado de uma vez): acima disto, 413 e usar o
+# /predict/stream (NDJSON, lido bloco a bloco). Os bytes vêm do Content-Length, antes de ler o corpo.
+BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', '5000'))
+BATCH_MAX_BYTES = int(os.getenv('BATCH_MAX_BYTES', str(16 * 1024 * 1024)))
+# Uploads do /predict/stream acima disto vão para disco em vez de ficarem em memória
+UPLOAD_SPOOL_BYTES = int(os.getenv('UPLOAD_SPOOL_BYTES', str(8 * 1024 * 1024)))
+# De quantos em quantos segundos se procuram modelos novos na pasta (0 desliga)
+MODEL_RELOAD_SECONDS = float(os.getenv('MODEL_RELOAD_SECONDS', '5'))
+# Micro-batching do /predict: janela (0 desliga), máximo de imóveis por lote e de pedidos em fila
+PREDICT_BATCH_WINDOW_MS = float(os.getenv('PREDICT_BATCH_WINDOW_MS', '5'))
+PREDICT_BATCH_MAX = int(os.getenv('PREDICT_BATCH_MAX', '64'))
+PREDICT_QUEUE_MAX = int(os.getenv('PREDICT_QUEUE_MAX', '1000'))
+# Cache de previsões: entradas em memória por worker (0 desliga), validade e SQLite partilhado opcional
+PREDICTION_CACHE_SIZE = int(os.getenv('PREDICTION_CACHE_SIZE', '10000'))
+PREDICTION_CACHE_TTL = float(os.getenv('PREDICTION_CACHE_TTL', '3600'))
+PREDICTION_CACHE_SQLITE = os.getenv('PREDICTION_CACHE_SQLITE')
+# Grupos até este tamanho usam o RowTransformer (mais rápido que um DataFrame para poucos imóveis)
+ROW_PATH_MAX = 32
+
 # Importar lógica partilhada (Assumindo que está em common/processing.py)
-from common.processing import feature_engineering
+from common.micro_batcher import MicroBatcher, QueueFull
+from common.model_registry import ModelRegistry
+from common.prediction_cache import PredictionCache
+from common.processing import build_base_features
+
+# Carregar os especialistas (modelo + colunas de cada um, compiladas uma vez)
+registry = ModelRegistry(MODEL_PATH)
+registry.refresh(wait_stable=False)
+if registry.models:
+    print(f"✅ API Pronta: {', '.join(registry.versions().values())}.")
+else:
+    print(f"❌ Erro fatal: Não encontrei modelos em {MODEL_PATH}. Corra o treino primeiro!")
+
+# Resultados já calculados (a versão do modelo faz parte da chave; um modelo novo limpa os do antigo)
+cache = (PredictionCache(PREDICTION_CACHE_SIZE, PREDICTION_CACHE_TTL, PREDICTION_CACHE_SQLITE)
+         if PREDICTION_CACHE_SIZE > 0 else None)
+if cache:
+    registry.on_reload.append(lambda entries: [cache.invalidate(e.name, e.version) for e in entries])
+
 
-app = FastAPI(title="MLEngine API", version="1.0", description="Motor de Previsão de Preços Imobiliários (MLEngine)")
+@asynccontextmanager
+async def lifespan(app):
+    # Modelos novos na pasta entram sem reiniciar a API
+    if MODEL_RELOAD_SECONDS > 0:
+        registry.watch(MODEL_RELOAD_SECONDS)
+    if batcher:
+        batcher.start()
+    yield
+    if batcher:
+        await batcher.stop()
+    registry.stop()
 
-# Carregar Modelo e Colunas
-try:
-    model = joblib.load(os.path.join(MODEL_PATH, 'ml_engine_model.pkl'))
-    model_cols = joblib.load(os.path.join(MODEL_PATH, 'model_columns.pkl'))
-    print("✅ API Pronta: Modelo carregado.")
-except Exception as e:
-    print(f"❌ Erro fatal: Não encontrei o modelo em {MODEL_PATH}. Corra o treino primeiro! Detalhe: {e}")
-    model = None
-    model_cols = None
+
+app = FastAPI(title="MLEngine API", version="1.0", description="Motor de Previsão de Preços Imobiliários (MLEngine)",
+              lifespan=lifespan)
+
+MODEL_MISSING = {"error": "Modelo não carregado. Treine o modelo primeiro."}
 
 # Define o formato dos dados que a API espera receber
 class ImovelInput(BaseModel):
@@ -57,38 +109,111 @@ class ImovelInput(BaseModel):
     elevador: str = "Não"
     estacionamento: str = "Não"
     certificado_energetico: str = "Desconhecido"
+    # Escolhe o modelo especialista (ex: 'apartamento', 'terreno', 'garagem').
+    # Por omissão é a 1ª palavra da tipologia ("Apartamento T3" -> 'apartamento').
+    listing_type: Optional[str] = None
     
     preco_compra: float = 0.0
     custo_obra: float = 0.0
 
-@app.post("/predict")
-def predict_price(imovel: ImovelInput):
-    if not model: 
-        return {"error": "Modelo não carregado. Treine o modelo primeiro."}
-
-    # 1. Criar DataFrame com o input do utilizador
-    dados = {
-        'area_bruta_m2': [imovel.area_bruta_m2],
-        'num_quartos': [imovel.num_quartos],
-        'num_wc': [imovel.num_wc],
-        'ano_construcao': [imovel.ano_construcao],
-        'freguesia': [imovel.freguesia],
-        'tipologia': [imovel.tipologia],
-        'elevador': [imovel.elevador],
-        'estacionamento': [imovel.estacionamento],
-        'certificado_energetico': [imovel.certificado_energetico], 
-        'link': [''] # Dummy para o processing.py
+def listing_type_of(imovel):
+    tipo = imovel.listing_type or (imovel.tipologia.split() or [''])[0]
+    sem_acentos = unicodedata.normalize('NFKD', tipo).encode('ascii', 'ignore').decode()
+    return sem_acentos.strip().lower()
+
+
+def input_row(imovel, listing_type):
+    """Input do utilizador com as colunas que o processing.py espera."""
+    return {
+        'area_bruta_m2': imovel.area_bruta_m2,
+        'num_quartos': imovel.num_quartos,
+        'num_wc': imovel.num_wc,
+        'ano_construcao': imovel.ano_construcao,
+        'freguesia': imovel.freguesia,
+        'tipologia': imovel.tipologia,
+        'elevador': imovel.elevador,
+        'estacionamento': imovel.estacionamento,
+        'certificado_energetico': imovel.certificado_energetico, 
+        'link': f'venda-{listing_type}' # Dummy para o processing.py (tira o tipo do link)
     }
-    
-    # 2. Usar a função partilhada para processar (Feature Engineering)
-    df_input = pd.DataFrame(dados)
-    df_processed = feature_engineering(df_input)
-    
-    # 3. Alinhar colunas (Reindexar para garantir 500+ colunas)
-    df_final = df_processed.reindex(columns=model_cols, fill_value=0)
-    
-    # 4. Prever o Preço de Venda Final (ARV)
-    preco_m2_previsto = model.predict(df_final)[0]
+
+
+def canonical_input(imovel):
+    """Input normalizado para a chave da cache: tipo resolvido, texto que o processing
+    normaliza em minúsculas (pedidos equivalentes dão a mesma chave)."""
+    payload = imovel.model_dump()
+    payload['listing_type'] = listing_type_of(imovel)
+    payload['freguesia'] = imovel.freguesia.strip().lower()
+    payload['tipologia'] = imovel.tipologia.strip().lower()
+    return payload
+
+
+def cache_key(imovel):
+    """Chave da cache para a versão atual do especialista (None se não houver modelo)."""
+    entry = registry.get(listing_type_of(imovel))
+    return cache.key(canonical_input(imovel), entry.version) if entry else None
+
+
+def cached_result(imovel):
+    """Resultado em cache (memória e SQLite) ou None. Faz I/O: fora do event loop."""
+    key = cache_key(imovel)
+    return cache.get(key) if key else None
+
+
+def remember(imovel, resultado):
+    if 'versao_modelo' in resultado:
+        key = cache.key(canonical_input(imovel), resultado['versao_modelo'])
+        cache.set(key, resultado, resultado['modelo'], resultado['versao_modelo'])
+
+
+def predict_cached(imoveis):
+    """predict_chunk só para os imóveis que não estão em cache (lê e grava a cache,
+    incluindo o SQLite: corre no threadpool ou no thread do micro-batcher)."""
+    if not cache:
+        return predict_chunk(imoveis)
+    resultados = [cached_result(i) for i in imoveis]
+    falta = [p for p, r in enumerate(resultados) if r is None]
+    if falta:
+        for p, resultado in zip(falta, predict_chunk([imoveis[p] for p in falta])):
+            resultados[p] = resultado
+            remember(imoveis[p], resultado)
+    return resultados
+
+
+def no_model(listing_type):
+    return {"error": f"Sem modelo para o tipo de imóvel '{listing_type}'."}
+
+
+def predict_chunk(imoveis):
+    """Resultado de vários imóveis (pela mesma ordem): feature engineering vetorizado
+    e um só model.predict por especialista."""
+    tipos = [listing_type_of(i) for i in imoveis]
+    grupos = {}
+    for pos, tipo in enumerate(tipos):
+        entry = registry.get(tipo)
+        if entry:
+            grupos.setdefault(entry, []).append(pos)
+
+    resultados = [no_model(tipo) for tipo in tipos]
+    for entry, posicoes in grupos.items():
+        rows = [input_row(imoveis[p], tipos[p]) for p in posicoes]
+        if len(rows) <= ROW_PATH_MAX:
+            X = np.vstack([entry.transformer.transform(row) for row in rows])
+        else:
+            X = entry.encoder.transform(build_base_features(pd.DataFrame(rows)))
+        for p, preco in zip(posicoes, entry.model.predict(X)):
+            resultados[p] = valuation(imoveis[p], preco, entry)
+    return resultados
+
+
+def chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def valuation(imovel, preco_m2_previsto, entry):
+    """Passos 4 e 5: valor de venda (ARV) e ganhos a partir do preço/m2 previsto."""
+    preco_m2_previsto = float(preco_m2_previsto)
     preco_venda_total_previsto = preco_m2_previsto * imovel.area_bruta_m2
     
     # 5. CÁLCULO DE GANHOS (Flipping Logic)
@@ -103,9 +228,137 @@ def predict_price(imovel: ImovelInput):
         "preco_m2_previsto": round(preco_m2_previsto, 2),
         "lucro_potencial_bruto": round(lucro_potencial, 2),
         "roi_percentagem": f"{round(roi * 100, 2)}%",
-        "moeda": "EUR"
+        "moeda": "EUR",
+        "modelo": entry.name,
+        "versao_modelo": entry.version
     }
 
+
+# Pedidos concorrentes ao /predict juntos num só predict por especialista
+batcher = (MicroBatcher(predict_cached, PREDICT_BATCH_WINDOW_MS / 1000, PREDICT_BATCH_MAX, PREDICT_QUEUE_MAX)
+           if PREDICT_BATCH_WINDOW_MS > 0 else None)
+
+
+@app.post("/predict")
+async def predict_price(imovel: ImovelInput):
+    if not registry.models: 
+        return MODEL_MISSING
+    # Só a cache em memória corre no event loop; o SQLite e o remember ficam no predict_cached
+    if cache:
+        key = cache_key(imovel)
+        resultado = cache.get_memory(key) if key else None
+        if resultado is not None:
+            return resultado
+
+    if not batcher:
+        return (await run_in_threadpool(predict_cached, [imovel]))[0]
+    try:
+        return await batcher.submit(imovel)
+    except QueueFull:
+        raise HTTPException(status_code=503, detail="Demasiados pedidos em fila. Tente de novo.")
+
+
+BATCH_TOO_LARGE = (f"O /predict/batch aceita até {BATCH_MAX_ITEMS} imóveis ({BATCH_MAX_BYTES // (1024 * 1024)} MB). "
+                   "Para mais, enviar NDJSON (um imóvel por linha) para /predict/stream.")
+
+
+@app.middleware("http")
+async def limit_batch_body(request: Request, call_next):
+    """Recusa o /predict/batch grande antes de o FastAPI ler e validar o corpo todo."""
+    if request.url.path == "/predict/batch":
+        tamanho = request.headers.get('content-length')
+        if tamanho and tamanho.isdigit() and int(tamanho) > BATCH_MAX_BYTES:
+            return JSONResponse({"detail": BATCH_TOO_LARGE}, status_code=413)
+    return await call_next(request)
+
+
+@app.post("/predict/batch")
+def predict_batch(imoveis: List[ImovelInput]):
+    """Lista JSON de imóveis -> lista de resultados pela mesma ordem (um predict por bloco).
+
+    No máximo BATCH_MAX_ITEMS imóveis e BATCH_MAX_BYTES de corpo (413 acima disso):
+    para listas maiores usar o /predict/stream."""
+    if len(imoveis) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=BATCH_TOO_LARGE)
+    if not registry.models:
+        return MODEL_MISSING
+
+    resultados = []
+    for bloco in chunks(imoveis, PREDICT_CHUNK_SIZE):
+        resultados.extend(predict_cached(bloco))
+    return resultados
+
+
+async def spool_upload(request):
+    """Corpo do pedido num ficheiro temporário (em memória só até UPLOAD_SPOOL_BYTES).
+
+    Tem de ser lido antes da StreamingResponse começar: com ASGI < 2.4 o starlette
+    fica a ouvir o cliente durante a resposta e consumiria o resto do corpo."""
+    upload = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_BYTES)
+    async for parte in request.stream():
+        # Passado o max_size a escrita vai para disco: fora do event loop
+        await run_in_threadpool(upload.write, parte)
+    await run_in_threadpool(upload.seek, 0)
+    return upload
+
+
+def ndjson_block(upload, numero):
+    """Lê até PREDICT_CHUNK_SIZE linhas do upload, valida-as e avalia as válidas (corre no
+    threadpool: o upload pode estar em disco). Devolve (NDJSON do bloco, última linha lida).
+
+    As linhas contam-se todas, em branco incluídas, para o "linha" dos erros bater com o ficheiro."""
+    bloco = []
+    for numero, linha in enumerate(islice(upload, PREDICT_CHUNK_SIZE), numero + 1):
+        if not linha.strip():
+            continue
+        try:
+            bloco.append(ImovelInput.model_validate_json(linha))
+        except ValidationError as e:
+            bloco.append({"linha": numero, "error": e.errors(include_url=False, include_context=False, include_input=False)})
+    validos = [item for item in bloco if isinstance(item, ImovelInput)]
+    resultados = iter(predict_cached(validos) if validos else [])
+    linhas = [json.dumps(next(resultados) if isinstance(item, ImovelInput) else item, ensure_ascii=False)
+              for item in bloco]
+    return ''.join(f"{linha}\n" for linha in linhas), numero
+
+
+async def predict_ndjson(upload):
+    """Um resultado (ou {"linha", "error"}) por linha de input, pela mesma ordem."""
+    try:
+        numero = 0
+        while True:
+            texto, lida = await run_in_threadpool(ndjson_block, upload, numero)
+            if lida == numero:
+                break   # Fim do upload
+            numero = lida
+            if texto:
+                yield texto
+    finally:
+        upload.close()
+
+
+@app.post("/predict/stream")
+async def predict_stream(request: Request):
+    """NDJSON in, NDJSON out: avaliado e devolvido bloco a bloco. Em memória fica no
+    máximo um bloco (PREDICT_CHUNK_SIZE), qualquer que seja o tamanho do upload."""
+    if not registry.models:
+        return MODEL_MISSING
+    upload = await spool_upload(request)
+    return StreamingResponse(predict_ndjson(upload), media_type='application/x-ndjson')
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Métricas do micro-batching e da cache em texto Prometheus."""
+    return (batcher.prometheus() if batcher else '') + (cache.prometheus() if cache else '')
+
+
+@app.get("/models")
+def list_models():
+    """Versão carregada de cada especialista."""
+    return registry.versions()
+
+
 if __name__ == "__main__":
     import uvicorn
     # A correr na porta 8000
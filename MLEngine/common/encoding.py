@@ -0,0 +1,136 @@
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+# =========================================================================
+# ONE-HOT ESPARSO COM VOCABULÁRIO FIXO
+# =========================================================================
+# O pd.get_dummies do encode_features cria uma coluna densa por categoria (500+
+# freguesias e tipologias, quase tudo zeros) e o vocabulário depende dos dados
+# que lá entram, por isso a API tinha de fazer reindex às colunas do treino.
+#
+# O SparseEncoder fixa as colunas do modelo (numéricas + one-hot, com os mesmos
+# nomes do get_dummies: 'freg_arroios', 'tipo_apartamento t2', ...) e gera uma
+# matriz CSR diretamente das colunas em bruto. Guarda-se ao lado do modelo.
+
+# Coluna categórica -> prefixo das colunas one-hot
+CATEGORICAL_PREFIXES = {
+    'tipologia_limpa': 'tipo',
+    'freguesia_limpa': 'freg',
+    'certificado_energetico': 'cert',
+    'listing_type': 'lst_type',
+}
+
+
+class SparseEncoder:
+    """Colunas do modelo por ordem; as que têm um prefixo de CATEGORICAL_PREFIXES são one-hot.
+
+    references: categoria de referência de cada coluna (a que o drop_first tirou).
+    Conta como conhecida mas não tem coluna, como no get_dummies.
+    """
+
+    def __init__(self, columns, references=None, prefixes=CATEGORICAL_PREFIXES):
+        self.columns = list(columns)
+        self.references = dict(references or {})
+        self.numeric = {}       # nome -> posição
+        self.categories = {}    # coluna -> {valor: posição}
+
+        # Prefixo mais comprido primeiro ('lst_type_' antes de um eventual 'lst_')
+        by_prefix = sorted(((p + '_', col) for col, p in prefixes.items()), key=lambda x: -len(x[0]))
+        for pos, name in enumerate(self.columns):
+            for prefix, col in by_prefix:
+                if name.startswith(prefix):
+                    self.categories.setdefault(col, {})[name[len(prefix):]] = pos
+                    break
+            else:
+                self.numeric[name] = pos
+
+    @classmethod
+    def fit(cls, df, numeric, categorical=('tipologia_limpa', 'freguesia_limpa'), drop_first=True):
+        """Vocabulário tirado de df: categorias ordenadas e (com drop_first) sem a primeira."""
+        columns, references = list(numeric), {}
+        for col in categorical:
+            values = sorted(df[col].dropna().unique()) if col in df.columns else []
+            if drop_first and values:
+                references[col] = values[0]
+                values = values[1:]
+            columns += [f"{CATEGORICAL_PREFIXES[col]}_{v}" for v in values]
+        return cls(columns, references)
+
+    def codes(self, df, unknown='ignore'):
+        """Códigos inteiros por coluna categórica: posição no vocabulário ou -1 (referência,
+        vazio ou categoria desconhecida). unknown='error' levanta ValueError se houver
+        categorias que o modelo nunca viu; 'ignore' deixa-as a zeros."""
+        if unknown == 'error':
+            unseen = self.unseen(df)
+            if unseen:
+                raise ValueError(f"Categorias desconhecidas: {unseen}")
+        elif unknown != 'ignore':
+            raise ValueError(f"unknown deve ser 'ignore' ou 'error', não {unknown!r}")
+
+        codes = {}
+        for col, vocab in self.categories.items():
+            if col in df.columns:
+                codes[col] = pd.Categorical(df[col], categories=list(vocab)).codes.astype(np.int64)
+            else:
+                codes[col] = np.full(len(df), -1, dtype=np.int64)
+        return codes
+
+    def unseen(self, df):
+        """{coluna: valores fora do vocabulário} (só as colunas com algum)."""
+        unseen = {}
+        for col, vocab in self.categories.items():
+            if col not in df.columns:
+                continue
+            known = [*vocab, *([self.references[col]] if col in self.references else [])]
+            extra = pd.Index(df[col].dropna().unique()).difference(known)
+            if len(extra):
+                unseen[col] = extra.tolist()
+        return unseen
+
+    def transform(self, df, unknown='ignore'):
+        """Matriz CSR (len(df) x len(columns)). Numéricas em falta ou NaN ficam a 0."""
+        rows, cols, data = [], [], []
+        for name, pos in self.numeric.items():
+            if name not in df.columns:
+                continue
+            values = pd.to_numeric(df[name], errors='coerce').fillna(0).to_numpy(dtype=np.float64)
+            hit = np.flatnonzero(values)
+            rows.append(hit)
+            cols.append(np.full(len(hit), pos))
+            data.append(values[hit])
+
+        for col, code in self.codes(df, unknown).items():
+            positions = np.fromiter(self.categories[col].values(), dtype=np.int64)
+            hit = np.flatnonzero(code >= 0)
+            rows.append(hit)
+            cols.append(positions[code[hit]])
+            data.append(np.ones(len(hit)))
+
+        if not rows:
+            return sparse.csr_matrix((len(df), len(self.columns)))
+        return sparse.csr_matrix(
+            (np.concatenate(data), (np.concatenate(rows), np.concatenate(cols))),
+            shape=(len(df), len(self.columns))
+        )
+
+    def save(self, path):
+        # Ficheiro temporário + rename: a API pode estar a recarregar os modelos
+        joblib.dump({'columns': self.columns, 'references': self.references}, f"{path}.tmp")
+        os.replace(f"{path}.tmp", path)
+
+    @classmethod
+    def load(cls, path):
+        state = joblib.load(path)
+        return cls(state['columns'], state['references'])
+
+
+def load_encoder(encoder_path, columns_path):
+    """Encoder guardado no treino; para modelos antigos (só columns_*.pkl) é
+    reconstruído a partir dos nomes das colunas, sem categoria de referência."""
+    if os.path.exists(encoder_path):
+        return SparseEncoder.load(encoder_path)
+    return SparseEncoder(joblib.load(columns_path))
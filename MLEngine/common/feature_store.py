@@ -0,0 +1,153 @@
+import argparse
+import time
+
+import pandas as pd
+from sqlalchemy import bindparam, text
+
+from common.processing import build_base_features, encode_features, get_engine, sql_filters
+
+# =========================================================================
+# FEATURE STORE INCREMENTAL (tabela imoveis_features)
+# =========================================================================
+# Guarda as features de cada imóvel (passos 1 a 5 do processing) com a origem
+# de onde foram calculadas: last_crawled do imóvel e analisado_em da IA. Um
+# refresh só recalcula as linhas novas, re-crawladas, com análise IA nova (ou
+# apagada) ou calculadas com outra FEATURES_VERSION.
+#
+# O one-hot encoding depende do conjunto inteiro (categorias, drop_first) e é
+# feito na leitura. O preço vem sempre da tabela imoveis: o price_sweep muda-o
+# sem mexer em last_crawled. O preço/m² e os filtros usam só colunas do store,
+# para a leitura não depender das colunas geradas de imoveis (--backfill).
+
+# Subir quando a lógica do build_base_features mudar (recalcula tudo)
+FEATURES_VERSION = 1
+
+# Features guardadas (nome -> tipo)
+FEATURE_COLUMNS = {
+    'link': 'TEXT',
+    'freguesia': 'VARCHAR',
+    'tipologia': 'VARCHAR',
+    'listing_type': 'TEXT',
+    'area_bruta_m2': 'FLOAT',
+    'area_util_m2': 'FLOAT',
+    'area_terreno_m2': 'FLOAT',
+    'area_relevante_m2': 'FLOAT',
+    'ano_construcao': 'INTEGER',
+    'num_quartos': 'INTEGER',
+    'num_wc': 'INTEGER',
+    'certificado_energetico': 'VARCHAR',
+    'freguesia_limpa': 'VARCHAR',
+    'tipologia_limpa': 'VARCHAR',
+    'score_estado': 'INTEGER',
+    'flag_ruina': 'INTEGER',
+    'flag_novo': 'INTEGER',
+    'flag_urgente': 'INTEGER',
+    'flag_urbano': 'INTEGER',
+    'flag_rustico': 'INTEGER',
+    'flag_viabilidade': 'INTEGER',
+    'tem_elevador': 'INTEGER',
+    'tem_estacionamento': 'INTEGER',
+}
+
+CREATE_TABLE = f"""
+    CREATE TABLE IF NOT EXISTS imoveis_features (
+        url_id VARCHAR PRIMARY KEY,
+        source_last_crawled TIMESTAMP,
+        ai_analisado_em TIMESTAMP,
+        versao INTEGER NOT NULL,
+        calculado_em TIMESTAMP NOT NULL DEFAULT now(),
+        {', '.join(f'{name} {kind}' for name, kind in FEATURE_COLUMNS.items())}
+    );
+"""
+
+# Linhas a (re)calcular, já com os dados da IA
+STALE_QUERY = """
+    SELECT
+        t1.*,
+        t2.estado_conservacao AS ai_estado,
+        t2.venda_urgente AS ai_urgente,
+        t2.analisado_em AS ai_analisado_em
+    FROM imoveis t1
+    LEFT JOIN imoveis_ai_data t2 ON t1.url_id = t2.imovel_id
+    LEFT JOIN imoveis_features f ON t1.url_id = f.url_id
+    WHERE f.url_id IS NULL
+       OR f.versao <> :versao
+       OR f.source_last_crawled IS DISTINCT FROM t1.last_crawled
+       OR f.ai_analisado_em IS DISTINCT FROM t2.analisado_em
+"""
+
+# Imóveis apagados de imoveis
+ORPHANS_QUERY = """
+    DELETE FROM imoveis_features f
+    WHERE NOT EXISTS (SELECT 1 FROM imoveis i WHERE i.url_id = f.url_id)
+"""
+
+LOAD_QUERY = """
+    SELECT f.*, t1.preco_atual, t1.preco_atual / NULLIF(f.area_relevante_m2, 0) AS preco_m2_relevante
+    FROM imoveis_features f
+    JOIN imoveis t1 ON t1.url_id = f.url_id
+    WHERE t1.preco_atual > 0 {filtros}
+"""
+
+
+def refresh(engine=None, full=False):
+    """Recalcula as linhas desatualizadas. Devolve (recalculadas, apagadas)."""
+    engine = engine or get_engine()
+    with engine.begin() as conn:
+        conn.execute(text(CREATE_TABLE))
+        if full:
+            conn.execute(text("TRUNCATE imoveis_features"))
+        df = pd.read_sql(text(STALE_QUERY), conn, params={'versao': FEATURES_VERSION})
+        removed = conn.execute(text(ORPHANS_QUERY)).rowcount
+        if df.empty:
+            return 0, removed
+
+        base = build_base_features(df)
+        store = base[['url_id', *FEATURE_COLUMNS]].copy()
+        store.insert(1, 'source_last_crawled', base['last_crawled'])
+        store.insert(2, 'ai_analisado_em', base['ai_analisado_em'])
+        store.insert(3, 'versao', FEATURES_VERSION)
+
+        conn.execute(
+            text("DELETE FROM imoveis_features WHERE url_id IN :ids").bindparams(bindparam('ids', expanding=True)),
+            {'ids': store['url_id'].tolist()}
+        )
+        store.to_sql('imoveis_features', conn, if_exists='append', index=False, chunksize=1000)
+    return len(store), removed
+
+
+def load_features(refresh_first=True, encode=True, listing_types=None, freguesias=None):
+    """Features do store (com o preço atual). encode=True aplica o one-hot do processing."""
+    engine = get_engine()
+    try:
+        if refresh_first:
+            t0 = time.perf_counter()
+            changed, removed = refresh(engine)
+            print(f"🔄 Feature store: {changed} imóveis recalculados, {removed} removidos ({time.perf_counter() - t0:.1f}s).")
+
+        filtros, params = sql_filters('f', listing_types, freguesias)
+        query = text(LOAD_QUERY.format(filtros=filtros)).bindparams(
+            *(bindparam(name, expanding=True) for name in params)
+        )
+        with engine.connect() as conn:
+            df = pd.read_sql(query, conn, params=params)
+    except Exception as e:
+        print(f"❌ Erro no feature store: {e}")
+        return pd.DataFrame()
+
+    print(f"✅ Features carregadas: {len(df)} imóveis.")
+    return encode_features(df) if encode else df
+
+
+# =========================================================================
+# CLI: refresh manual (ex: depois do enrich_data.py)
+# =========================================================================
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Atualiza o feature store (imoveis_features).")
+    parser.add_argument('--full', action='store_true', help="Recalcula todas as linhas")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    changed, removed = refresh(full=args.full)
+    print(f"✅ {changed} imóveis recalculados, {removed} removidos em {time.perf_counter() - t0:.1f}s.")
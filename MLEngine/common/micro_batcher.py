@@ -0,0 +1,120 @@
+import asyncio
+import time
+
+# =========================================================================
+# MICRO-BATCHING DE PEDIDOS CONCORRENTES
+# =========================================================================
+# Cada model.predict de uma RandomForest tem um custo fixo alto (200 árvores,
+# threads do joblib) que domina com muitos pedidos pequenos. O MicroBatcher
+# junta os pedidos que chegam dentro de `window` segundos (ou até
+# max_batch_size) e avalia-os numa só chamada a predict_batch, fora do event
+# loop. Cada pedido recebe o seu resultado através de um Future.
+
+
+class QueueFull(Exception):
+    """Mais de max_queue pedidos à espera: o pedido é recusado em vez de esperar sem fim."""
+
+
+class MicroBatcher:
+    def __init__(self, predict_batch, window, max_batch_size, max_queue):
+        """predict_batch(lista de itens) -> lista de resultados pela mesma ordem (síncrona)."""
+        self.predict_batch = predict_batch
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.max_queue = max_queue
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self._task = None
+
+        self.batches = 0
+        self.items = 0
+        self.rejected = 0
+        self.errors = 0
+        self.wait_seconds = 0.0      # soma, da chegada à resposta
+        self.predict_seconds = 0.0   # soma do tempo dentro de predict_batch
+        self.largest_batch = 0
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def submit(self, item):
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((item, future, time.perf_counter()))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise QueueFull(f"{self.max_queue} pedidos em fila")
+        return await future
+
+    async def _collect(self):
+        """Primeiro pedido (espera o que for preciso) + os que chegarem na janela."""
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        deadline = loop.time() + self.window
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            items = [item for item, _, _ in batch]
+            t0 = time.perf_counter()
+            try:
+                results = await loop.run_in_executor(None, self.predict_batch, items)
+            except Exception as e:
+                self.errors += 1
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            finally:
+                self.predict_seconds += time.perf_counter() - t0
+
+            done = time.perf_counter()
+            self.batches += 1
+            self.items += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+            for (_, future, queued_at), result in zip(batch, results):
+                self.wait_seconds += done - queued_at
+                if not future.done():  # O cliente pode ter desistido
+                    future.set_result(result)
+
+    def stats(self):
+        return {
+            'batch_window_seconds': self.window,
+            'batch_max_size': self.max_batch_size,
+            'queue_max_depth': self.max_queue,
+            'queue_depth': self.queue.qsize(),
+            'batches_total': self.batches,
+            'batched_requests_total': self.items,
+            'rejected_requests_total': self.rejected,
+            'batch_errors_total': self.errors,
+            'batch_size_largest': self.largest_batch,
+            'batch_size_mean': round(self.items / self.batches, 2) if self.batches else 0,
+            'request_wait_seconds_sum': round(self.wait_seconds, 6),
+            'predict_seconds_sum': round(self.predict_seconds, 6),
+        }
+
+    def prometheus(self, prefix='mlengine'):
+        return ''.join(f"{prefix}_{key} {value}\n" for key, value in self.stats().items())
@@ -0,0 +1,162 @@
+import os
+import threading
+import zlib
+from datetime import datetime
+
+import joblib
+
+from common.encoding import load_encoder
+from common.row_features import RowTransformer
+
+# =========================================================================
+# REGISTO DOS MODELOS ESPECIALISTAS
+# =========================================================================
+# Carrega os modelo_{nome}.pkl do treino_modelo.py (com o encoder/colunas de
+# cada um) e escolhe o especialista pelo tipo de imóvel. Uma thread vigia a
+# pasta e troca um modelo quando os ficheiros mudam: o novo é carregado à parte
+# e só depois entra no dict de modelos, que é substituído de uma vez (nunca
+# alterado no sítio). Um pedido usa sempre o SpecialistModel que leu no início.
+#
+# O treino grava colunas, encoder e só no fim o modelo: é a mudança do modelo
+# que dispara o reload, e só quando ele é pelo menos tão recente como o encoder
+# e as colunas (senão o treino vai a meio e o modelo ainda é o antigo).
+
+# Mapa para saber que modelo usar para cada tipo de imóvel
+MODELO_MAPPING = {
+    'apartamento': 'habitacional',
+    'moradia': 'habitacional',
+    'duplex': 'habitacional',
+    'predio': 'habitacional',
+    'quinta': 'habitacional',
+    'terreno': 'terreno',
+    'lote': 'terreno',
+    'garagem': 'garagem',
+    'arrecadacao': 'garagem'
+}
+SPECIALISTS = ('habitacional', 'terreno', 'garagem')
+
+
+def dump_atomic(obj, path):
+    """joblib.dump para um ficheiro temporário e rename: quem lê nunca vê meio ficheiro."""
+    tmp = f"{path}.tmp"
+    joblib.dump(obj, tmp)
+    os.replace(tmp, path)
+
+
+class SpecialistModel:
+    """Um modelo carregado, com o encoder e o RowTransformer das colunas dele."""
+
+    def __init__(self, name, model, encoder, version):
+        self.name = name
+        self.model = model
+        self.encoder = encoder
+        self.transformer = RowTransformer(encoder)
+        self.version = version
+
+
+class ModelRegistry:
+    def __init__(self, model_dir, names=SPECIALISTS):
+        self.model_dir = model_dir
+        self.names = names
+        self.models = {}        # nome -> SpecialistModel (substituído de uma vez)
+        self._signatures = {}   # nome -> assinatura dos ficheiros carregados
+        self._pending = {}      # nome -> assinatura nova, à espera de ficar estável
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        # Chamados com os SpecialistModel novos depois de cada troca (ex: limpar caches)
+        self.on_reload = []
+
+    def paths(self, name):
+        return tuple(os.path.join(self.model_dir, f) for f in
+                     (f'modelo_{name}.pkl', f'encoder_{name}.pkl', f'columns_{name}.pkl'))
+
+    def signature(self, name):
+        """(mtime, tamanho) de cada ficheiro do modelo (None se não existir)."""
+        signature = []
+        for path in self.paths(name):
+            try:
+                stat = os.stat(path)
+                signature.append((stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                signature.append(None)
+        return tuple(signature)
+
+    @staticmethod
+    def consistent(signature):
+        """True se o modelo não é mais antigo que o encoder e as colunas (gravados antes dele)."""
+        model_mtime = signature[0][0]
+        return all(s is None or s[0] <= model_mtime for s in signature[1:])
+
+    def load(self, name, signature):
+        path_model, path_encoder, path_cols = self.paths(name)
+        model = joblib.load(path_model)
+        encoder = load_encoder(path_encoder, path_cols)
+        # Data do modelo + hash da assinatura (dois treinos no mesmo segundo têm versões diferentes)
+        stamp = datetime.fromtimestamp(signature[0][0] / 1e9)
+        version = f"{name}-{stamp:%Y%m%d-%H%M%S}-{zlib.crc32(repr(signature).encode()):08x}"
+        return SpecialistModel(name, model, encoder, version)
+
+    def refresh(self, wait_stable=True):
+        """Carrega os modelos cujo ficheiro do modelo mudou. Devolve os nomes trocados.
+
+        Encoder e colunas mais recentes que o modelo: o treino ainda não gravou o
+        modelo novo, espera-se. wait_stable: só carrega ficheiros iguais aos da
+        verificação anterior. Se o load falhar, ou os ficheiros mudarem durante o
+        load, fica o modelo antigo e tenta-se outra vez na próxima verificação.
+        """
+        with self._lock:
+            changed = {}
+            for name in self.names:
+                signature = self.signature(name)
+                loaded = self._signatures.get(name)
+                if signature[0] is None or (loaded is not None and signature[0] == loaded[0]):
+                    self._pending.pop(name, None)
+                    continue
+                if not self.consistent(signature):
+                    self._pending.pop(name, None)
+                    continue
+                if wait_stable and self._pending.get(name) != signature:
+                    self._pending[name] = signature
+                    continue
+                try:
+                    entry = self.load(name, signature)
+                except Exception as e:
+                    print(f"❌ Erro a carregar o modelo '{name}': {e}")
+                    continue
+                if self.signature(name) != signature:
+                    continue  # Um treino gravou por cima durante o load: fica para a próxima
+                changed[name] = entry
+                self._signatures[name] = signature
+                self._pending.pop(name, None)
+
+            if changed:
+                self.models = {**self.models, **changed}
+                for entry in changed.values():
+                    print(f"✅ Modelo carregado: {entry.version}")
+                for callback in self.on_reload:
+                    callback(list(changed.values()))
+            return list(changed)
+
+    def get(self, listing_type):
+        """Especialista para o tipo de imóvel (None se não houver)."""
+        return self.models.get(MODELO_MAPPING.get(listing_type))
+
+    def versions(self):
+        return {name: entry.version for name, entry in self.models.items()}
+
+    def watch(self, interval):
+        """Verifica a pasta a cada `interval` segundos numa thread à parte."""
+        def loop():
+            while not self._stop.wait(interval):
+                self.refresh()
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=loop, name='model-registry', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
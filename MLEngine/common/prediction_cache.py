@@ -0,0 +1,119 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# =========================================================================
+# CACHE DE PREVISÕES
+# =========================================================================
+# O front end pede muitas vezes a avaliação dos mesmos imóveis. A chave é o
+# input canonizado (JSON ordenado) + a versão do modelo que respondeu, por isso
+# um modelo novo nunca serve resultados do antigo; o registo ainda chama
+# invalidate() quando troca um modelo, para libertar logo essas entradas.
+#
+# Em memória é um LRU com TTL por processo. Com sqlite_path as entradas ficam
+# também num SQLite local partilhado pelos vários workers da API. get_memory()
+# não faz I/O (pode correr no event loop); get/set/invalidate podem ir ao SQLite
+# e correm no threadpool ou no thread do micro-batcher.
+
+
+class PredictionCache:
+    def __init__(self, max_entries, ttl, sqlite_path=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()    # chave -> (expira, modelo, versão, resultado)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()   # event loop, threadpool e a thread do registo
+        self._db_lock = threading.Lock()    # SQLite à parte: o event loop nunca espera por I/O
+        self.db = None
+        if sqlite_path:
+            self.db = sqlite3.connect(sqlite_path, timeout=5, check_same_thread=False, isolation_level=None)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("""
+                CREATE TABLE IF NOT EXISTS previsoes (
+                    chave TEXT PRIMARY KEY, modelo TEXT, versao TEXT, resultado TEXT, expira REAL
+                )
+            """)
+
+    @staticmethod
+    def key(payload, version):
+        canonical = json.dumps(payload, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+        return hashlib.sha1(f"{version}|{canonical}".encode()).hexdigest()
+
+    def get_memory(self, key):
+        """Só o LRU em memória (sem I/O). Um miss não conta: quem chama segue para get()."""
+        now = time.time()
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] > now:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[3]
+            if entry:
+                del self.entries[key]
+        return None
+
+    def get(self, key):
+        """Memória e depois o SQLite (se houver)."""
+        result = self.get_memory(key)
+        if result is not None:
+            return result
+        if self.db:
+            with self._db_lock:
+                row = self.db.execute(
+                    "SELECT modelo, versao, resultado, expira FROM previsoes WHERE chave = ? AND expira > ?",
+                    (key, time.time())
+                ).fetchone()
+            if row:
+                result = json.loads(row[2])
+                with self._lock:
+                    self._remember(key, (row[3], row[0], row[1], result))
+                    self.hits += 1
+                return result
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, result, model, version):
+        expires = time.time() + self.ttl
+        with self._lock:
+            self._remember(key, (expires, model, version, result))
+        if self.db:
+            with self._db_lock:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO previsoes VALUES (?, ?, ?, ?, ?)",
+                    (key, model, version, json.dumps(result, ensure_ascii=False), expires)
+                )
+
+    def _remember(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, model, version):
+        """Apaga as entradas de `model` calculadas com outra versão que não `version`."""
+        with self._lock:
+            stale = [k for k, e in self.entries.items() if e[1] == model and e[2] != version]
+            for k in stale:
+                del self.entries[k]
+        if self.db:
+            with self._db_lock:
+                self.db.execute("DELETE FROM previsoes WHERE modelo = ? AND versao <> ?", (model, version))
+                self.db.execute("DELETE FROM previsoes WHERE expira <= ?", (time.time(),))
+        return len(stale)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'cache_entries': len(self.entries),
+            'cache_hits_total': self.hits,
+            'cache_misses_total': self.misses,
+            'cache_hit_rate': round(self.hits / total, 4) if total else 0,
+        }
+
+    def prometheus(self, prefix='mlengine'):
+        return ''.join(f"{prefix}_{key} {value}\n" for key, value in self.stats().items())
@@ -1,5 +1,5 @@
 import pandas as pd
-from sqlalchemy import create_engine, text
+from sqlalchemy import bindparam, create_engine, text
 import re
 from datetime import datetime
 import numpy as np
@@ -14,28 +14,57 @@ DB_HOST = os.getenv('PGHOST', 'localhost')
 DB_PORT = os.getenv('PGPORT', '5432')
 DB_NAME = os.getenv('PGDATABASE', 'imoveis')
 
-def get_data_from_db():
+# Colunas calculadas pelo Postgres no ingest (MLEngine/src/MLEngine/schema.py)
+DERIVED_COLUMNS = ['listing_type', 'area_relevante_m2', 'preco_m2_relevante']
+
+# Tipos de imóvel de cada regra da área relevante (passo 3)
+APARTMENT_TYPES = ('apartamento', 'duplex', 'estudio', 'flat')
+HOUSE_TYPES = ('moradia', 'vivenda', 'predio', 'quinta')
+LAND_TYPES = ('terreno', 'lote', 'terreno-rustico')
+
+
+def get_engine():
+    return create_engine(f'postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}')
+
+
+def sql_filters(alias, listing_types=None, freguesias=None):
+    """Filtros opcionais (" AND ...", params) sobre as colunas indexadas de imoveis."""
+    filtros, params = '', {}
+    if listing_types:
+        filtros += f" AND {alias}.listing_type IN :listing_types"
+        params['listing_types'] = list(listing_types)
+    if freguesias:
+        filtros += f" AND {alias}.freguesia IN :freguesias"
+        params['freguesias'] = list(freguesias)
+    return filtros, params
+
+
+def get_data_from_db(listing_types=None, freguesias=None):
     """
     Conecta ao PostgreSQL e carrega a tabela principal + dados da IA.
     Faz um LEFT JOIN para garantir que trazemos todos os imóveis.
+
+    listing_types / freguesias: filtros opcionais feitos em SQL (usam as colunas
+    derivadas e os índices criados por `python -m MLEngine.schema --backfill`).
     """
     try:
-        db_url = f'postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}'
-        engine = create_engine(db_url)
+        engine = get_engine()
         
         # QUERY COM JOIN
         # Trazemos o estado e a urgência da tabela satélite
-        sql_query = """
+        filtros, params = sql_filters('t1', listing_types, freguesias)
+        sql_query = text(f"""
             SELECT 
                 t1.*, 
                 t2.estado_conservacao as ai_estado, 
                 t2.venda_urgente as ai_urgente
             FROM imoveis t1
             LEFT JOIN imoveis_ai_data t2 ON t1.url_id = t2.imovel_id
-            WHERE t1.preco_atual > 0;
-        """
+            WHERE t1.preco_atual > 0 {filtros};
+        """).bindparams(*(bindparam(name, expanding=True) for name in params))
         
-        df = pd.read_sql(sql_query, engine)
+        with engine.connect() as conn:
+            df = pd.read_sql(sql_query, conn, params=params)
         
         # Pequeno log para controlo
         total = len(df)
@@ -49,19 +78,131 @@ def get_data_from_db():
         return pd.DataFrame()
 
 
-def feature_engineering(df):
-    """Aplica transformações inteligentes, normalizando áreas e usando a IA."""
-    if df.empty:
-        return df
+# =========================================================================
+# EXTRAÇÕES VETORIZADAS
+# =========================================================================
+LISTING_TYPE_RE = r'(?:venda|arrendamento)-([a-z]+)'
 
-    # --- 1. EXTRAÇÃO DO TIPO ---
-    def extract_listing_type_from_link(link):
-        if not isinstance(link, str): return 'outra'
-        match = re.search(r'venda-([a-z]+)|arrendamento-([a-z]+)', link)
-        if match: return (match.group(1) or match.group(2) or 'outra').strip()
-        return 'outra'
+# Palavras procuradas na descrição (em minúsculas) por flag. A mesma palavra
+# pode contar para mais de uma flag ('construção').
+TEXT_FLAGS = {
+    'ruina': ('ruína', 'ruina', 'recuperar', 'demolir', 'obras totais'),
+    'novo': ('novo', 'construção', 'estrear'),
+    'urbano': ('urbano', 'construção', 'loteamento'),
+    'rustico': ('rústico', 'rustico'),
+    'viabilidade': ('viabilidade', 'projecto', 'aprovado'),
+}
+FLAG_BITS = {flag: 1 << i for i, flag in enumerate(TEXT_FLAGS)}
+KEYWORD_BITS = {}
+for _flag, _words in TEXT_FLAGS.items():
+    for _word in _words:
+        KEYWORD_BITS[_word] = KEYWORD_BITS.get(_word, 0) | FLAG_BITS[_flag]
+# Palavra que contém outra também conta para as flags dessa outra
+for _word in KEYWORD_BITS:
+    for _inner in list(KEYWORD_BITS):
+        if _inner in _word:
+            KEYWORD_BITS[_word] |= KEYWORD_BITS[_inner]
+
+# Separador dos textos na passagem única (não aparece nas palavras nem no texto da BD)
+TEXT_SEPARATOR = '\x00'
+# Marca as linhas com palavras sobrepostas ("urbanovo" = urbano + novo)
+OVERLAP_BIT = 1 << len(TEXT_FLAGS)
+
+
+def overlap_joins(words):
+    """Junções de duas palavras que se sobrepõem ('urbano' + 'novo' -> 'urbanovo')."""
+    joins = set()
+    for a in words:
+        for b in words:
+            for k in range(1, len(a)):
+                tail = a[k:]
+                if len(tail) < len(b) and b.startswith(tail):
+                    joins.add(a + b[len(tail):])
+    return joins - set(words)
+
+
+def trie_regex(words):
+    """Alternação em árvore de prefixos ('r(?:u(?:ína|ina)|ecuperar)'): o motor de
+    regex testa a primeira letra uma só vez por posição em vez de palavra a palavra.
+    Em cada posição apanha a palavra mais comprida."""
+    tree = {}
+    for word in words:
+        node = tree
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node):
+        if list(node) == ['']:
+            return ''
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        return f'(?:{body})?' if '' in node else body
+
+    return build(tree)
+
+
+# Token -> bits: palavras, junções (com OVERLAP_BIT) e o separador
+TOKEN_BITS = {TEXT_SEPARATOR: 0, **KEYWORD_BITS}
+for _join in overlap_joins(KEYWORD_BITS):
+    TOKEN_BITS[_join] = OVERLAP_BIT
+TOKEN_SCANNER = re.compile(trie_regex(TOKEN_BITS))
+
+# Lookahead: apanha todas as palavras, mesmo sobrepostas, como os str.contains
+# separados faziam. Mais lento, só para as linhas marcadas com OVERLAP_BIT.
+FLAG_SCANNER = re.compile(f'(?=({trie_regex(KEYWORD_BITS)}))')
+
+
+def extract_listing_type(links):
+    """'.../venda-moradia-...' -> 'moradia' (sem correspondência ou sem link: 'outra')."""
+    return links.astype(object).str.extract(LISTING_TYPE_RE, expand=False).fillna('outra')
+
+
+def scan_text_flags(texts):
+    """Devolve um array com os bits de FLAG_BITS de cada texto.
+
+    Junta os textos com TEXT_SEPARATOR e faz uma só passagem (findall, sem objetos
+    Match): cada separador avança a linha, cada palavra acende os bits dela. Uma
+    palavra começada dentro de outra escapava a esta passagem, mas nesse caso a
+    junção das duas ganha (é mais comprida) e a linha é revista com o FLAG_SCANNER.
+    """
+    texts = list(texts)
+    joined = TEXT_SEPARATOR.join(texts)
+    if not texts or joined.count(TEXT_SEPARATOR) != len(texts) - 1:
+        # Texto com o separador lá dentro: linha a linha
+        return np.fromiter((scan_one(t) for t in texts), dtype=np.int64, count=len(texts))
+
+    flags = np.zeros(len(texts), dtype=np.int64)
+    # factorize: poucos tokens distintos, o mapa token -> bits é feito só nesses
+    codes, uniques = pd.factorize(np.array(TOKEN_SCANNER.findall(joined), dtype=object))
+    unique_bits = np.array([TOKEN_BITS[t] for t in uniques], dtype=np.int64)
+    is_separator = np.array([t == TEXT_SEPARATOR for t in uniques], dtype=bool)
+    rows = np.cumsum(is_separator[codes])
+    np.bitwise_or.at(flags, rows, unique_bits[codes])
 
-    df['listing_type'] = df['link'].apply(extract_listing_type_from_link)
+    for i in np.flatnonzero(flags & OVERLAP_BIT):
+        flags[i] = scan_one(texts[i])
+    return flags
+
+
+def scan_one(text):
+    found = 0
+    for match in FLAG_SCANNER.finditer(text):
+        found |= KEYWORD_BITS[match.group(1)]
+    return found
+
+
+def text_flag(bits, flag):
+    return ((bits & FLAG_BITS[flag]) != 0).astype(int)
+
+
+def derive_columns(df):
+    """Passos 1 a 4 em pandas, para dados que não vêm da BD (ex: input da API).
+
+    Espelha as colunas geradas da tabela imoveis: alterar um obriga a alterar o outro.
+    """
+    # --- 1. EXTRAÇÃO DO TIPO ---
+    df['listing_type'] = extract_listing_type(df['link'])
 
     # --- 2. NORMALIZAÇÃO DE COLUNAS DE ÁREA ---
     cols_areas = ['area_bruta_privativa_m2', 'area_bruta_m2', 'area_util_m2', 'area_terreno_m2', 'area_total_do_lote_m2']
@@ -76,7 +217,7 @@ def feature_engineering(df):
     df['area_relevante_m2'] = df['area_bruta_m2']
 
     # A. Apartamentos: Privativa > Útil > Bruta
-    mask_apt = df['listing_type'].isin(['apartamento', 'duplex', 'estudio', 'flat'])
+    mask_apt = df['listing_type'].isin(APARTMENT_TYPES)
     df.loc[mask_apt, 'area_relevante_m2'] = (
         df.loc[mask_apt, 'area_bruta_privativa_m2']
         .fillna(df.loc[mask_apt, 'area_util_m2'])
@@ -84,14 +225,14 @@ def feature_engineering(df):
     )
 
     # B. Moradias: Bruta Total > Privativa
-    mask_house = df['listing_type'].isin(['moradia', 'vivenda', 'predio', 'quinta'])
+    mask_house = df['listing_type'].isin(HOUSE_TYPES)
     df.loc[mask_house, 'area_relevante_m2'] = (
         df.loc[mask_house, 'area_bruta_m2']
         .fillna(df.loc[mask_house, 'area_bruta_privativa_m2'])
     )
 
     # C. Terrenos: Lote > Bruta
-    mask_land = df['listing_type'].isin(['terreno', 'lote', 'terreno-rustico'])
+    mask_land = df['listing_type'].isin(LAND_TYPES)
     df.loc[mask_land, 'area_relevante_m2'] = (
         df.loc[mask_land, 'area_lote_calc']
         .fillna(df.loc[mask_land, 'area_bruta_m2'])
@@ -100,16 +241,36 @@ def feature_engineering(df):
     # Correção final de Segurança
     df['area_relevante_m2'] = df['area_relevante_m2'].replace(0, np.nan)
     
-    # --- 4. PREÇO POR M2 ---
-    df['preco_m2_relevante'] = df['preco_atual'] / df['area_relevante_m2']
+    # --- 4. PREÇO POR M2 --- (o input da API não tem preço)
+    if 'preco_atual' in df.columns:
+        df['preco_m2_relevante'] = df['preco_atual'] / df['area_relevante_m2']
+    return df
+
+
+def feature_engineering(df):
+    """Aplica transformações inteligentes, normalizando áreas e usando a IA."""
+    if df.empty:
+        return df
+    return encode_features(build_base_features(df))
+
+
+def build_base_features(df):
+    """Passos 1 a 5: features que só dependem da própria linha (guardadas no feature store)."""
+    if df.empty:
+        return df
+
+    # Dados da BD: tipo, área e preço/m2 já vêm calculados (passos 1 a 4)
+    if not all(c in df.columns for c in DERIVED_COLUMNS):
+        derive_columns(df)
     
     # --- 5. ENGENHARIA DO RESTO (IA + Regex) ---
     if 'descricao_bruta' in df.columns:
         desc = df['descricao_bruta'].fillna('').str.lower()
+        flags = scan_text_flags(desc.tolist())
         
         # Fallback Regex
-        regex_ruina = desc.str.contains('ruína|ruina|recuperar|demolir|obras totais').astype(int)
-        regex_novo = desc.str.contains('novo|construção|estrear').astype(int)
+        regex_ruina = pd.Series(text_flag(flags, 'ruina'), index=df.index)
+        regex_novo = pd.Series(text_flag(flags, 'novo'), index=df.index)
         fallback_score = 3 - (regex_ruina * 2) + (regex_novo * 2)
 
         # IA - SCORE ESTADO
@@ -131,9 +292,9 @@ def feature_engineering(df):
             df['flag_urgente'] = 0
 
         # Outras flags
-        df['flag_urbano'] = desc.str.contains('urbano|construção|loteamento').astype(int)
-        df['flag_rustico'] = desc.str.contains('rústico|rustico').astype(int)
-        df['flag_viabilidade'] = desc.str.contains('viabilidade|projecto|aprovado').astype(int)
+        df['flag_urbano'] = text_flag(flags, 'urbano')
+        df['flag_rustico'] = text_flag(flags, 'rustico')
+        df['flag_viabilidade'] = text_flag(flags, 'viabilidade')
 
     else:
         # Defaults
@@ -141,18 +302,29 @@ def feature_engineering(df):
         for c in ['flag_urgente', 'flag_ruina', 'flag_novo', 'flag_urbano', 'flag_rustico']:
             df[c] = 0
 
-    # --- 6. ONE HOT ENCODING ---
-    listing_type_original = df['listing_type'].copy()
-    
     # Limpeza de texto
     df['freguesia_limpa'] = df['freguesia'].fillna('desconhecido').str.lower().str.strip()
     df['tipologia_limpa'] = df['tipologia'].fillna('outra').str.lower().str.strip()
 
     # Binários
     if 'elevador' in df.columns:
-        df['tem_elevador'] = df['elevador'].apply(lambda x: 1 if x == 'Sim' else 0)
+        df['tem_elevador'] = (df['elevador'].to_numpy(object) == 'Sim').astype(int)
     if 'estacionamento' in df.columns:
-        df['tem_estacionamento'] = df['estacionamento'].apply(lambda x: 1 if x not in ['Não', None] else 0)
+        # Só 'Não' e None contam como sem estacionamento (NaN conta como com)
+        valores = df['estacionamento'].to_numpy(object)
+        sem_lugar = (valores == 'Não') | np.equal(valores, None)
+        df['tem_estacionamento'] = (~sem_lugar).astype(int)
+
+    return df
+
+
+def encode_features(df):
+    """Passo 6: one-hot encoding (depende do conjunto inteiro, por isso não é guardado)."""
+    if df.empty:
+        return df
+
+    # --- 6. ONE HOT ENCODING ---
+    listing_type_original = df['listing_type'].copy()
 
     # Encoding
     df_encoded = pd.get_dummies(
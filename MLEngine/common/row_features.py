@@ -0,0 +1,134 @@
+import math
+import re
+
+import numpy as np
+
+from common.processing import (APARTMENT_TYPES, DERIVED_COLUMNS, FLAG_BITS, HOUSE_TYPES, LAND_TYPES,
+                               LISTING_TYPE_RE, scan_one)
+
+# =========================================================================
+# FEATURES DE UM SÓ IMÓVEL (SEM PANDAS)
+# =========================================================================
+# Para a API: um DataFrame de uma linha, as máscaras e o get_dummies custam
+# milissegundos por pedido e o modelo só precisa de microssegundos. Aqui os
+# passos 1 a 5 do processing são feitos num dict e o one-hot são lookups no
+# vocabulário do SparseEncoder.
+#
+# Espelha o build_base_features linha a linha: alterar um obriga a alterar o
+# outro (tests/test_row_features.py confirma a paridade).
+
+LISTING_TYPE = re.compile(LISTING_TYPE_RE)
+
+
+def missing(value):
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+def number(value):
+    """Número ou NaN (como o pd.to_numeric(errors='coerce'))."""
+    if missing(value):
+        return math.nan
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def first(*values):
+    """Primeiro valor que não é NaN (o encadeamento de fillna)."""
+    for value in values:
+        if not math.isnan(value):
+            return value
+    return math.nan
+
+
+def derive_row(row):
+    """Passos 1 a 4 (derive_columns) para um imóvel."""
+    link = row.get('link')
+    match = LISTING_TYPE.search(link) if isinstance(link, str) else None
+    listing_type = match.group(1) if match else 'outra'
+
+    bruta = number(row.get('area_bruta_m2'))
+    privativa = number(row.get('area_bruta_privativa_m2'))
+    util = number(row.get('area_util_m2'))
+    lote = first(number(row.get('area_total_do_lote_m2')), number(row.get('area_terreno_m2')))
+
+    if listing_type in APARTMENT_TYPES:
+        area = first(privativa, util, bruta)
+    elif listing_type in HOUSE_TYPES:
+        area = first(bruta, privativa)
+    elif listing_type in LAND_TYPES:
+        area = first(lote, bruta)
+    else:
+        area = bruta
+    if area == 0:
+        area = math.nan
+
+    derived = {'listing_type': listing_type, 'area_relevante_m2': area, 'area_lote_calc': lote}
+    if 'preco_atual' in row:
+        preco = number(row['preco_atual'])
+        derived['preco_m2_relevante'] = preco / area if area else math.nan
+    return derived
+
+
+def base_features_row(row):
+    """Passos 1 a 5 (build_base_features) para um imóvel: dict com as colunas novas."""
+    features = {} if all(c in row for c in DERIVED_COLUMNS) else derive_row(row)
+
+    if 'descricao_bruta' in row:
+        text = row['descricao_bruta']
+        bits = scan_one('' if missing(text) else text.lower())
+        fallback = 3 - 2 * bool(bits & FLAG_BITS['ruina']) + 2 * bool(bits & FLAG_BITS['novo'])
+
+        if 'ai_estado' in row:
+            estado = row['ai_estado']
+            score = min(max(int(fallback if missing(estado) else estado), 1), 5)
+        else:
+            score = fallback
+
+        features.update({
+            'score_estado': score,
+            'flag_ruina': int(score <= 2),
+            'flag_novo': int(score == 5),
+            'flag_urgente': int(row.get('ai_urgente') == True),
+            'flag_urbano': int(bool(bits & FLAG_BITS['urbano'])),
+            'flag_rustico': int(bool(bits & FLAG_BITS['rustico'])),
+            'flag_viabilidade': int(bool(bits & FLAG_BITS['viabilidade'])),
+        })
+    else:
+        features.update({'score_estado': 3, 'flag_urgente': 0, 'flag_ruina': 0, 'flag_novo': 0,
+                         'flag_urbano': 0, 'flag_rustico': 0})
+
+    freguesia, tipologia = row.get('freguesia'), row.get('tipologia')
+    features['freguesia_limpa'] = 'desconhecido' if missing(freguesia) else freguesia.lower().strip()
+    features['tipologia_limpa'] = 'outra' if missing(tipologia) else tipologia.lower().strip()
+
+    if 'elevador' in row:
+        features['tem_elevador'] = int(row['elevador'] == 'Sim')
+    if 'estacionamento' in row:
+        lugar = row['estacionamento']
+        features['tem_estacionamento'] = int(not (lugar is None or lugar == 'Não'))
+    return features
+
+
+class RowTransformer:
+    """Compilado uma vez a partir do SparseEncoder (as colunas guardadas do modelo):
+    transform(dict) -> vetor NumPy (1 x colunas) pronto para o model.predict."""
+
+    def __init__(self, encoder):
+        self.n_columns = len(encoder.columns)
+        self.numeric = list(encoder.numeric.items())
+        self.categories = list(encoder.categories.items())
+
+    def transform(self, row):
+        features = {**row, **base_features_row(row)}
+        vector = np.zeros((1, self.n_columns))
+        for name, pos in self.numeric:
+            value = number(features.get(name))
+            if not math.isnan(value):
+                vector[0, pos] = value
+        for col, positions in self.categories:
+            pos = positions.get(features.get(col))
+            if pos is not None:
+                vector[0, pos] = 1.0
+        return vector
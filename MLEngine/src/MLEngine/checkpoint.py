@@ -0,0 +1,63 @@
+import json
+import os
+import time
+
+# =========================================================================
+# CHECKPOINT DO CRAWL (RETOMA APÓS CRASH)
+# =========================================================================
+# O JOBDIR do Scrapy serializa os Requests inteiros (com PageMethods e outros
+# objetos do Playwright na meta). Aqui guarda-se só a fronteira, em JSON, e os
+# pedidos são reconstruídos pelo spider (make_listing_request/make_detail_request).
+
+
+class CrawlCheckpoint:
+    """Guarda a paginação por pesquisa e os detalhes pendentes num ficheiro JSON."""
+
+    def __init__(self, path, interval=30.0):
+        self.path = path
+        self.interval = interval
+        self._last_save = 0.0
+
+    def load(self):
+        """Devolve (pagination, pending_details) ou None se não houver checkpoint."""
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, encoding='utf-8') as f:
+            state = json.load(f)
+        pagination = {
+            key: {
+                'url': search['url'],
+                'total': search['total'],
+                'next_page': 1,  # As páginas feitas são saltadas; as que estavam em voo voltam à fila
+                'done': set(search['done']),
+            }
+            for key, search in state.get('pagination', {}).items()
+        }
+        return pagination, state.get('pending_details', {})
+
+    def save(self, pagination, pending_details):
+        state = {
+            'saved_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'pagination': {
+                key: {'url': s['url'], 'total': s['total'], 'done': sorted(s['done'])}
+                for key, s in pagination.items()
+            },
+            'pending_details': pending_details,
+        }
+        # Escrita atómica: um crash a meio nunca deixa um JSON cortado
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._last_save = time.time()
+
+    def maybe_save(self, pagination, pending_details):
+        """Grava no máximo uma vez por `interval` segundos."""
+        if time.time() - self._last_save >= self.interval:
+            self.save(pagination, pending_details)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
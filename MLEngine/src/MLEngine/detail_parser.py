@@ -0,0 +1,110 @@
+import re
+from datetime import datetime
+from MLEngine.items import ImovelItem
+
+# =========================================================================
+# EXTRAÇÃO DA PÁGINA DE DETALHE (UMA SÓ PASSAGEM PELO DOCUMENTO)
+# =========================================================================
+# Regexes compiladas uma vez no import (antes eram recompiladas por chamada)
+NON_DIGIT_RE = re.compile(r'[^\d]')
+URL_ID_RE = re.compile(r'/(\d+-\d+)$')
+TIPOLOGIA_RE = re.compile(r'([A-Za-z]+)\s+(T\d+)')
+TIPO_VENDA_RE = re.compile(r'Venda-\s*([A-Za-z]+)')
+
+
+def clean_int(text):
+    """'1.200 m²' -> 1200 (0 se vazio)."""
+    if not text: return 0
+    clean = NON_DIGIT_RE.sub('', text)
+    return int(clean) if clean else 0
+
+
+def extract_url_id(url):
+    id_match = URL_ID_RE.search(url)
+    return id_match.group(1) if id_match else None
+
+
+def _first_text(element):
+    """Primeiro nó de texto direto do elemento (o que o XPath text() devolve primeiro)."""
+    if element.text is not None:
+        return element.text
+    for child in element:
+        if child.tail is not None:
+            return child.tail
+    return None
+
+
+class DetailFields(dict):
+    """Pares etiqueta -> valor dos <span> da ficha técnica, pela ordem do documento."""
+
+    @classmethod
+    def from_response(cls, response):
+        fields = cls()
+        # Um único XPath (em C) devolve só os <span> que têm um <span> irmão a seguir
+        for span in response.selector.root.xpath('//span[following-sibling::span]'):
+            label = _first_text(span)
+            if label is None or label in fields:
+                continue
+            for sibling in span.itersiblings('span'):
+                value = _first_text(sibling)
+                if value is not None:
+                    fields[label] = value
+                    break
+        return fields
+
+    def find(self, label):
+        """Equivale a //span[contains(text(), label)]/following-sibling::span/text()."""
+        for text, value in self.items():
+            if label in text:
+                return value
+        return None
+
+
+def parse_detail(response, area, price, freguesia, link_completo, page_number):
+    """Constrói o ImovelItem de uma página de detalhe."""
+    item = ImovelItem()
+    item['preco_atual'] = price
+    item['area_bruta_m2'] = area
+    item['freguesia'] = freguesia
+    item['link'] = link_completo
+
+    get_detail = DetailFields.from_response(response).find
+
+    # EXTRAÇÃO DA DESCRIÇÃO COMPLETA (CRÍTICO PARA O FILTRO TIMESHARE)
+    desc_list = response.css('#description .custom-description *::text').getall()
+    item['descricao_bruta'] = " ".join(desc_list).strip()
+
+    # Áreas Detalhadas e Priorização
+    area_priv = get_detail("Área Bruta Privativa")
+    area_bruta = get_detail("Área Bruta")
+    item['area_terreno_m2'] = clean_int(get_detail("Área Total do Lote"))
+    item['area_util_m2'] = clean_int(get_detail("Área Útil"))
+
+    if area_priv: item['area_bruta_m2'] = clean_int(area_priv)
+    elif area_bruta: item['area_bruta_m2'] = clean_int(area_bruta)
+
+    # Detalhes Técnicos
+    item['ano_construcao'] = clean_int(get_detail("Ano de Construção"))
+    item['num_quartos'] = clean_int(get_detail("Quartos"))
+    item['num_wc'] = clean_int(get_detail("WC") or get_detail("Casas de banho"))
+    item['estacionamento'] = get_detail("Estacionamento")
+    item['elevador'] = get_detail("Elevador")
+
+    # Tipologia e Certificado Energético
+    page_title = response.css('title::text').get()
+    item['tipologia'] = 'Desconhecida'
+    if page_title:
+        m = TIPOLOGIA_RE.search(page_title)
+        if m: item['tipologia'] = f"{m.group(1)} {m.group(2)}".strip()
+        else:
+            tm = TIPO_VENDA_RE.search(page_title)
+            if tm: item['tipologia'] = tm.group(1).strip()
+
+    item['certificado_energetico'] = response.xpath("//*[contains(text(), 'Eficiência energética')]/following-sibling::span//img/@alt").get()
+
+    # DADOS DE CONTROLO
+    item['url_id'] = extract_url_id(response.url) or response.url
+    item['data_publicacao'] = str(datetime.now().date())
+    item['last_crawled'] = str(datetime.now())
+    item['listing_page_number'] = page_number # ADICIONADO PARA O LOG
+    return item
@@ -0,0 +1,225 @@
+import json
+import logging
+import re
+import time
+from bisect import bisect_left
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from twisted.internet import reactor, task
+from twisted.web.resource import Resource
+from twisted.web.server import Site
+
+logger = logging.getLogger(__name__)
+
+# Sinal próprio: quem mede uma etapa (parse, pipeline) envia
+#   crawler.signals.send_catch_log(signal=stage_timed, stage='pipeline', seconds=dt)
+stage_timed = object()
+
+# Limites (segundos) dos histogramas: do parse (ms) ao render lento (dezenas de s)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+STAT_NAME_RE = re.compile(r'[^a-zA-Z0-9_]')
+
+# Texto do # HELP de cada família no /metrics
+STAGE_HELP = {
+    'download': 'Latência de download por resposta (segundos), por renderer.',
+    'parse': 'Tempo dentro dos callbacks do spider (segundos).',
+    'pipeline': 'Tempo de escrita na BD (segundos).',
+}
+RATE_HELP = {
+    'elapsed_seconds': 'Segundos desde a abertura do spider.',
+    'pages_per_minute': 'Respostas recebidas por minuto.',
+    'items_per_minute': 'Items recolhidos por minuto.',
+    'ttl_skip_ratio': 'Fração dos detalhes saltados pelo TTL.',
+    'unchanged_ratio': 'Fração dos detalhes re-crawlados que vieram iguais.',
+}
+
+
+class Histogram:
+    """Histograma de buckets fixos, no formato cumulativo do Prometheus."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Último = +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """Estimativa pelo limite superior do bucket (None se vazio)."""
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets + (float('inf'),), self.counts):
+            seen += n
+            if seen >= target:
+                return bound
+        return float('inf')
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean': round(self.sum / self.count, 4) if self.count else None,
+            'p50': self.quantile(0.5), 'p90': self.quantile(0.9), 'p99': self.quantile(0.99),
+        }
+
+
+class MetricsResource(Resource):
+    isLeaf = True
+
+    def __init__(self, metrics):
+        super().__init__()
+        self.metrics = metrics
+
+    def render_GET(self, request):
+        request.setHeader(b'Content-Type', b'text/plain; version=0.0.4; charset=utf-8')
+        return self.metrics.prometheus().encode('utf-8')
+
+
+# =========================================================================
+# MÉTRICAS DO CRAWL (HISTOGRAMAS + SNAPSHOTS + ENDPOINT PROMETHEUS)
+# =========================================================================
+class CrawlMetrics:
+    """Tempos por etapa para ver se o crawl está preso no browser, na BD ou no site.
+
+    - download: download_latency de cada resposta (renderer="playwright" ou "http")
+    - parse: tempo dentro dos callbacks do spider (StageTimingMiddleware)
+    - pipeline: tempo de escrita na BD (enviado pelo pipeline)
+    - contadores: todos os stats numéricos do Scrapy (retries, errbacks, TTL, pool...)
+
+    A cada METRICS_INTERVAL segundos acrescenta uma linha a METRICS_SNAPSHOT_FILE
+    (JSON lines, para gráficos de páginas/minuto) e, com METRICS_PORT, serve
+    /metrics em texto Prometheus.
+    """
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        if not settings.getbool('METRICS_ENABLED'):
+            raise NotConfigured
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.interval = settings.getfloat('METRICS_INTERVAL', 60.0)
+        self.snapshot_file = settings.get('METRICS_SNAPSHOT_FILE')
+        self.port = settings.getint('METRICS_PORT', 0)
+        self.host = settings.get('METRICS_HOST', '127.0.0.1')
+        self.histograms = {}  # (etapa, label) -> Histogram
+        self.start_time = None
+        self.loop = None
+        self.listener = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        ext = cls(crawler)
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(ext.response_received, signal=signals.response_received)
+        crawler.signals.connect(ext.stage_timed, signal=stage_timed)
+        return ext
+
+    def spider_opened(self, spider):
+        self.start_time = time.time()
+        self.loop = task.LoopingCall(self.write_snapshot)
+        self.loop.start(self.interval, now=False)
+        if self.port:
+            self.listener = reactor.listenTCP(self.port, Site(MetricsResource(self)), interface=self.host)
+            logger.info(f"📈 MÉTRICAS: http://{self.host}:{self.port}/metrics")
+
+    def spider_closed(self, spider, reason):
+        if self.loop and self.loop.running:
+            self.loop.stop()
+        self.write_snapshot()
+        for (stage, label), hist in sorted(self.histograms.items()):
+            s = hist.summary()
+            logger.info(f"📈 {stage}[{label}]: n={s['count']} média={s['mean']}s p50≤{s['p50']}s p90≤{s['p90']}s")
+        if self.listener is not None:
+            return self.listener.stopListening()
+
+    def observe(self, stage, label, seconds):
+        hist = self.histograms.get((stage, label))
+        if hist is None:
+            hist = self.histograms[(stage, label)] = Histogram()
+        hist.observe(seconds)
+
+    def response_received(self, response, request, spider):
+        latency = request.meta.get('download_latency')
+        if latency is not None:
+            self.observe('download', 'playwright' if request.meta.get('playwright') else 'http', latency)
+
+    def stage_timed(self, stage, seconds, label=''):
+        self.observe(stage, label, seconds)
+
+    # ------------------------------
+    # SAÍDAS
+    # ------------------------------
+    def rates(self):
+        elapsed = max(time.time() - (self.start_time or time.time()), 1e-9)
+        pages = self.stats.get_value('response_received_count', 0)
+        items = self.stats.get_value('item_scraped_count', 0)
+        skipped = self.stats.get_value('ttl/skipped', 0)
+        scheduled = self.stats.get_value('ttl/scheduled', 0)
+        unchanged = self.stats.get_value('pipeline/unchanged', 0)
+        rewritten = self.stats.get_value('pipeline/changed', 0) + unchanged
+        return {
+            'elapsed_seconds': round(elapsed, 1),
+            'pages_per_minute': round(pages * 60 / elapsed, 2),
+            'items_per_minute': round(items * 60 / elapsed, 2),
+            'ttl_skip_ratio': round(skipped / (skipped + scheduled), 4) if skipped + scheduled else None,
+            # Detalhes re-crawlados que vieram iguais (alto = TTL_DAYS curto demais)
+            'unchanged_ratio': round(unchanged / rewritten, 4) if rewritten else None,
+        }
+
+    def numeric_stats(self):
+        return {
+            key: value for key, value in self.stats.get_stats().items()
+            if isinstance(value, (int, float)) and not isinstance(value, bool)
+        }
+
+    def write_snapshot(self):
+        if not self.snapshot_file:
+            return
+        snapshot = {
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            **self.rates(),
+            'histograms': {f"{stage}[{label}]": hist.summary() for (stage, label), hist in self.histograms.items()},
+            'stats': self.numeric_stats(),
+        }
+        try:
+            with open(self.snapshot_file, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(snapshot, ensure_ascii=False) + '\n')
+        except OSError as e:
+            logger.warning(f"⚠️ Erro ao escrever snapshot de métricas: {e}")
+
+    def prometheus(self):
+        # Cada família leva # HELP e # TYPE antes das amostras (senão o Prometheus trata-a como untyped)
+        lines = []
+        family = None
+        for (stage, label), hist in sorted(self.histograms.items()):
+            name = f"remax_{stage}_seconds"
+            if name != family:
+                family = name
+                lines.append(f'# HELP {name} {STAGE_HELP.get(stage, f"Tempo da etapa {stage} (segundos).")}')
+                lines.append(f'# TYPE {name} histogram')
+            labels = f'label="{label}"'
+            cumulative = 0
+            for bound, n in zip(hist.buckets + ('+Inf',), hist.counts):
+                cumulative += n
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_sum{{{labels}}} {hist.sum}')
+            lines.append(f'{name}_count{{{labels}}} {hist.count}')
+        for key, value in self.rates().items():
+            if value is not None:
+                lines.append(f'# HELP remax_{key} {RATE_HELP[key]}')
+                lines.append(f'# TYPE remax_{key} gauge')
+                lines.append(f'remax_{key} {value}')
+        stats = sorted(self.numeric_stats().items())
+        if stats:
+            lines.append('# HELP scrapy_stat Stats numéricos do Scrapy (crawler.stats), um por name.')
+            lines.append('# TYPE scrapy_stat gauge')
+        for key, value in stats:
+            lines.append(f'scrapy_stat{{name="{STAT_NAME_RE.sub("_", key)}"}} {value}')
+        return '\n'.join(lines) + '\n'
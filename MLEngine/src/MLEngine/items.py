@@ -28,4 +28,10 @@ class ImovelItem(scrapy.Item):
     certificado_energetico = scrapy.Field()
     # Nova Coluna para Filtro de Qualidade
     descricao_bruta = scrapy.Field() # <-- Campo para o texto longo do anúncio
-    
\ No newline at end of file
+
+
+class PriceBatchItem(scrapy.Item):
+    # Modo price_sweep: preços lidos dos cartões de UMA página de listagem
+    rows = scrapy.Field()           # [(url_id, preco_atual), ...] só de imóveis já na BD
+    seen_at = scrapy.Field()
+    listing_page_number = scrapy.Field()
@@ -0,0 +1,326 @@
+import logging
+import math
+import time
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from MLEngine.extensions import stage_timed
+
+logger = logging.getLogger(__name__)
+
+
+def is_timeout(exception):
+    """Timeouts do Twisted, do asyncio e do Playwright (sem importar o Playwright)."""
+    return isinstance(exception, TimeoutError) or 'Timeout' in type(exception).__name__ or 'TimedOut' in type(exception).__name__
+
+
+# =========================================================================
+# CONTROLO ADAPTATIVO DE CONCORRÊNCIA (AIMD POR SLOT)
+# =========================================================================
+
+# Segundos que o estado de um slot apagado pelo downloader (parado) é guardado
+SLOT_STATE_TTL = 600
+
+
+class AdaptiveConcurrencyMiddleware:
+    """Sobe a concorrência devagar enquanto o site responde bem e corta-a a meio quando reclama.
+
+    Sinais de congestão: códigos 403/429, timeouts e latência (render) acima do alvo.
+    Cada "ronda" de respostas boas (tantas quanto a concorrência atual) baixa o delay
+    um passo; com o delay no mínimo, sobe a concorrência em 1 (aumento aditivo).
+    Um sinal mau multiplica a concorrência pelo fator e duplica o delay (decréscimo multiplicativo).
+    """
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        if not settings.getbool('ADAPTIVE_CONCURRENCY_ENABLED'):
+            raise NotConfigured
+        self.crawler = crawler
+        self.min_concurrency = settings.getint('ADAPTIVE_MIN_CONCURRENCY', 1)
+        self.max_concurrency = settings.getint('ADAPTIVE_MAX_CONCURRENCY', 8)
+        self.start_concurrency = settings.getint('ADAPTIVE_START_CONCURRENCY', settings.getint('CONCURRENT_REQUESTS'))
+        self.min_delay = settings.getfloat('ADAPTIVE_MIN_DELAY', 0.5)
+        self.max_delay = settings.getfloat('ADAPTIVE_MAX_DELAY', 30.0)
+        self.delay_step = settings.getfloat('ADAPTIVE_DELAY_STEP', 0.25)
+        self.target_latency = settings.getfloat('ADAPTIVE_TARGET_LATENCY', 20.0)
+        self.decrease_factor = settings.getfloat('ADAPTIVE_DECREASE_FACTOR', 0.5)
+        self.cooldown = settings.getfloat('ADAPTIVE_DECREASE_COOLDOWN', 10.0)
+        self.backoff_codes = {int(c) for c in settings.getlist('ADAPTIVE_BACKOFF_CODES', [403, 429])}
+        self.slots = {}  # Estado do controlador por chave de slot do downloader
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        middleware = cls(crawler)
+        crawler.signals.connect(middleware.spider_opened, signal=signals.spider_opened)
+        return middleware
+
+    def spider_opened(self, spider):
+        # O teto global (CONCURRENT_REQUESTS) não pode travar o controlador
+        downloader = self.crawler.engine.downloader
+        downloader.total_concurrency = max(downloader.total_concurrency, self.max_concurrency)
+        logger.info(
+            f"🎚️ ADAPTATIVO: concorrência {self.min_concurrency}-{self.max_concurrency}, "
+            f"delay {self.min_delay}-{self.max_delay}s, latência alvo {self.target_latency}s"
+        )
+
+    def _get_slot(self, request):
+        downloader = self.crawler.engine.downloader
+        key = request.meta.get('download_slot') or downloader.get_slot_key(request)
+        slot = downloader.slots.get(key)
+        if slot is None:
+            return key, None, None
+        state = self.slots.get(key)
+        if state is None:
+            # Primeira resposta deste slot: parte dos valores iniciais configurados
+            self._forget_idle_slots(downloader)
+            slot.concurrency = min(max(self.start_concurrency, self.min_concurrency), self.max_concurrency)
+            slot.delay = min(max(slot.delay, self.min_delay), self.max_delay)
+            state = self.slots[key] = {'successes': 0, 'last_decrease': 0.0}
+            self._save(slot, state)
+        elif state['slot'] is not slot:
+            # O Scrapy apagou o slot parado e criou outro: volta ao ponto onde o controlador estava
+            slot.concurrency = state['concurrency']
+            slot.delay = state['delay']
+        state['slot'] = slot
+        state['seen'] = time.time()
+        return key, slot, state
+
+    def _forget_idle_slots(self, downloader):
+        """Esquece o estado dos slots que o downloader já apagou há mais de SLOT_STATE_TTL."""
+        cutoff = time.time() - SLOT_STATE_TTL
+        for key in [k for k, s in self.slots.items() if k not in downloader.slots and s['seen'] < cutoff]:
+            del self.slots[key]
+
+    @staticmethod
+    def _save(slot, state):
+        state['concurrency'] = slot.concurrency
+        state['delay'] = slot.delay
+
+    def process_response(self, request, response, spider):
+        key, slot, state = self._get_slot(request)
+        if slot is None:
+            return response
+        latency = request.meta.get('download_latency')
+        if response.status in self.backoff_codes:
+            self._decrease(key, slot, state, f"http_{response.status}", f"HTTP {response.status}")
+        elif latency is not None and latency > self.target_latency:
+            self._decrease(key, slot, state, "latency", f"latência {latency:.1f}s")
+        else:
+            self._increase(key, slot, state)
+        return response
+
+    def process_exception(self, request, exception, spider):
+        if is_timeout(exception):
+            key, slot, state = self._get_slot(request)
+            if slot is not None:
+                self._decrease(key, slot, state, "timeout", f"timeout ({type(exception).__name__})")
+        return None
+
+    def _increase(self, key, slot, state):
+        state['successes'] += 1
+        if state['successes'] < slot.concurrency:
+            return
+        state['successes'] = 0
+        if slot.delay > self.min_delay:
+            slot.delay = max(self.min_delay, slot.delay - self.delay_step)
+            self.crawler.stats.inc_value('adaptive/increase')
+            self.crawler.stats.inc_value('adaptive/increase/delay')
+            logger.info(f"🎚️ ADAPTATIVO [{key}]: ⬆️ delay -> {slot.delay:.2f}s (conc. {slot.concurrency})")
+        elif slot.concurrency < self.max_concurrency:
+            slot.concurrency += 1
+            self.crawler.stats.inc_value('adaptive/increase')
+            self.crawler.stats.inc_value('adaptive/increase/concurrency')
+            logger.info(f"🎚️ ADAPTATIVO [{key}]: ⬆️ concorrência -> {slot.concurrency} (delay {slot.delay:.2f}s)")
+        self._save(slot, state)
+
+    def _decrease(self, key, slot, state, cause, reason):
+        state['successes'] = 0
+        now = time.time()
+        # As respostas que já estavam em voo trazem o mesmo sinal: um corte por período
+        if now - state['last_decrease'] < self.cooldown:
+            return
+        state['last_decrease'] = now
+        slot.concurrency = max(self.min_concurrency, math.floor(slot.concurrency * self.decrease_factor))
+        slot.delay = min(self.max_delay, max(slot.delay * 2, self.delay_step))
+        self._save(slot, state)
+        self.crawler.stats.inc_value('adaptive/decrease')
+        self.crawler.stats.inc_value(f'adaptive/decrease/{cause}')
+        logger.warning(f"🎚️ ADAPTATIVO [{key}]: ⬇️ {reason} -> concorrência {slot.concurrency}, delay {slot.delay:.2f}s")
+
+
+# =========================================================================
+# POOL DE CONTEXTOS DO PLAYWRIGHT (REUTILIZAÇÃO + RECICLAGEM)
+# =========================================================================
+class ContextPoolMiddleware:
+    """Distribui os pedidos Playwright por N contextos nomeados e reutiliza as páginas.
+
+    O scrapy-playwright cria uma página nova por pedido (e fecha-a no fim) e cria o
+    contexto "default" com os kwargs do primeiro pedido que lá chegar. Aqui cada
+    pedido vai para o contexto do pool com menos pedidos em voo, recebe uma página
+    já aberta desse contexto (meta "playwright_page") e devolve-a no fim.
+
+    Ao fim de PLAYWRIGHT_POOL_MAX_PAGES navegações, ou se o heap JS de uma página
+    passar PLAYWRIGHT_POOL_MAX_HEAP_MB, o contexto é reformado: os pedidos novos vão
+    para uma nova geração ("pool-0-g1") e o antigo fecha quando ficar sem pedidos.
+    """
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        if not settings.getbool('PLAYWRIGHT_POOL_ENABLED'):
+            raise NotConfigured
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.size = settings.getint('PLAYWRIGHT_POOL_SIZE', 2)
+        self.max_pages = settings.getint('PLAYWRIGHT_POOL_MAX_PAGES', 200)
+        self.max_heap = settings.getint('PLAYWRIGHT_POOL_MAX_HEAP_MB', 512) * 1024 * 1024
+        self.context_kwargs = settings.getdict('PLAYWRIGHT_CONTEXT_KWARGS')
+        self.generations = [0] * self.size
+        self.active = [self._name(i, 0) for i in range(self.size)]
+        self.in_flight = {}     # contexto -> pedidos em voo
+        self.served = {}        # contexto -> navegações feitas
+        self.idle_pages = {}    # contexto -> páginas abertas à espera de pedido
+        self.contexts = {}      # contexto -> BrowserContext (para o fechar)
+        self.retiring = set()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        middleware = cls(crawler)
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
+
+    @staticmethod
+    def _name(slot, generation):
+        return f"pool-{slot}-g{generation}"
+
+    def process_request(self, request, spider):
+        if not request.meta.get('playwright'):
+            return None
+        name = min(self.active, key=lambda n: self.in_flight.get(n, 0))
+        request.meta['playwright_context'] = name
+        request.meta['playwright_context_kwargs'] = self.context_kwargs
+        request.meta['playwright_include_page'] = True
+        request.meta['pool_context'] = name
+        idle = self.idle_pages.get(name)
+        if idle:
+            request.meta['playwright_page'] = idle.pop()
+            self.stats.inc_value('pool/pages/reused')
+        else:
+            request.meta.pop('playwright_page', None)  # Cópia de um retry: a página antiga já foi devolvida
+            self.stats.inc_value('pool/pages/created')
+        self.in_flight[name] = self.in_flight.get(name, 0) + 1
+        self.served[name] = self.served.get(name, 0) + 1
+        if self.served[name] >= self.max_pages:
+            self._retire(name, 'pages')
+        return None
+
+    async def process_response(self, request, response, spider):
+        page = request.meta.pop('playwright_page', None)
+        name = request.meta.get('pool_context')
+        if name is not None:
+            await self._release(name, page, broken=False)
+        return response
+
+    async def process_exception(self, request, exception, spider):
+        page = request.meta.pop('playwright_page', None)
+        name = request.meta.get('pool_context')
+        if name is not None:
+            await self._release(name, page, broken=True)  # A página pode ter ficado a meio de uma navegação
+        return None
+
+    async def _release(self, name, page, broken):
+        self.in_flight[name] = max(0, self.in_flight.get(name, 0) - 1)
+        if page is not None and not page.is_closed():
+            self.contexts.setdefault(name, page.context)
+            if name not in self.retiring and not broken and await self._heap_too_big(page):
+                self._retire(name, 'memory')
+            if broken or name in self.retiring:
+                await page.close()
+            else:
+                self.idle_pages.setdefault(name, []).append(page)
+        if name in self.retiring and self.in_flight[name] == 0:
+            await self._close_context(name)
+
+    async def _heap_too_big(self, page):
+        """Heap JS da página (performance.memory só existe no Chromium)."""
+        try:
+            used = await page.evaluate("() => performance.memory ? performance.memory.usedJSHeapSize : 0")
+        except Exception:
+            return False
+        return used > self.max_heap
+
+    def _retire(self, name, cause):
+        slot = self.active.index(name)
+        self.generations[slot] += 1
+        self.active[slot] = self._name(slot, self.generations[slot])
+        self.retiring.add(name)
+        self.stats.inc_value('pool/contexts/recycled')
+        self.stats.inc_value(f'pool/contexts/recycled/{cause}')
+        logger.info(f"♻️ POOL: contexto {name} reformado ({cause}, {self.served.get(name, 0)} páginas) -> {self.active[slot]}")
+
+    async def _close_context(self, name):
+        self.retiring.discard(name)
+        for page in self.idle_pages.pop(name, []):
+            if not page.is_closed():
+                await page.close()
+        context = self.contexts.pop(name, None)
+        if context is not None:
+            await context.close()  # O scrapy-playwright tira-o da lista no evento "close"
+        self.in_flight.pop(name, None)
+        self.served.pop(name, None)
+
+    def spider_closed(self, spider):
+        served = sum(self.served.values())
+        self.stats.set_value('pool/contexts/active', len(self.active))
+        logger.info(
+            f"♻️ POOL: {self.size} contextos, {self.stats.get_value('pool/pages/reused', 0)} páginas reutilizadas, "
+            f"{self.stats.get_value('pool/pages/created', 0)} criadas, "
+            f"{self.stats.get_value('pool/contexts/recycled', 0)} reciclagens ({served} navegações nos contextos atuais)"
+        )
+
+
+# =========================================================================
+# TEMPO DE PARSE (SPIDER MIDDLEWARE)
+# =========================================================================
+class StageTimingMiddleware:
+    """Mede o tempo passado dentro dos callbacks (só o tempo de next(), não o do resto do motor)."""
+
+    def __init__(self, crawler):
+        self.signals = crawler.signals
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def _callback_name(self, response):
+        callback = response.request.meta.get('task_callback') or getattr(response.request.callback, '__name__', None)
+        return callback or 'parse'
+
+    def _send(self, response, elapsed):
+        self.signals.send_catch_log(signal=stage_timed, stage='parse', seconds=elapsed, label=self._callback_name(response))
+
+    def process_spider_output(self, response, result, spider):
+        elapsed = 0.0
+        iterator = iter(result)
+        while True:
+            t0 = time.perf_counter()
+            try:
+                output = next(iterator)
+            except StopIteration:
+                elapsed += time.perf_counter() - t0
+                break
+            elapsed += time.perf_counter() - t0
+            yield output
+        self._send(response, elapsed)
+
+    async def process_spider_output_async(self, response, result, spider):
+        elapsed = 0.0
+        iterator = result.__aiter__()
+        while True:
+            t0 = time.perf_counter()
+            try:
+                output = await iterator.__anext__()
+            except StopAsyncIteration:
+                elapsed += time.perf_counter() - t0
+                break
+            elapsed += time.perf_counter() - t0
+            yield output
+        self._send(response, elapsed)
@@ -1,9 +1,106 @@
+import logging
+import time
+from collections import Counter
+
 import psycopg2
-from scrapy.utils.project import get_project_settings
+from psycopg2.extras import execute_values
+from scrapy import signals
+from twisted.internet import defer, reactor, task, threads
+from twisted.python.threadpool import ThreadPool
+from MLEngine.extensions import stage_timed
+from MLEngine import schema
+from MLEngine.items import PriceBatchItem
+from MLEngine.spool import Spool
+
+logger = logging.getLogger(__name__)
+
+# Ordem das colunas no INSERT (e dos valores de item_row)
+COLUMNS = (
+    'url_id', 'link', 'last_crawled', 'data_publicacao',
+    'preco_atual', 'freguesia', 'tipologia',
+    'area_bruta_m2', 'area_util_m2', 'area_terreno_m2',
+    'ano_construcao', 'num_quartos', 'num_wc',
+    'estacionamento', 'elevador', 'certificado_energetico',
+    'descricao_bruta',
+)
+
+# Colunas de conteúdo: só uma diferença aqui justifica reescrever a linha
+CONTENT_COLUMNS = tuple(col for col in COLUMNS if col not in ('url_id', 'last_crawled', 'data_publicacao'))
+LAST_CRAWLED = COLUMNS.index('last_crawled')
+
+# UPSERT em lote: todas as colunas são atualizadas, exceto data_publicacao,
+# que guarda o dia em que o imóvel apareceu pela primeira vez.
+# Imóvel re-crawlado sem alterações: o WHERE do DO UPDATE deixa a linha como
+# está (sem tuplo morto nem reescrita da descricao_bruta) e não vem no RETURNING.
+# xmax = 0 distingue as linhas novas das atualizadas.
+UPSERT_QUERY = f"""
+    INSERT INTO imoveis ({', '.join(COLUMNS)})
+    VALUES %s
+    ON CONFLICT (url_id) DO UPDATE SET
+        data_publicacao = COALESCE(imoveis.data_publicacao, EXCLUDED.data_publicacao),
+        {', '.join(f'{col} = EXCLUDED.{col}' for col in COLUMNS if col not in ('url_id', 'data_publicacao'))}
+    WHERE ({', '.join(f'imoveis.{col}' for col in CONTENT_COLUMNS)})
+          IS DISTINCT FROM ({', '.join(f'EXCLUDED.{col}' for col in CONTENT_COLUMNS)})
+       OR imoveis.data_publicacao IS NULL
+    RETURNING url_id, (xmax = 0) AS inserted
+"""
+
+# Sem alterações: só last_crawled avança (é ele que decide o TTL do spider)
+TOUCH_QUERY = """
+    UPDATE imoveis AS i
+    SET last_crawled = v.last_crawled
+    FROM (VALUES %s) AS v(url_id, last_crawled)
+    WHERE i.url_id = v.url_id
+"""
+
+
+def item_row(item):
+    return tuple(item.get(col) for col in COLUMNS)
+
+
+# Modo price_sweep: um único UPDATE por página de listagem.
+# last_crawled fica reservado à visita ao detalhe (é ele que decide o TTL);
+# last_seen regista a última vez que o cartão foi visto na listagem.
+PRICE_SWEEP_QUERY = """
+    UPDATE imoveis AS i
+    SET preco_atual = v.preco_atual, last_seen = v.last_seen
+    FROM (VALUES %s) AS v(url_id, preco_atual, last_seen)
+    WHERE i.url_id = v.url_id
+"""
+
+# BD em baixo / ligação perdida (ao contrário de um erro numa linha concreta)
+DB_DOWN_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
 
 class PostgresPipeline:
-    def __init__(self):
-        settings = get_project_settings()
+    """Acumula os imóveis e grava-os em lotes (execute_values + um commit por lote).
+
+    O lote é gravado a cada PIPELINE_BATCH_SIZE imóveis, a cada PIPELINE_FLUSH_INTERVAL
+    segundos e no fecho do spider. Se o lote falhar, é dividido ao meio até isolar
+    a(s) linha(s) com erro, para não perder as restantes.
+    """
+
+    connect_on_init = True
+
+    def __init__(self, settings):
+        self.settings = settings  # crawler.settings (com os `-s`), passados pelo from_crawler
+        self.batch_size = settings.getint('PIPELINE_BATCH_SIZE', 200)
+        self.flush_interval = settings.getfloat('PIPELINE_FLUSH_INTERVAL', 5.0)
+        self.buffer = {}  # url_id -> item (o mesmo imóvel duas vezes no lote: fica o último)
+        self.flush_loop = None
+        self.last_flush = time.time()
+        self.spider = None
+        self.success_count = 0
+        self.fail_count = 0
+        self.changes = Counter()  # inserted / changed / unchanged
+        self.connection = None
+        self.cursor = None
+        if self.connect_on_init:
+            self.connect()
+
+    def connect(self):
+        """Abre a ligação e garante a tabela."""
+        settings = self.settings
         self.connection = psycopg2.connect(
             host=settings.get('PGHOST'),
             user=settings.get('PGUSER'),
@@ -12,11 +109,13 @@ class PostgresPipeline:
             port=settings.get('PGPORT')
         )
         self.cursor = self.connection.cursor()
-        self.success_count = 0
-        self.fail_count = 0
+        schema.lock(self.cursor)
+        schema.create_functions(self.cursor)
+        self.cursor.execute("SELECT to_regclass('imoveis') IS NULL")
+        new_table = self.cursor.fetchone()[0]
 
-        # 1. CRIAR TABELA (Inclui descricao_bruta)
-        self.cursor.execute("""
+        # 1. CRIAR TABELA (Inclui descricao_bruta e as colunas derivadas de MLEngine.schema)
+        self.cursor.execute(f"""
             CREATE TABLE IF NOT EXISTS imoveis (
                 url_id VARCHAR PRIMARY KEY,
                 link TEXT,
@@ -37,53 +136,513 @@ class PostgresPipeline:
                 estacionamento VARCHAR,
                 elevador VARCHAR,
                 certificado_energetico VARCHAR,
-                descricao_bruta TEXT
+                descricao_bruta TEXT,
+                last_seen TIMESTAMP,
+                {schema.columns_sql()}
             );
         """)
+        # Tabelas criadas antes do modo price_sweep
+        self.cursor.execute("ALTER TABLE imoveis ADD COLUMN IF NOT EXISTS last_seen TIMESTAMP;")
+        # Tabela nova: índices logo aqui (numa tabela existente ficam para o backfill)
+        if new_table:
+            for name, column in schema.INDEXES.items():
+                self.cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON imoveis ({column})")
+        missing = schema.missing_columns(self.cursor)
         self.connection.commit()
+        if missing:
+            # Reescreve a tabela: não se faz no arranque do crawl
+            logger.warning(f"⚠️ imoveis sem as colunas derivadas {missing}: correr `python -m MLEngine.schema --backfill`.")
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        pipeline = cls(crawler.settings)
+        crawler.signals.connect(pipeline.spider_idle, signal=signals.spider_idle)
+        return pipeline
+
+    def open_spider(self, spider):
+        self.spider = spider
+        # Crawl lento (poucos imóveis por minuto): o lote não fica à espera de encher
+        self.flush_loop = task.LoopingCall(self.flush_if_due)
+        self.flush_loop.start(self.flush_interval, now=False)
 
     def process_item(self, item, spider):
-        page_num = item.get('listing_page_number', 'N/A') # <--- LÊ O NÚMERO DA PÁGINA AQUI
-        
+        if isinstance(item, PriceBatchItem):
+            return self.update_prices(item, spider)
+
+        self.buffer[item.get('url_id')] = item
+        if len(self.buffer) >= self.batch_size:
+            self.flush(spider)
+        return item
+
+    def spider_idle(self, spider):
+        self.flush(spider)
+
+    def flush_if_due(self):
+        if self.buffer and time.time() - self.last_flush >= self.flush_interval:
+            self.flush(self.spider)
+
+    def flush(self, spider):
+        """Grava o lote atual (um statement e um commit)."""
+        items = self.take_batch()
+        if items:
+            self.batch_written(self.write_batch(items, spider), items, spider)
+
+    def take_batch(self):
+        self.last_flush = time.time()
+        items = list(self.buffer.values())
+        self.buffer = {}
+        return items
+
+    def write_batch(self, items, spider):
+        """Só BD (pode correr fora do reactor). Devolve (Counter de write_rows, segundos)."""
+        t0 = time.perf_counter()
+        rows = [item_row(item) for item in items]
+        try:
+            changes = self.write_rows(rows, spider)
+        except DB_DOWN_ERRORS as e:
+            self.db_down(e, len(rows), spider)
+            changes = Counter()
+        return changes, time.perf_counter() - t0
+
+    def db_down(self, error, lost, spider):
+        """Ligação perdida: sem spool, as linhas perdem-se (ficam contadas como falhas)."""
+        self.fail_count += lost
+        spider.logger.error(f"[PIPELINE-ERROR] BD indisponível, {lost} linhas perdidas | Erro: {error}")
+        try:
+            self.connection.rollback()
+        except DB_DOWN_ERRORS:
+            pass
+        return 0
+
+    def batch_written(self, result, items, spider):
+        changes, elapsed = result
+        written = self.record_changes(changes, spider)
+        pages = sorted({str(item.get('listing_page_number', 'N/A')) for item in items})
+        spider.logger.info(
+            f"[PIPELINE] Lote gravado: {written}/{len(items)} imóveis (Págs {', '.join(pages)}) | "
+            f"{self.describe_changes(changes)} | Total inseridos: {self.success_count}"
+        )
+        spider.crawler.signals.send_catch_log(signal=stage_timed, stage='pipeline', seconds=elapsed, label='batch')
+
+    def record_changes(self, changes, spider):
+        """Soma um Counter de write_rows aos stats (pipeline/inserted|changed|unchanged). Devolve o total."""
+        written = sum(changes.values())
+        self.success_count += written
+        self.changes.update(changes)
+        for key, n in changes.items():
+            spider.crawler.stats.inc_value(f'pipeline/{key}', n)
+        return written
+
+    @staticmethod
+    def describe_changes(changes):
+        return f"Novos: {changes['inserted']}, Alterados: {changes['changed']}, Sem alterações: {changes['unchanged']}"
+
+    def write_rows(self, rows, spider):
+        """UPSERT de `rows`; em caso de erro divide o lote ao meio.
+
+        Devolve um Counter(inserted=, changed=, unchanged=) das linhas gravadas.
+        Ligação perdida (DB_DOWN_ERRORS) não é erro de linha: sobe para quem chamou.
+        """
         try:
-            # 2. UPSERT (INSERT/UPDATE)
-            self.cursor.execute("""
-                INSERT INTO imoveis (
-                    url_id, link, last_crawled, data_publicacao,
-                    preco_atual, freguesia, tipologia,
-                    area_bruta_m2, area_util_m2, area_terreno_m2,
-                    ano_construcao, num_quartos, num_wc, 
-                    estacionamento, elevador, certificado_energetico,
-                    descricao_bruta
+            returned = execute_values(self.cursor, UPSERT_QUERY, rows, page_size=len(rows), fetch=True)
+            inserted = sum(1 for _, new in returned if new)
+            written_ids = {url_id for url_id, _ in returned}
+            unchanged = [(row[0], row[LAST_CRAWLED]) for row in rows if row[0] not in written_ids]
+            if unchanged:
+                execute_values(
+                    self.cursor, TOUCH_QUERY, unchanged,
+                    template="(%s, %s::timestamp)", page_size=len(unchanged)
                 )
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                ON CONFLICT (url_id) DO UPDATE SET
-                    link = EXCLUDED.link,
-                    last_crawled = EXCLUDED.last_crawled,
-                    -- ... (outros campos) ...
-                    descricao_bruta = EXCLUDED.descricao_bruta;
-            """, (
-                item.get('url_id'), item.get('link'), item.get('last_crawled'), item.get('data_publicacao'),
-                item.get('preco_atual'), item.get('freguesia'), item.get('tipologia'),
-                item.get('area_bruta_m2'), item.get('area_util_m2'), item.get('area_terreno_m2'),
-                item.get('ano_construcao'), item.get('num_quartos'), item.get('num_wc'),
-                item.get('estacionamento'), item.get('elevador'), item.get('certificado_energetico'),
-                item.get('descricao_bruta')
-            ))
             self.connection.commit()
-            self.success_count += 1
-            
-            # 🚨 LOG ATUALIZADO COM O NÚMERO DA PÁGINA
-            spider.logger.info(f"[PIPELINE] Inserido/Atualizado: {item.get('url_id')} (Pág {page_num}) | Total inseridos: {self.success_count}")
+            return Counter(inserted=inserted, changed=len(returned) - inserted, unchanged=len(unchanged))
+        except DB_DOWN_ERRORS:
+            raise
+        except Exception as e:
+            self.connection.rollback()
+            if len(rows) == 1:
+                self.fail_count += 1
+                spider.logger.error(f"[PIPELINE-ERROR] Falha ao salvar {rows[0][0]} | Erro: {e} | Total falhas: {self.fail_count}")
+                return Counter()
+        mid = len(rows) // 2
+        return self.write_rows(rows[:mid], spider) + self.write_rows(rows[mid:], spider)
+
+    def update_prices(self, item, spider):
+        self.prices_written(self.write_prices(item, spider), item, spider)
+        return item
 
+    def write_prices(self, item, spider):
+        """Só BD (pode correr fora do reactor). Devolve (atualizados, segundos)."""
+        t0 = time.perf_counter()
+        rows = [(url_id, price, item['seen_at']) for url_id, price in item['rows']]
+        try:
+            updated = self.write_price_batch(rows, spider)
+        except DB_DOWN_ERRORS as e:
+            updated = self.db_down(e, len(rows), spider)
         except Exception as e:
             self.connection.rollback()
             self.fail_count += 1
-            spider.logger.error(f"[PIPELINE-ERROR] Falha ao salvar {item.get('url_id')} | Erro: {e} | Total falhas: {self.fail_count}")
-            
-        return item
+            spider.logger.error(f"[PIPELINE-ERROR] Falha no UPDATE de preços (Pág {item.get('listing_page_number')}) | Erro: {e}")
+            updated = 0
+        return updated, time.perf_counter() - t0
+
+    def write_price_batch(self, rows, spider):
+        """write_price_rows com o mesmo isolamento do write_rows: em caso de erro divide
+        o lote ao meio até isolar a(s) linha(s) com erro. DB_DOWN_ERRORS sobem."""
+        try:
+            return self.write_price_rows(rows)
+        except DB_DOWN_ERRORS:
+            raise
+        except Exception as e:
+            self.connection.rollback()
+            if len(rows) == 1:
+                self.fail_count += 1
+                spider.logger.error(f"[PIPELINE-ERROR] Falha no preço de {rows[0][0]} | Erro: {e} | Total falhas: {self.fail_count}")
+                return 0
+        mid = len(rows) // 2
+        return self.write_price_batch(rows[:mid], spider) + self.write_price_batch(rows[mid:], spider)
+
+    def write_price_rows(self, rows):
+        """UPDATE de (url_id, preço, visto_em). Devolve as linhas atualizadas."""
+        execute_values(
+            self.cursor, PRICE_SWEEP_QUERY, rows,
+            template="(%s, %s::float, %s::timestamp)", page_size=len(rows)
+        )
+        self.connection.commit()
+        return self.cursor.rowcount
+
+    def prices_written(self, result, item, spider):
+        updated, elapsed = result
+        spider.logger.info(f"[PIPELINE] Preços atualizados: {updated}/{len(item['rows'])} (Pág {item.get('listing_page_number')})")
+        spider.crawler.signals.send_catch_log(signal=stage_timed, stage='pipeline', seconds=elapsed, label='price_sweep')
+
+    def close_spider(self, spider):
+        if self.flush_loop and self.flush_loop.running:
+            self.flush_loop.stop()
+        self.flush(spider)
+        self.close_connection(spider)
+
+    def close_connection(self, spider):
+        if self.connection is not None and not self.connection.closed:
+            self.cursor.close()
+            self.connection.close()
+        spider.logger.info(f"[PIPELINE] Conexão encerrada. Inseridos: {self.success_count}, Falhas: {self.fail_count}")
+        if self.success_count:
+            # Muitos "sem alterações" = detalhes visitados cedo demais (subir TTL_DAYS)
+            unchanged_pct = 100 * self.changes['unchanged'] / self.success_count
+            spider.logger.info(f"[PIPELINE] {self.describe_changes(self.changes)} ({unchanged_pct:.0f}% sem alterações)")
+
+
+class AsyncPostgresPipeline(PostgresPipeline):
+    """Variante não bloqueante do PostgresPipeline.
+
+    O psycopg2 é síncrono e o reactor (asyncio) é o mesmo que serve o Playwright:
+    cada commit no thread principal parava o render e o agendamento. Aqui os lotes
+    são gravados por um thread dedicado (um só, para a ligação nunca ser partilhada)
+    e o reactor só recebe o resultado.
+
+    Contrapressão: com PIPELINE_MAX_PENDING_BATCHES lotes por gravar, process_item
+    devolve um Deferred que só dispara quando um lote terminar (o Scrapy abranda).
+    """
+
+    def __init__(self, settings):
+        super().__init__(settings)
+        self.max_pending = self.settings.getint('PIPELINE_MAX_PENDING_BATCHES', 2)
+        self.pool = ThreadPool(minthreads=1, maxthreads=1, name='postgres-writer')
+        self.pending = set()    # Deferreds dos lotes a gravar
+        self.waiting = []       # (Deferred, item) parados pela contrapressão
+
+    def open_spider(self, spider):
+        super().open_spider(spider)
+        self.pool.start()
+
+    def process_item(self, item, spider):
+        if isinstance(item, PriceBatchItem):
+            d = self.submit(self.write_prices, item, spider)
+            d.addCallbacks(self.prices_written, self.write_failed, callbackArgs=(item, spider), errbackArgs=(spider,))
+        else:
+            self.buffer[item.get('url_id')] = item
+            if len(self.buffer) >= self.batch_size:
+                self.flush(spider)
+        return self.backpressure(item)
+
+    def flush(self, spider):
+        items = self.take_batch()
+        if items:
+            d = self.submit(self.write_batch, items, spider)
+            d.addCallbacks(self.batch_written, self.write_failed, callbackArgs=(items, spider), errbackArgs=(spider,))
+
+    def submit(self, func, *args):
+        d = threads.deferToThreadPool(reactor, self.pool, func, *args)
+        self.pending.add(d)
+        d.addBoth(self.batch_done, d)
+        return d
+
+    def batch_done(self, result, d):
+        self.pending.discard(d)
+        while self.waiting and len(self.pending) < self.max_pending:
+            waiter, item = self.waiting.pop(0)
+            waiter.callback(item)
+        return result
+
+    def backpressure(self, item):
+        if len(self.pending) < self.max_pending:
+            return item
+        self.spider.crawler.stats.inc_value('pipeline/backpressure')
+        waiter = defer.Deferred()
+        self.waiting.append((waiter, item))
+        return waiter
+
+    def write_failed(self, failure, spider):
+        # Erros de linha já são tratados em write_rows; aqui só chega a perda da ligação
+        spider.logger.error(f"[PIPELINE-ERROR] Falha no thread de escrita: {failure.value}")
+
+    def close_spider(self, spider):
+        if self.flush_loop and self.flush_loop.running:
+            self.flush_loop.stop()
+        self.flush(spider)
+        d = defer.DeferredList(list(self.pending))
+        d.addCallback(lambda _: threads.deferToThreadPool(reactor, self.pool, self.close_connection, spider))
+        d.addBoth(lambda _: self.pool.stop())
+        return d
+
+
+class SpooledPostgresPipeline(PostgresPipeline):
+    """Write-behind: os items vão primeiro para um spool em disco (MLEngine.spool).
+
+    process_item só acrescenta ao segmento atual, por isso o crawl não espera pela
+    BD. Um drainer (thread único, a cada SPOOL_DRAIN_INTERVAL segundos) sela o
+    segmento, grava os selados em lotes de PIPELINE_BATCH_SIZE e só depois os apaga.
+    Com a BD em baixo os segmentos ficam em disco e o drainer tenta de novo com
+    backoff exponencial (até SPOOL_MAX_BACKOFF); o que sobrar no fecho é gravado
+    na execução seguinte (ou com `python -m MLEngine.spool`). Um segmento que falha
+    por outro motivo SPOOL_MAX_SEGMENT_FAILURES vezes seguidas vai para a quarentena
+    (SPOOL_DIR/quarantine) e o drain continua com os seguintes.
+
+    Contrapressão: acima de SPOOL_MAX_BYTES por drenar, process_item devolve um
+    Deferred que só dispara depois de um drain (o Scrapy abranda).
+    """
+
+    connect_on_init = False     # A BD pode estar em baixo no arranque: liga no primeiro drain
+
+    def __init__(self, settings):
+        super().__init__(settings)
+        self.spool = Spool(
+            settings.get('SPOOL_DIR', 'spool'),
+            segment_bytes=settings.getint('SPOOL_SEGMENT_BYTES', 8 * 1024 * 1024),
+            fsync=settings.getbool('SPOOL_FSYNC', True),
+        )
+        self.max_bytes = settings.getint('SPOOL_MAX_BYTES', 512 * 1024 * 1024)
+        self.drain_interval = settings.getfloat('SPOOL_DRAIN_INTERVAL', 2.0)
+        self.fsync_interval = settings.getfloat('SPOOL_FSYNC_INTERVAL', 1.0)
+        self.fsync_loop = None
+        self.max_backoff = settings.getfloat('SPOOL_MAX_BACKOFF', 60.0)
+        self.max_segment_failures = settings.getint('SPOOL_MAX_SEGMENT_FAILURES', 3)
+        self.segment_failures = Counter()   # segmento -> falhas seguidas (sem ser BD em baixo)
+        self.quarantined = 0
+        self.pool = ThreadPool(minthreads=1, maxthreads=1, name='spool-drainer')
+        self.draining = None    # Deferred do drain em curso
+        self.backoff = 0.0
+        self.retry_at = 0.0
+        self.waiting = []       # (Deferred, item) parados pela contrapressão
+
+    def ensure_connection(self):
+        if self.connection is None or self.connection.closed:
+            self.connect()
+
+    def reset_connection(self):
+        try:
+            self.connection.close()
+        except Exception:
+            pass
+        self.connection = None
+
+    def rollback(self):
+        """Sai da transação abortada (senão todos os drains seguintes falham com InFailedSqlTransaction)."""
+        if self.connection is None or self.connection.closed:
+            return
+        try:
+            self.connection.rollback()
+        except DB_DOWN_ERRORS:
+            self.reset_connection()
+
+    def open_spider(self, spider):
+        self.spider = spider
+        self.pool.start()
+        left = self.spool.segments()
+        if left:
+            spider.logger.info(f"📦 SPOOL: {len(left)} segmentos de uma execução anterior por gravar.")
+        self.flush_loop = task.LoopingCall(self.drain_if_due)
+        self.flush_loop.start(self.drain_interval, now=False)
+        if self.spool.fsync:
+            self.fsync_loop = task.LoopingCall(self.spool.sync)
+            self.fsync_loop.start(self.fsync_interval, now=False)
+
+    def process_item(self, item, spider):
+        kind = 'prices' if isinstance(item, PriceBatchItem) else 'imovel'
+        self.spool.append([{'kind': kind, 'data': dict(item)}])
+        return self.backpressure(item)
+
+    def spider_idle(self, spider):
+        self.drain_if_due()
+
+    def backpressure(self, item):
+        if self.spool.pending_bytes < self.max_bytes:
+            return item
+        self.spider.crawler.stats.inc_value('pipeline/backpressure')
+        waiter = defer.Deferred()
+        self.waiting.append((waiter, item))
+        return waiter
+
+    def release_waiters(self):
+        while self.waiting and self.spool.pending_bytes < self.max_bytes:
+            waiter, item = self.waiting.pop(0)
+            waiter.callback(item)
+
+    # ------------------------------
+    # DRAINER
+    # ------------------------------
+    def drain_if_due(self):
+        if self.draining is None and time.time() >= self.retry_at:
+            self.start_drain(self.spider)
+
+    def start_drain(self, spider):
+        """Sela o segmento atual (no reactor) e manda os selados para o thread do drainer."""
+        self.spool.seal()
+        segments = self.spool.sealed_segments()
+        if not segments:
+            return None
+        self.draining = threads.deferToThreadPool(reactor, self.pool, self.drain, spider, segments)
+        self.draining.addCallbacks(self.drained, self.drain_failed, callbackArgs=(spider,), errbackArgs=(spider,))
+        self.draining.addBoth(self.drain_done)
+        return self.draining
+
+    def drain(self, spider, segments=None):
+        """Só BD (thread do drainer). Grava os segmentos por ordem e apaga-os.
+
+        Devolve (segmentos, Counter de write_rows, segundos). DB_DOWN_ERRORS sobem:
+        o segmento em curso fica em disco e é regravado por inteiro (idempotente).
+        Outro erro num segmento faz rollback e também sobe (nova tentativa com backoff),
+        até o segmento ir para a quarentena (ver segment_failed).
+        """
+        t0 = time.perf_counter()
+        done = 0
+        changes = Counter()
+        try:
+            self.ensure_connection()
+            for path in self.spool.sealed_segments() if segments is None else segments:
+                try:
+                    changes += self.drain_segment(path, spider)
+                except DB_DOWN_ERRORS:
+                    raise
+                except Exception as e:
+                    self.rollback()
+                    if not self.segment_failed(path, e, spider):
+                        raise
+                    continue
+                self.spool.remove(path)
+                self.segment_failures.pop(path, None)
+                done += 1
+        except DB_DOWN_ERRORS:
+            self.reset_connection()
+            raise
+        except Exception:
+            self.rollback()
+            raise
+        return done, changes, time.perf_counter() - t0
+
+    def segment_failed(self, path, error, spider):
+        """Conta a falha do segmento. Devolve True se foi para a quarentena (o drain continua)."""
+        self.segment_failures[path] += 1
+        if self.segment_failures[path] < self.max_segment_failures:
+            return False
+        del self.segment_failures[path]
+        target = self.spool.quarantine(path)
+        self.quarantined += 1
+        spider.logger.error(
+            f"[PIPELINE-ERROR] Segmento {path} falhou {self.max_segment_failures} vezes, "
+            f"movido para {target} | Erro: {error}"
+        )
+        return True
+
+    def drain_segment(self, path, spider):
+        """Mantém a ordem imóveis/preços do segmento; o mesmo imóvel seguido: fica o último."""
+        changes = Counter()
+        imoveis = {}
+        for n, record in enumerate(self.spool.read(path), 1):
+            data = record.get('data') or {}
+            if record.get('kind') == 'prices':
+                changes += self.write_spooled(imoveis, spider)
+                imoveis = {}
+                try:
+                    rows = [(url_id, price, data['seen_at']) for url_id, price in data.get('rows', [])]
+                except (KeyError, TypeError, ValueError) as e:
+                    # Registo mal formado: perde-se só ele, não o segmento
+                    self.fail_count += 1
+                    spider.logger.error(f"[PIPELINE-ERROR] Registo de preços {n} de {path} inválido, ignorado | Erro: {e!r}")
+                    continue
+                if rows:
+                    self.write_price_batch(rows, spider)
+            else:
+                imoveis[data.get('url_id')] = data
+        return changes + self.write_spooled(imoveis, spider)
+
+    def write_spooled(self, imoveis, spider):
+        rows = [item_row(item) for item in imoveis.values()]
+        changes = Counter()
+        for i in range(0, len(rows), self.batch_size):
+            changes += self.write_rows(rows[i:i + self.batch_size], spider)
+        return changes
+
+    def drained(self, result, spider):
+        segments, changes, elapsed = result
+        self.backoff = 0.0
+        self.retry_at = 0.0
+        written = self.record_changes(changes, spider)
+        spider.crawler.stats.inc_value('spool/segments_drained', segments)
+        spider.crawler.stats.inc_value('spool/drained_rows', written)
+        spider.logger.info(
+            f"[PIPELINE] Spool drenado: {written} imóveis de {segments} segmentos | "
+            f"{self.describe_changes(changes)} | Total inseridos: {self.success_count}"
+        )
+        spider.crawler.signals.send_catch_log(signal=stage_timed, stage='pipeline', seconds=elapsed, label='spool')
+
+    def drain_failed(self, failure, spider):
+        self.backoff = min(max(self.backoff * 2, self.drain_interval), self.max_backoff)
+        self.retry_at = time.time() + self.backoff
+        pending_kb = self.spool.pending_bytes / 1024
+        if failure.check(*DB_DOWN_ERRORS):
+            spider.crawler.stats.inc_value('spool/db_down')
+            spider.logger.warning(
+                f"⚠️ SPOOL: BD indisponível ({str(failure.value).strip().splitlines()[0]}). "
+                f"{pending_kb:.0f} KB em disco, nova tentativa em {self.backoff:.0f}s."
+            )
+        else:
+            spider.logger.error(f"[PIPELINE-ERROR] Falha no drain do spool: {failure.value} | nova tentativa em {self.backoff:.0f}s")
+
+    def drain_done(self, _):
+        self.draining = None
+        if self.quarantined:
+            self.spider.crawler.stats.set_value('spool/quarantined', self.quarantined)
+        self.release_waiters()
 
     def close_spider(self, spider):
-        self.cursor.close()
-        self.connection.close()
-        spider.logger.info(f"[PIPELINE] Conexão encerrada. Inseridos: {self.success_count}, Falhas: {self.fail_count}")
\ No newline at end of file
+        if self.flush_loop and self.flush_loop.running:
+            self.flush_loop.stop()
+        if self.fsync_loop and self.fsync_loop.running:
+            self.fsync_loop.stop()
+        self.retry_at = 0.0
+        d = self.draining if self.draining is not None else defer.succeed(None)
+        d.addBoth(lambda _: self.start_drain(spider))
+        d.addBoth(lambda _: self.spool_closed(spider))
+        d.addBoth(lambda _: threads.deferToThreadPool(reactor, self.pool, self.close_connection, spider))
+        d.addBoth(lambda _: self.pool.stop())
+        return d
+
+    def spool_closed(self, spider):
+        self.spool.close()
+        left = self.spool.segments()
+        if left:
+            spider.logger.warning(
+                f"📦 SPOOL: {len(left)} segmentos ({self.spool.pending_bytes / 1024:.0f} KB) ficam em disco "
+                f"para a próxima execução (ou `python -m MLEngine.spool`)."
+            )
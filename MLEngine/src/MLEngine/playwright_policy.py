@@ -0,0 +1,64 @@
+from functools import lru_cache
+from urllib.parse import urlparse
+
+from scrapy_playwright.handler import ScrapyPlaywrightDownloadHandler
+
+# =========================================================================
+# POLÍTICA DE RECURSOS DO PLAYWRIGHT (PLAYWRIGHT_ABORT_REQUEST)
+# =========================================================================
+# O spider só precisa do DOM: os cartões 'div.grid div[id^="listing-list-card-"]'
+# e o botão "Go to next page" são desenhados pelo JS da própria remax.pt.
+# Imagens, fontes, CSS externo, mapas e analytics só atrasam o 'networkidle'.
+#
+# Os tipos bloqueados e a allowlist vêm dos settings do crawler (com os `-s`):
+# o PolicyDownloadHandler troca o should_abort_request por um ResourcePolicy
+# construído com crawler.settings.
+
+
+class ResourcePolicy:
+    """Predicado do PLAYWRIGHT_ABORT_REQUEST: True para os pedidos do browser a cortar."""
+
+    def __init__(self, blocked_types=(), allowed_domains=()):
+        self.blocked_types = frozenset(blocked_types)
+        self.allowed_domains = tuple(d.lower().lstrip('.') for d in allowed_domains)
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(settings.getlist('PLAYWRIGHT_BLOCKED_RESOURCE_TYPES'), settings.getlist('PLAYWRIGHT_ALLOWED_DOMAINS'))
+
+    def is_allowed_domain(self, host):
+        """'www.remax.pt' e 'remax.pt' passam com a entrada 'remax.pt'."""
+        host = (host or '').lower()
+        return any(host == d or host.endswith('.' + d) for d in self.allowed_domains)
+
+    def __call__(self, request):
+        # Nunca cortar a navegação principal (seria um erro no download)
+        if request.is_navigation_request():
+            return False
+        if request.resource_type in self.blocked_types:
+            return True
+        # Terceiros (analytics, mapas, chat, ads): só passa o que está na allowlist
+        if self.allowed_domains and not self.is_allowed_domain(urlparse(request.url).hostname):
+            return True
+        return False
+
+
+@lru_cache(maxsize=None)
+def project_policy():
+    from scrapy.utils.project import get_project_settings
+    return ResourcePolicy.from_settings(get_project_settings())
+
+
+def should_abort_request(request):
+    """Valor de PLAYWRIGHT_ABORT_REQUEST. Com o PolicyDownloadHandler nunca é chamado
+    (fica o ResourcePolicy do crawler); com o handler original usa os settings do projeto."""
+    return project_policy()(request)
+
+
+class PolicyDownloadHandler(ScrapyPlaywrightDownloadHandler):
+    """Handler do scrapy-playwright com a política de recursos dos settings do crawler."""
+
+    def __init__(self, crawler):
+        super().__init__(crawler)
+        if self.abort_request is should_abort_request:
+            self.abort_request = ResourcePolicy.from_settings(crawler.settings)
@@ -0,0 +1,159 @@
+import argparse
+import time
+
+import psycopg2
+
+# =========================================================================
+# COLUNAS DERIVADAS DA TABELA imoveis
+# =========================================================================
+# listing_type, area_relevante_m2 e preco_m2_relevante eram recalculados em
+# pandas (regex sobre o link) a cada treino / análise. Passam a ser colunas
+# geradas (STORED): o Postgres calcula-as no INSERT/UPDATE, incluindo os
+# UPDATE de preço do price_sweep, e o common.processing só as lê.
+#
+# A lógica espelha a do feature_engineering, com as colunas que a tabela tem
+# (area_bruta_privativa_m2 e area_total_do_lote_m2 não existem na BD):
+#   - apartamentos: útil > bruta
+#   - terrenos: terreno > bruta
+#   - resto (moradias incluídas): bruta
+# Área 0 conta como desconhecida (NULL).
+#
+# As funções só usam funções internas do Postgres (sem chamar umas às outras),
+# para o pg_dump/restore não depender do search_path.
+
+LISTING_TYPE_SQL = "COALESCE(substring(link FROM '(?:venda|arrendamento)-([a-z]+)'), 'outra')"
+
+FUNCTIONS = f"""
+    CREATE OR REPLACE FUNCTION imovel_listing_type(link TEXT) RETURNS TEXT
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+        SELECT {LISTING_TYPE_SQL}
+    $$;
+
+    CREATE OR REPLACE FUNCTION imovel_area_relevante(link TEXT, bruta FLOAT, util FLOAT, terreno FLOAT)
+    RETURNS FLOAT
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+        SELECT NULLIF(CASE
+            WHEN t IN ('apartamento', 'duplex', 'estudio', 'flat') THEN COALESCE(util, bruta)
+            WHEN t IN ('terreno', 'lote', 'terreno-rustico') THEN COALESCE(terreno, bruta)
+            ELSE bruta
+        END, 0)
+        FROM (SELECT {LISTING_TYPE_SQL} AS t) AS s
+    $$;
+"""
+
+AREA_SQL = "imovel_area_relevante(link, area_bruta_m2, area_util_m2, area_terreno_m2)"
+
+# nome -> definição (ordem = ordem na tabela)
+DERIVED_COLUMNS = {
+    'listing_type': "TEXT GENERATED ALWAYS AS (imovel_listing_type(link)) STORED",
+    'area_relevante_m2': f"FLOAT GENERATED ALWAYS AS ({AREA_SQL}) STORED",
+    'preco_m2_relevante': f"FLOAT GENERATED ALWAYS AS (preco_atual / {AREA_SQL}) STORED",
+}
+
+INDEXES = {
+    'imoveis_listing_type_idx': 'listing_type',
+    'imoveis_freguesia_idx': 'freguesia',
+    'imoveis_last_crawled_idx': 'last_crawled',
+}
+
+# Linhas calculadas com uma versão anterior das funções (UPDATE no-op recalcula-as)
+STALE_QUERY = f"""
+    UPDATE imoveis SET link = link
+    WHERE listing_type IS DISTINCT FROM imovel_listing_type(link)
+       OR area_relevante_m2 IS DISTINCT FROM {AREA_SQL}
+"""
+
+
+def lock(cursor):
+    """Vários workers a arrancar ao mesmo tempo: serializa o DDL até ao commit."""
+    cursor.execute("SELECT pg_advisory_xact_lock(hashtext('imoveis'))")
+
+
+def create_functions(cursor):
+    cursor.execute(FUNCTIONS)
+
+
+def columns_sql():
+    """Definições para o CREATE TABLE."""
+    return ',\n'.join(f"{name} {definition}" for name, definition in DERIVED_COLUMNS.items())
+
+
+def missing_columns(cursor):
+    cursor.execute(
+        "SELECT column_name FROM information_schema.columns WHERE table_name = 'imoveis' AND column_name = ANY(%s)",
+        (list(DERIVED_COLUMNS),)
+    )
+    existing = {row[0] for row in cursor.fetchall()}
+    return [name for name in DERIVED_COLUMNS if name not in existing]
+
+
+def missing_indexes(cursor):
+    cursor.execute("SELECT indexname FROM pg_indexes WHERE tablename = 'imoveis'")
+    existing = {row[0] for row in cursor.fetchall()}
+    return [name for name in INDEXES if name not in existing]
+
+
+def backfill(conn, concurrently=False):
+    """Cria colunas e índices em falta numa tabela já existente.
+
+    ADD COLUMN ... STORED reescreve a tabela (lock exclusivo) e calcula as
+    colunas para todas as linhas. Devolve {passo: segundos}.
+    """
+    timings = {}
+    with conn.cursor() as cur:
+        lock(cur)
+        create_functions(cur)
+        for name in missing_columns(cur):
+            t0 = time.perf_counter()
+            cur.execute(f"ALTER TABLE imoveis ADD COLUMN IF NOT EXISTS {name} {DERIVED_COLUMNS[name]}")
+            timings[f'coluna {name}'] = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        cur.execute(STALE_QUERY)
+        timings[f'recalculadas ({cur.rowcount} linhas)'] = time.perf_counter() - t0
+        conn.commit()
+
+    # CONCURRENTLY não bloqueia as escritas do crawler, mas não corre numa transação
+    autocommit = conn.autocommit
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            for name in missing_indexes(cur):
+                t0 = time.perf_counter()
+                cur.execute(
+                    f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS {name} "
+                    f"ON imoveis ({INDEXES[name]})"
+                )
+                timings[f'índice {name}'] = time.perf_counter() - t0
+    finally:
+        conn.autocommit = autocommit
+    return timings
+
+
+# =========================================================================
+# CLI: estado / backfill das colunas derivadas
+# =========================================================================
+
+if __name__ == "__main__":
+    from scrapy.utils.project import get_project_settings
+
+    parser = argparse.ArgumentParser(description="Colunas derivadas e índices da tabela imoveis.")
+    parser.add_argument('--backfill', action='store_true', help="Cria as colunas/índices em falta e calcula as linhas existentes")
+    parser.add_argument('--concurrently', action='store_true', help="Índices com CREATE INDEX CONCURRENTLY (crawl a correr)")
+    args = parser.parse_args()
+
+    settings = get_project_settings()
+    conn = psycopg2.connect(
+        host=settings.get('PGHOST'), user=settings.get('PGUSER'),
+        password=settings.get('PGPASSWORD'), dbname=settings.get('PGDATABASE'),
+        port=settings.get('PGPORT')
+    )
+    if args.backfill:
+        for step, seconds in backfill(conn, concurrently=args.concurrently).items():
+            print(f"✅ {step}: {seconds:.1f}s")
+    with conn.cursor() as cur:
+        columns, indexes = missing_columns(cur), missing_indexes(cur)
+    if columns or indexes:
+        print(f"⚠️ Em falta: {', '.join(columns + indexes)} (correr com --backfill)")
+    else:
+        print("✅ Colunas derivadas e índices em dia.")
+    conn.close()
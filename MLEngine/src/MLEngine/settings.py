@@ -40,10 +40,25 @@ PGPORT = os.environ.get('PGPORT')
 # CONFIGURAÇÕES DE CRAWLING
 # =========================================================================
 
-DOWNLOAD_DELAY = 2.5            # 2.5s entre requests
-CONCURRENT_REQUESTS = 3          # Até 3 requests simultâneas
+DOWNLOAD_DELAY = 2.5            # 2.5s entre requests (ponto de partida do controlo adaptativo)
+CONCURRENT_REQUESTS = 3          # Até 3 requests simultâneas (idem)
 COOKIES_ENABLED = False 
 
+# Paginação em leque: a 1ª página de cada pesquisa indica o total de páginas
+PAGINATION_WINDOW = 10          # Páginas de listagem em voo por pesquisa (0 = agenda todas de uma vez)
+PAGINATION_MAX_RETRIES = 2      # Repetições de uma página falhada (errback) antes de a abandonar
+
+# Checkpoint da fronteira do crawl (retomar com: scrapy crawl remax_imovel -a resume=1)
+CHECKPOINT_ENABLED = True
+CHECKPOINT_FILE = 'crawl_checkpoint.json'
+CHECKPOINT_INTERVAL = 30        # Segundos entre gravações (e sempre no fecho do spider)
+
+# Crawl distribuído (scrapy crawl remax_imovel -a distributed=1): fila crawl_tasks no Postgres
+QUEUE_CLAIM_BATCH = 16          # Tarefas reclamadas de cada vez por worker
+QUEUE_LEASE_SECONDS = 300       # Sem heartbeat durante este tempo, a tarefa volta à fila
+QUEUE_HEARTBEAT_INTERVAL = 60
+QUEUE_MAX_ATTEMPTS = 3
+
 # NOVAS CONFIGURAÇÕES DE RESILIÊNCIA E TIMEOUT (Adicionadas/Atualizadas)
 DOWNLOAD_TIMEOUT = 60           # 60 segundos de timeout para o download
 RETRY_ENABLED = True            # Ativa a retentativa de requests falhadas
@@ -62,6 +77,35 @@ DEFAULT_REQUEST_HEADERS = {
 
 HTTPERROR_ALLOWED_CODES = [403, 404]  # Mantém 404 para log
 
+# =========================================================================
+# CONTROLO ADAPTATIVO DE CONCORRÊNCIA (AIMD)
+# =========================================================================
+# DOWNLOAD_DELAY e CONCURRENT_REQUESTS passam a ser só o ponto de partida:
+# o AdaptiveConcurrencyMiddleware ajusta cada slot dentro destes limites.
+
+ADAPTIVE_CONCURRENCY_ENABLED = True
+ADAPTIVE_MIN_CONCURRENCY = 1
+ADAPTIVE_MAX_CONCURRENCY = 8
+ADAPTIVE_MIN_DELAY = 0.5        # segundos
+ADAPTIVE_MAX_DELAY = 30.0
+ADAPTIVE_DELAY_STEP = 0.25      # Redução aditiva do delay por ronda de respostas boas
+ADAPTIVE_TARGET_LATENCY = 20.0  # Render acima disto conta como congestão
+ADAPTIVE_DECREASE_FACTOR = 0.5  # Corte multiplicativo da concorrência
+ADAPTIVE_DECREASE_COOLDOWN = 10.0
+ADAPTIVE_BACKOFF_CODES = [403, 429]
+
+# Páginas abertas por contexto do browser (por omissão seria CONCURRENT_REQUESTS)
+PLAYWRIGHT_MAX_PAGES_PER_CONTEXT = ADAPTIVE_MAX_CONCURRENCY
+
+# =========================================================================
+# CACHE INCREMENTAL (TTL)
+# =========================================================================
+
+TTL_DAYS = 7                    # Revisita o detalhe ao fim de 7 dias mesmo sem mudança de preço
+TTL_CACHE_MODE = 'eager'        # 'eager': pré-carrega a tabela | 'lazy': uma query por página de listagem
+TTL_INDEX_CHUNK_SIZE = 50000    # (eager) Linhas por bloco do cursor do lado do servidor
+TTL_LRU_SIZE = 20000            # (lazy) IDs mantidos em memória entre páginas
+
 LOG_LEVEL = 'INFO'
 # LOG_LEVEL = 'WARNING'  # Apenas warnings e erros serão mostrados em produção
 # LOG_LEVEL = 'DEBUG'  # Para debug detalhado
@@ -71,27 +115,84 @@ LOG_LEVEL = 'INFO'
 # =========================================================================
 
 DOWNLOAD_HANDLERS = {
-    "http": "scrapy_playwright.handler.ScrapyPlaywrightDownloadHandler",
-    "https": "scrapy_playwright.handler.ScrapyPlaywrightDownloadHandler",
+    # Handler do scrapy-playwright com a política de recursos dos settings do crawler
+    "http": "MLEngine.playwright_policy.PolicyDownloadHandler",
+    "https": "MLEngine.playwright_policy.PolicyDownloadHandler",
 }
 
 DOWNLOADER_MIDDLEWARES = {
     'scrapy.downloadermiddlewares.useragent.UserAgentMiddleware': 500,
     'scrapy_user_agents.middlewares.RandomUserAgentMiddleware': None,
+    'MLEngine.middlewares.AdaptiveConcurrencyMiddleware': 900,  # Perto do downloader: vê os 403/429 antes do Retry
+    'MLEngine.middlewares.ContextPoolMiddleware': 950,  # Devolve a página ao pool antes de o Retry copiar a meta
 }
 
+# Páginas de detalhe: 'hybrid' tenta HTTP simples e só renderiza se faltarem dados,
+# 'http' nunca renderiza, 'playwright' renderiza sempre.
+# (Só os pedidos com meta "playwright": True passam pelo Chromium.)
+DETAIL_FETCH_MODE = 'hybrid'
+
 TWISTED_REACTOR = "twisted.internet.asyncioreactor.AsyncioSelectorReactor"
 PLAYWRIGHT_BROWSER_TYPE = "chromium"
 PLAYWRIGHT_DEFAULT_NAVIGATION_TIMEOUT = 60000  # Timeout reduzido para 15s
 
+# Pool de contextos (ver ContextPoolMiddleware): listagens e detalhes renderizados
+# partilham N contextos de longa duração e reutilizam as páginas já abertas.
+PLAYWRIGHT_POOL_ENABLED = True
+PLAYWRIGHT_POOL_SIZE = 2
+PLAYWRIGHT_POOL_MAX_PAGES = 200     # Navegações por contexto antes de o reciclar
+PLAYWRIGHT_POOL_MAX_HEAP_MB = 512   # Heap JS de uma página acima disto recicla o contexto
+PLAYWRIGHT_CONTEXT_KWARGS = {
+    "ignore_https_errors": True,
+    "viewport": {"width": 1920, "height": 1080},
+}
+
+# Política de recursos: corta o que não é preciso para os seletores do spider
+# (ver MLEngine/playwright_policy.py). Para desligar: PLAYWRIGHT_ABORT_REQUEST = None
+PLAYWRIGHT_ABORT_REQUEST = "MLEngine.playwright_policy.should_abort_request"
+PLAYWRIGHT_BLOCKED_RESOURCE_TYPES = ["image", "media", "font", "stylesheet"]
+PLAYWRIGHT_ALLOWED_DOMAINS = ["remax.pt"]  # Inclui subdomínios; o resto (analytics, mapas, ads) é cortado
+
 ITEM_PIPELINES = {
-    'MLEngine.pipelines.PostgresPipeline': 300,
+    # Write-behind: items primeiro para o spool em disco, um drainer grava-os no Postgres.
+    # Sem spool, escrita num thread dedicado: 'MLEngine.pipelines.AsyncPostgresPipeline'
+    # Versão síncrona (tudo no reactor): 'MLEngine.pipelines.PostgresPipeline'
+    'MLEngine.pipelines.SpooledPostgresPipeline': 300,
+}
+PIPELINE_BATCH_SIZE = 200          # Imóveis por UPSERT/commit
+PIPELINE_FLUSH_INTERVAL = 5        # Segundos máximos que um imóvel fica no lote
+PIPELINE_MAX_PENDING_BATCHES = 2   # (Async) Lotes à espera do thread de escrita antes de travar o Scrapy
+
+# Spool (SpooledPostgresPipeline)
+SPOOL_DIR = 'spool'                        # Segmentos *.jl por gravar (sobrevivem a um restart)
+SPOOL_SEGMENT_BYTES = 8 * 1024 * 1024      # Tamanho a partir do qual o segmento é selado
+SPOOL_MAX_BYTES = 512 * 1024 * 1024        # Por drenar acima disto: contrapressão no Scrapy
+SPOOL_DRAIN_INTERVAL = 2                   # Segundos entre drains
+SPOOL_MAX_BACKOFF = 60                     # Espera máxima entre tentativas com a BD em baixo
+SPOOL_MAX_SEGMENT_FAILURES = 3             # Falhas seguidas (sem ser BD em baixo) antes de o segmento ir para spool/quarantine
+SPOOL_FSYNC = True                         # fsync ao selar e a cada SPOOL_FSYNC_INTERVAL (False: mais rápido, perde o fim num crash do SO)
+SPOOL_FSYNC_INTERVAL = 1                   # Segundos entre fsyncs do segmento atual (o máximo perdido num crash do SO)
+
+SPIDER_MIDDLEWARES = {
+    'MLEngine.middlewares.StageTimingMiddleware': 950,  # Junto ao spider: mede só os callbacks
+}
+
+EXTENSIONS = {
+    'MLEngine.extensions.CrawlMetrics': 500,
 }
 
 # =========================================================================
 # LOG & MONITORAMENTO DE ITEMS
 # =========================================================================
 
+# Métricas por etapa (ver MLEngine/extensions.py): download/render, parse, pipeline,
+# rácio TTL, retries e errbacks.
+METRICS_ENABLED = True
+METRICS_INTERVAL = 60                       # Segundos entre snapshots
+METRICS_SNAPSHOT_FILE = 'crawl_metrics.jl'  # Uma linha JSON por snapshot (None = desliga)
+METRICS_PORT = int(os.environ.get('METRICS_PORT', 0))  # /metrics em formato Prometheus (0 = desliga)
+METRICS_HOST = '127.0.0.1'
+
 # Ativa contagem de items processados
 # Pode ser usado no spider com signals
 # from scrapy import signals
@@ -1,16 +1,34 @@
 import scrapy
+from collections import Counter
+from contextlib import closing
 from datetime import datetime, timedelta
 import re
 from urllib.parse import urlparse, parse_qs, urlencode, urlunparse
 from scrapy.utils.project import get_project_settings
 from scrapy_playwright.page import PageMethod
-from MLEngine.items import ImovelItem
+from MLEngine.detail_parser import parse_detail, extract_url_id, NON_DIGIT_RE
+from MLEngine.items import PriceBatchItem
+from MLEngine.checkpoint import CrawlCheckpoint
+from MLEngine.ttl_index import TTLIndex, LazyTTLLookup, epoch_day, NO_DAY
+from MLEngine.work_queue import WorkQueue
 from scrapy import signals
+from scrapy.exceptions import DontCloseSpider
+from scrapy.utils.defer import maybe_deferred_to_future
+from twisted.internet import reactor, task, threads
+from twisted.python.threadpool import ThreadPool
+import os
+import socket
 import time
 import psycopg2 
 import sys 
 
 SETTINGS = get_project_settings()
+PAGE_LABEL_RE = re.compile(r'(\d+)$')
+
+
+def is_true(value):
+    """Argumentos -a chegam como texto: '1', 'true', 'yes'."""
+    return str(value).lower() in ('1', 'true', 'yes')
 
 class RemaxSpider(scrapy.Spider):
     name = "remax_imovel"
@@ -23,13 +41,9 @@ class RemaxSpider(scrapy.Spider):
         'DOWNLOAD_TIMEOUT': 60,
         'RETRY_ENABLED': True,
         'RETRY_TIMES': 3, 
-        'CONCURRENT_REQUESTS': 3,
-        'DOWNLOAD_DELAY': 2.5,
+        # CONCURRENT_REQUESTS e DOWNLOAD_DELAY ficam só no settings.py (ponto de partida do controlo adaptativo)
     }
 
-    # --- VARIÁVEIS DE CONTROLO E CACHE ---
-    existing_listings = {} 
-
     # ------------------------------
     # 1. CONSTRUTOR (__init__)
     # ------------------------------
@@ -38,49 +52,291 @@ class RemaxSpider(scrapy.Spider):
         self.items_processed = 0
         self.pages_processed = 0
         self.start_time = None
-        # O self.load_existing_data() é chamado aqui, o que causava o erro.
-        # Agora a função está definida abaixo, mas garantimos que está ligada.
-        self.load_existing_data() 
+        # MODO: 'full' (por omissão) ou 'price_sweep' (`-a mode=price_sweep`): só listagens;
+        # os preços dos imóveis conhecidos vão num UPDATE por página e só os novos/expirados vão ao detalhe.
+        self.mode = getattr(self, 'mode', 'full')
+        if self.mode not in ('full', 'price_sweep'):
+            raise ValueError(f"Modo desconhecido: {self.mode} (esperado 'full' ou 'price_sweep')")
+        self.pagination = {}  # Por pesquisa: URL, total de páginas, próxima página a agendar e páginas feitas
+        self.pending_details = {}  # URL -> cb_kwargs dos detalhes agendados e ainda não recolhidos
+        self.detail_requests = Counter()  # URL -> pedidos de detalhe criados para ele e ainda em aberto
+        # CHECKPOINT: `scrapy crawl remax_imovel -a resume=1` continua onde o crawl parou
+        self.resume = is_true(getattr(self, 'resume', '0'))
+        # DISTRIBUÍDO: `-a distributed=1 [-a crawl_id=2025-01-31] [-a worker_id=w1]`
+        # Vários workers partilham a fila crawl_tasks (a fila faz de checkpoint).
+        self.queue = None
+        self.leased_tasks = set()  # IDs das tarefas em curso neste worker
+        self.queue_pool = None  # Thread único das chamadas à fila (a ligação nunca é partilhada)
+        self.heartbeat_loop = None
+        self.claiming = False  # Há um claim a caminho (não pedir outro lote em paralelo)
+        self.idle_check = None  # Deferred do claim + contagem feitos pelo spider_idle
+        self.queue_open = True  # Último resultado de has_open_tasks()
+        self.distributed = is_true(getattr(self, 'distributed', '0'))
+        self.checkpoint = None
+        self.existing_listings = TTLIndex()
 
     @classmethod
     def from_crawler(cls, crawler, *args, **kwargs):
         spider = super().from_crawler(crawler, *args, **kwargs)
+        spider.configure(crawler.settings)
         crawler.signals.connect(spider.spider_closed, signal=signals.spider_closed)
+        if spider.checkpoint is not None:
+            crawler.signals.connect(spider.request_dropped, signal=signals.request_dropped)
+        if spider.queue is not None:
+            crawler.signals.connect(spider.spider_idle, signal=signals.spider_idle)
         return spider
 
-    def spider_closed(self, spider):
+    def configure(self, settings):
+        """Configuração lida dos settings do crawler, para os `-s NOME=valor` contarem."""
+        if self.distributed:
+            self.open_work_queue(settings)
+        self.ttl_days = settings.getint('TTL_DAYS', 7)
+        self.detail_fetch_mode = settings.get('DETAIL_FETCH_MODE', 'hybrid')
+        # Em modo distribuído a fila recebe todas as páginas de uma vez (janela 0)
+        self.pagination_window = 0 if self.queue is not None else settings.getint('PAGINATION_WINDOW', 10)
+        self.pagination_max_retries = settings.getint('PAGINATION_MAX_RETRIES', 2)
+        if settings.getbool('CHECKPOINT_ENABLED', True) and self.queue is None:
+            self.checkpoint = CrawlCheckpoint(settings.get('CHECKPOINT_FILE', 'crawl_checkpoint.json'), settings.getfloat('CHECKPOINT_INTERVAL', 30.0))
+        # 'eager' pré-carrega a tabela toda; 'lazy' consulta a BD por página.
+        if settings.get('TTL_CACHE_MODE', 'eager') == 'lazy':
+            self.open_lazy_lookup()
+        else:
+            self.load_existing_data()
+
+    def spider_closed(self, spider, reason=None):
+        closing_queue = None
+        if self.checkpoint:
+            if reason == 'finished':
+                self.checkpoint.clear()  # Crawl completo: a próxima execução começa do zero
+            else:
+                self.checkpoint.save(self.pagination, self.pending_details)
+                self.logger.info(f"💾 Checkpoint guardado ({reason}). Retomar com: -a resume=1")
+        if self.queue is not None:
+            if self.heartbeat_loop and self.heartbeat_loop.running:
+                self.heartbeat_loop.stop()
+            closing_queue = self.queue_call(self.close_work_queue)
+            closing_queue.addErrback(lambda f: self.logger.warning(f"⚠️ Falha ao fechar a fila: {f.value}"))
+            closing_queue.addBoth(lambda _: self.queue_pool.stop())
+        if isinstance(self.existing_listings, LazyTTLLookup):
+            self.logger.info(f"♻️ CACHE (lazy): {self.existing_listings.queries} queries à BD.")
+        self.existing_listings.close()
+        self.log_fast_path_rate()
         self.logger.info(f"🏁 Spider encerrado. Total de imóveis processados: {self.items_processed}")
+        return closing_queue  # O Scrapy espera pelo Deferred antes de parar o reactor
 
     # ------------------------------
     # 2. LÓGICA DE CACHE INCREMENTAL (TTL)
     # ------------------------------
+    def connect_db(self):
+        return psycopg2.connect(
+            host=self.settings.get('PGHOST'), user=self.settings.get('PGUSER'), 
+            password=self.settings.get('PGPASSWORD'), dbname=self.settings.get('PGDATABASE'), 
+            port=self.settings.get('PGPORT')
+        )
+
+    def open_lazy_lookup(self):
+        """Modo lazy: arranque imediato, os IDs são resolvidos página a página."""
+        try:
+            self.existing_listings = LazyTTLLookup(self.connect_db(), self.settings.getint('TTL_LRU_SIZE', 20000))
+            self.logger.info("♻️ CACHE: Modo lazy (consulta por página).")
+        except Exception as e:
+            self.logger.warning(f"⚠️ Erro ao ligar à BD para o cache: {e}")
+
     def load_existing_data(self):
-        """Carrega ID, Preço e Data da última recolha para o cache (Lógica TTL)."""
+        """Carrega ID, Preço e Dia da última recolha para o índice TTL compacto."""
         try:
-            conn = psycopg2.connect(
-                host=SETTINGS.get('PGHOST'), user=SETTINGS.get('PGUSER'), 
-                password=SETTINGS.get('PGPASSWORD'), dbname=SETTINGS.get('PGDATABASE'), 
-                port=SETTINGS.get('PGPORT')
-            )
-            cur = conn.cursor()
-            cur.execute("SELECT url_id, preco_atual, last_crawled FROM imoveis")
-            rows = cur.fetchall()
-            for row in rows:
-                self.existing_listings[row[0]] = {'price': float(row[1]) if row[1] else 0.0, 'date': row[2]}
-            
-            self.logger.info(f"♻️ CACHE: Carregados {len(self.existing_listings)} imóveis da BD.")
-            cur.close()
-            conn.close()
+            t0 = time.time()
+            with closing(self.connect_db()) as conn:
+                self.existing_listings = TTLIndex.load(conn, self.settings.getint('TTL_INDEX_CHUNK_SIZE', 50000))
+
+            mb = self.existing_listings.nbytes / 1024 / 1024
+            self.logger.info(f"♻️ CACHE: Carregados {len(self.existing_listings)} imóveis da BD ({mb:.1f} MB, {time.time() - t0:.1f}s).")
         except Exception as e:
             self.logger.warning(f"⚠️ Erro ao carregar cache da BD: {e}")
+
+    def should_scrape(self, current_id, price_val, today):
+        """Decisão TTL: visita o detalhe se é novo, mudou de preço ou expirou."""
+        db_data = self.existing_listings.get(current_id)
+        if db_data is None:
+            return True
+        db_price, last_day = db_data
+        price_changed = db_price != price_val
+        return price_changed or self.is_stale(last_day, today)
+
+    def is_stale(self, last_day, today):
+        return last_day == NO_DAY or (today - last_day) >= self.ttl_days
             
+    # ------------------------------
+    # CRAWL DISTRIBUÍDO (FILA EM POSTGRES)
+    # ------------------------------
+    def open_work_queue(self, settings):
+        crawl_id = getattr(self, 'crawl_id', None) or datetime.now().strftime('%Y-%m-%d')
+        worker_id = getattr(self, 'worker_id', None) or f"{socket.gethostname()}-{os.getpid()}"
+        self.queue = WorkQueue(
+            self.connect_db(), crawl_id, worker_id,
+            lease_seconds=settings.getint('QUEUE_LEASE_SECONDS', 300),
+            max_attempts=settings.getint('QUEUE_MAX_ATTEMPTS', 3),
+        )
+        self.queue.create_table()
+        self.queue_pool = ThreadPool(minthreads=1, maxthreads=1, name='work-queue')
+        self.queue_pool.start()
+        self.heartbeat_loop = task.LoopingCall(self.send_heartbeat)
+        self.heartbeat_loop.start(settings.getfloat('QUEUE_HEARTBEAT_INTERVAL', 60), now=False)
+        self.logger.info(f"📮 Modo distribuído: crawl '{crawl_id}', worker '{worker_id}'.")
+
+    def queue_call(self, func, *args):
+        """Chamada à fila no thread da fila: o round-trip ao Postgres não bloqueia o reactor."""
+        return threads.deferToThreadPool(reactor, self.queue_pool, func, *args)
+
+    async def queue_await(self, func, *args):
+        return await maybe_deferred_to_future(self.queue_call(func, *args))
+
+    def close_work_queue(self):
+        released = self.queue.release()
+        self.logger.info(f"📮 Fila: {released} tarefas devolvidas. Estado: {self.queue.counts()}")
+        self.queue.close()
+
+    def request_to_task(self, request):
+        """Pedido gerado pelo spider -> tarefa (kind, url, payload, priority) para a fila."""
+        if request.callback == self.parse:
+            return 'listing', request.url, {'page_number': request.meta.get('page_number', 1)}, request.priority
+        return 'detail', request.url, request.cb_kwargs, request.priority
+
+    def task_request(self, task_id, kind, url, payload):
+        """Tarefa reclamada -> pedido Scrapy, com o ID da tarefa na meta."""
+        if kind == 'listing':
+            request = self.make_listing_request(url, payload.get('page_number', 1))
+        else:
+            request = self.make_detail_request(url, payload)
+        return self.bind_task(request, task_id)
+
+    def bind_task(self, request, task_id):
+        request.meta['task_id'] = task_id
+        request.meta['task_callback'] = request.callback.__name__
+        request.callback = self.parse_task
+        request.errback = self.errback_task
+        request.dont_filter = True  # A deduplicação é feita pela fila (UNIQUE), não pelo dupefilter local
+        return request
+
+    def claim_size(self):
+        """Tamanho do próximo lote: 0 enquanto o worker tiver tarefas em curso suficientes."""
+        batch = self.settings.getint('QUEUE_CLAIM_BATCH', 16)
+        if self.claiming or len(self.leased_tasks) > batch // 2:
+            return 0
+        return batch - len(self.leased_tasks)
+
+    def claimed_requests(self, claimed):
+        for task_id, kind, url, payload, attempts in claimed:
+            self.leased_tasks.add(task_id)
+            if attempts > 1:
+                self.logger.warning(f"🔁 Tarefa {task_id} ({kind}) reclamada pela {attempts}ª vez: {url}")
+            yield self.task_request(task_id, kind, url, payload)
+
+    async def claim_tasks(self):
+        """Reclama um lote de tarefas quando o worker tem poucas em curso."""
+        limit = self.claim_size()
+        if not limit:
+            return
+        self.claiming = True
+        try:
+            claimed = await self.queue_await(self.queue.claim, limit)
+        except Exception as e:
+            self.logger.warning(f"⚠️ Falha ao reclamar tarefas: {e}")
+            return
+        finally:
+            self.claiming = False
+        for request in self.claimed_requests(claimed):
+            yield request
+
+    async def parse_task(self, response, **kwargs):
+        """Corre o callback original; os pedidos novos vão para a fila e a tarefa fica concluída.
+        Se o callback ou a fila falharem, a tarefa é dada como falhada (volta à fila)."""
+        request = response.request
+        task_id = request.meta['task_id']
+        callback = getattr(self, request.meta['task_callback'])
+        results, tasks, continued = [], [], False
+        try:
+            for result in callback(response, **kwargs) or ():
+                if not isinstance(result, scrapy.Request):
+                    results.append(result)
+                elif result.meta.get('task_id') == task_id:
+                    # Mesma tarefa (fallback Playwright do modo híbrido), mesmo que o detalhe tenha redirecionado
+                    continued = True
+                    results.append(self.bind_task(result, task_id))
+                else:
+                    tasks.append(self.request_to_task(result))
+            await self.queue_await(self.queue.enqueue, tasks)
+            if not continued:
+                await self.queue_await(self.queue.complete, task_id)
+                self.leased_tasks.discard(task_id)
+        except Exception as e:
+            # Os items desta resposta saem na próxima tentativa (o upsert é idempotente)
+            self.crawler.stats.inc_value('queue/task_error')
+            await self.fail_task(request, e)
+        else:
+            for result in results:
+                yield result
+        async for request in self.claim_tasks():
+            yield request
+
+    async def errback_task(self, failure):
+        """A tarefa volta à fila até esgotar QUEUE_MAX_ATTEMPTS (noutro worker, se calhar)."""
+        self.crawler.stats.inc_value('errback/task')
+        await self.fail_task(failure.request, failure.value)
+        async for request in self.claim_tasks():
+            yield request
+
+    async def fail_task(self, request, error):
+        task_id = request.meta['task_id']
+        self.leased_tasks.discard(task_id)  # Sai do heartbeat: se a fila falhar, a lease expira sozinha
+        try:
+            status = await self.queue_await(self.queue.fail, task_id, error)
+            if status == 'failed' and request.meta['task_callback'] == 'parse':
+                # Página perdida de vez: a paginação em série tem de continuar
+                pages = [self.request_to_task(r) for r in self.advance_pagination(request.url, request.meta.get('page_number', 1))]
+                await self.queue_await(self.queue.enqueue, pages)
+        except Exception as e:
+            self.logger.error(f"❌ Tarefa {task_id} falhou ({error}) e a fila não a registou: {e}")
+            return
+        self.logger.error(f"❌ Tarefa {task_id} falhou ({status}): {request.url} | {error}")
+
+    def send_heartbeat(self):
+        # O LoopingCall espera pelo Deferred: nunca há dois heartbeats em simultâneo
+        d = self.queue_call(self.queue.heartbeat, list(self.leased_tasks))
+        d.addErrback(lambda f: self.logger.warning(f"⚠️ Falha no heartbeat da fila: {f.value}"))
+        return d
+
+    def spider_idle(self, spider):
+        """Sem pedidos locais: reclama mais tarefas; só fecha quando a fila estiver vazia."""
+        if self.idle_check is None:
+            if not self.queue_open:
+                return  # A fila do crawl esvaziou (em todos os workers): o spider pode fechar
+            self.idle_check = self.queue_call(self.claim_or_count, self.claim_size())
+            self.idle_check.addCallbacks(self.idle_claimed, self.idle_failed)
+        raise DontCloseSpider
+
+    def claim_or_count(self, limit):
+        """No thread da fila: reclama um lote e, se vier vazio, vê se ainda há tarefas abertas."""
+        claimed = self.queue.claim(limit) if limit else []
+        return claimed, bool(claimed) or self.queue.has_open_tasks()
+
+    def idle_claimed(self, result):
+        claimed, self.queue_open = result
+        self.idle_check = None
+        for request in self.claimed_requests(claimed):
+            self.crawler.engine.crawl(request)
+
+    def idle_failed(self, failure):
+        self.idle_check = None
+        self.logger.warning(f"⚠️ Falha ao consultar a fila: {failure.value}")
+
     # ------------------------------
     # FUNÇÕES AUXILIARES DE EXTRAÇÃO
     # ------------------------------
     def clean_num_str(self, raw_str):
         """Função genérica para limpar números e converter para float."""
         if not raw_str: return 0.0
-        clean = re.sub(r'[^\d]', '', raw_str)
+        clean = NON_DIGIT_RE.sub('', raw_str)
         return float(clean) if clean else 0.0
         
     def extract_area(self, card):
@@ -95,23 +351,89 @@ class RemaxSpider(scrapy.Spider):
         loc = card.css('p.text-ellipsis::text').get()
         return loc.split(',')[0].strip() if loc else "Desconhecido"
 
-    def get_next_page_url(self, current_url):
-        """Cálculo do URL da próxima página."""
-        parsed_url = urlparse(current_url)
+    def page_url(self, url, page):
+        """URL da listagem com o parâmetro ?p= trocado pela página pedida."""
+        parsed_url = urlparse(url)
         query_params = parse_qs(parsed_url.query)
-        current_page = int(query_params.get('p', [1])[0])
-        query_params['p'] = [str(current_page + 1)]
+        query_params['p'] = [str(page)]
         new_query = urlencode(query_params, doseq=True)
         return urlunparse((parsed_url.scheme, parsed_url.netloc, parsed_url.path, parsed_url.params, new_query, parsed_url.fragment))
 
+    def get_next_page_url(self, current_url):
+        """Cálculo do URL da próxima página."""
+        current_page = int(parse_qs(urlparse(current_url).query).get('p', [1])[0])
+        return self.page_url(current_url, current_page + 1)
+
+    def listing_key(self, url):
+        """Identifica a pesquisa (start URL) independentemente da página."""
+        parsed_url = urlparse(url)
+        query_params = parse_qs(parsed_url.query)
+        query_params.pop('p', None)
+        return urlunparse(parsed_url._replace(query=urlencode(sorted(query_params.items()), doseq=True)))
+
+    def extract_total_pages(self, response):
+        """Número total de páginas lido da paginação MUI ("Go to page 450")."""
+        labels = response.css('button[aria-label^="Go to page"]::attr(aria-label)').getall()
+        pages = [int(m.group(1)) for m in (PAGE_LABEL_RE.search(label) for label in labels) if m]
+        return max(pages) if pages else None
+
     # ------------------------------
     # START REQUESTS
     # ------------------------------
+    async def start(self):
+        # Scrapy >= 2.13 só chama start(); start_requests() fica para as versões anteriores
+        if self.queue is not None:
+            # Semear é idempotente: só o primeiro worker insere a página 1 de cada pesquisa.
+            # As tarefas chegam pelo spider_idle, que reclama o primeiro lote.
+            self.start_time = time.time()
+            await self.queue_await(self.queue.enqueue, self.seed_tasks())
+            return
+        for request in self.start_requests():
+            yield request
+
+    def seed_tasks(self):
+        return [self.request_to_task(self.make_listing_request(url, page_number=1)) for url in self.start_urls]
+
     def start_requests(self):
         self.start_time = time.time()
+        if self.queue is not None:
+            self.queue.enqueue(self.seed_tasks())  # Scrapy < 2.13: sem start() assíncrono
+            return
+        if self.checkpoint and self.resume:
+            yield from self.resume_requests()
+            return
+        if self.checkpoint:
+            self.checkpoint.clear()
         for url in self.start_urls:
             yield self.make_listing_request(url, page_number=1)
 
+    def resume_requests(self):
+        """Reconstrói os pedidos a partir do checkpoint (páginas em falta + detalhes pendentes)."""
+        state = self.checkpoint.load()
+        if state is None:
+            self.logger.warning("⚠️ Sem checkpoint para retomar. A começar do início.")
+            state = ({}, {})
+        self.pagination, pending = state
+        self.logger.info(
+            f"⏯️ A retomar: {sum(len(s['done']) for s in self.pagination.values())} páginas já feitas, "
+            f"{len(pending)} detalhes pendentes."
+        )
+
+        for url in self.start_urls:
+            search = self.pagination.get(self.listing_key(url))
+            if search is None or not search['done']:
+                self.pagination.pop(self.listing_key(url), None)
+                yield self.make_listing_request(url, page_number=1)
+            elif search['total']:
+                yield from self.next_listing_requests(search['url'], self.pagination_window or search['total'])
+            else:
+                # Paginação em série: continua a seguir à última página feita
+                next_page = max(search['done']) + 1
+                yield self.make_listing_request(self.page_url(search['url'], next_page), next_page)
+
+        for url, cb_kwargs in pending.items():
+            yield self.make_detail_request(url, cb_kwargs)
+
     def make_listing_request(self, url, page_number):
         """Cria o pedido com 'rede de segurança' (errback) e Prioridade Alta (100)."""
         return scrapy.Request(
@@ -121,10 +443,7 @@ class RemaxSpider(scrapy.Spider):
             priority=100, # ALTA PRIORIDADE: Processar todas as páginas de listagem primeiro
             meta={
                 "playwright": True,
-                "playwright_context_kwargs": {
-                    "ignore_https_errors": True,
-                    "viewport": {"width": 1920, "height": 1080}
-                },
+                "playwright_context_kwargs": self.settings.getdict('PLAYWRIGHT_CONTEXT_KWARGS'),
                 "playwright_page_methods": [
                     PageMethod("wait_for_load_state", "networkidle"),
                     PageMethod("wait_for_selector", 'div.grid div[id^="listing-list-card-"]', timeout=60000)
@@ -133,23 +452,143 @@ class RemaxSpider(scrapy.Spider):
             }
         )
         
+    def make_detail_request(self, url, cb_kwargs, render=False):
+        """Pedido de detalhe. Em modo 'hybrid' vai primeiro pelo HTTP simples (sem Chromium)."""
+        if self.checkpoint:
+            self.pending_details[url] = cb_kwargs
+            self.detail_requests[url] += 1
+        meta = {}
+        if render or self.detail_fetch_mode == 'playwright':
+            meta = {
+                "playwright": True,
+                "playwright_page_methods": [PageMethod("wait_for_load_state", "networkidle")],
+            }
+        return scrapy.Request(
+            url=url,
+            callback=self.parse_remax_imovel,
+            errback=self.errback_detail,
+            priority=10, # PRIORIDADE BAIXA: Processar depois de toda a paginação
+            cb_kwargs=cb_kwargs,
+            meta=meta,
+            dont_filter=render, # O fallback repete um URL já visto
+        )
+
+    def errback_detail(self, failure):
+        self.logger.error(f"❌ Falha no detalhe {failure.request.url}: {failure.value}")
+        self.crawler.stats.inc_value('errback/detail')
+        self.forget_detail(failure.request)
+
+    def forget_detail(self, request):
+        """Detalhe recolhido ou perdido: sai dos pendentes do checkpoint."""
+        url = request.meta.get('redirect_urls', [request.url])[0]  # URL pedido, antes de redirects
+        self.pending_details.pop(url, None)
+        self.detail_requests.pop(url, None)
+
+    def request_dropped(self, request, spider):
+        """O dupefilter recusou o pedido: se não há outro pedido em aberto para o mesmo
+        detalhe, sai dos pendentes (senão cada retoma voltava a agendá-lo)."""
+        if request.callback != self.parse_remax_imovel:
+            return
+        url = request.meta.get('redirect_urls', [request.url])[0]
+        self.detail_requests[url] -= 1
+        if self.detail_requests[url] <= 0:
+            self.forget_detail(request)
+
+    def detail_has_data(self, response):
+        """O HTML servido já traz a descrição ou as áreas? (Senão, a página precisa de JS.)"""
+        return bool(
+            response.css('#description .custom-description')
+            or response.xpath("//span[contains(text(), 'Área Bruta')]")
+        )
+
+    def log_fast_path_rate(self):
+        stats = self.crawler.stats
+        hits = stats.get_value('detail/fast_path/hit', 0)
+        misses = stats.get_value('detail/fast_path/miss', 0)
+        if hits + misses:
+            rate = hits / (hits + misses)
+            stats.set_value('detail/fast_path/hit_rate', round(rate, 4))
+            self.logger.info(f"⚡ Fast path (HTTP sem Playwright): {hits}/{hits + misses} detalhes ({rate:.1%})")
+
     def errback_pagination(self, failure):
-        """O PLANO B: Se a página falhar (TimeoutError), salta para a próxima!"""
-        page_num = failure.request.meta.get('page_number', 1)
+        """O PLANO B: Se a página falhar (TimeoutError), tenta-a de novo; só depois desiste dela."""
+        request = failure.request
+        page_num = request.meta.get('page_number', 1)
+        retries = request.meta.get('pagination_retries', 0)
         self.logger.error(f"❌ ERRO CRÍTICO na Página {page_num}: {failure.value}")
-        
-        next_page = page_num + 1
-        self.logger.warning(f"⚠️ Recuperação: A saltar para a página {next_page}...")
-        
-        current_url = failure.request.url
-        parsed = urlparse(current_url)
-        qs = parse_qs(parsed.query)
-        qs['p'] = [str(next_page)]
-        new_query = urlencode(qs, doseq=True)
-        next_url = urlunparse((parsed.scheme, parsed.netloc, parsed.path, parsed.params, new_query, parsed.fragment))
-        
-        # A requisição de recuperação também usa make_listing_request (priority=100)
-        yield self.make_listing_request(next_url, next_page)
+        self.crawler.stats.inc_value('errback/pagination')
+
+        if retries < self.pagination_max_retries:
+            self.logger.warning(f"⚠️ Recuperação: A repetir a página {page_num} ({retries + 1}/{self.pagination_max_retries})...")
+            retry = self.make_listing_request(request.url, page_num)
+            retry.meta['pagination_retries'] = retries + 1
+            retry.dont_filter = True
+            yield retry
+            return
+
+        self.logger.warning(f"⚠️ Página {page_num} abandonada após {retries} repetições.")
+        yield from self.advance_pagination(request.url, page_num)
+
+    # ------------------------------
+    # PAGINAÇÃO EM LEQUE (FAN-OUT)
+    # ------------------------------
+    def schedule_pagination(self, response, page_num):
+        """Na 1ª página lê o total e agenda as seguintes em paralelo; depois repõe a janela."""
+        key = self.listing_key(response.url)
+        if key not in self.pagination:
+            total = self.extract_total_pages(response)
+            self.pagination[key] = {'url': response.url, 'total': total, 'next_page': page_num + 1, 'done': set()}
+            if total:
+                if self.queue is not None and page_num > 1:
+                    return  # Distribuído: quem leu a página 1 já pôs as restantes na fila
+                window = self.pagination_window or total
+                self.logger.info(f"📚 {total} páginas de listagem. A agendar em paralelo (janela: {window})...")
+                yield from self.next_listing_requests(response.url, window)
+                return
+        elif self.pagination[key]['total']:
+            # Uma página da janela terminou: entra a seguinte
+            if self.pagination_window:
+                yield from self.next_listing_requests(response.url, 1)
+            return
+
+        # Sem total conhecido: encadeamento em série pelo botão "seguinte"
+        next_button = response.css('button[aria-label="Go to next page"]')
+        if next_button and 'Mui-disabled' not in next_button.attrib.get('class', ''):
+            next_page = page_num + 1
+            next_url = self.get_next_page_url(response.url)
+            self.logger.info(f"➡️ A avançar para página {next_page}...")
+            # A chamada a make_listing_request já tem a prioridade alta (100)
+            yield self.make_listing_request(next_url, next_page)
+        else:
+            self.logger.info("🏁 Última página atingida.")
+
+    def next_listing_requests(self, url, count):
+        """Agenda até `count` páginas ainda não pedidas desta pesquisa."""
+        state = self.pagination[self.listing_key(url)]
+        scheduled = 0
+        while scheduled < count:
+            page = state['next_page']
+            if page > state['total']:
+                return
+            state['next_page'] += 1
+            if page in state['done']:
+                continue  # Já feita antes do crash (retoma)
+            scheduled += 1
+            yield self.make_listing_request(self.page_url(url, page), page)
+
+    def advance_pagination(self, url, page_num):
+        """Depois de uma página perdida (erro ou 404), a paginação continua."""
+        state = self.pagination.get(self.listing_key(url))
+        if state and state['total']:
+            if self.pagination_window:
+                yield from self.next_listing_requests(url, 1)
+        else:
+            next_page = page_num + 1
+            self.logger.warning(f"⚠️ Recuperação: A saltar para a página {next_page}...")
+            yield self.make_listing_request(self.page_url(url, next_page), next_page)
+
+    def total_pages(self):
+        return sum(state['total'] or 0 for state in self.pagination.values())
 
     # ------------------------------
     # PARSE DA LISTA (Com Lógica TTL)
@@ -158,136 +597,108 @@ class RemaxSpider(scrapy.Spider):
         page_num = response.meta.get('page_number', 1)
         if response.status == 404:
             self.logger.error(f"404 Not Found: {response.url}")
+            state = self.pagination.get(self.listing_key(response.url))
+            if state and state['total']:
+                yield from self.advance_pagination(response.url, page_num)
             return
 
         cards = response.css('a[data-id="listing-card-link"]')
         num_cards = len(cards)
         self.pages_processed += 1
 
-        # Estimativa de progresso (Log)
-        elapsed = time.time() - self.start_time
-        avg_time = elapsed / self.pages_processed
-        pages_left = max(0, 450 - self.pages_processed) 
-        eta_min = int((avg_time * pages_left) // 60)
-        self.logger.info(f"✅ Pág {page_num} | Items: {num_cards} | ETA: ~{eta_min} min")
+        # PAGINAÇÃO (antes dos detalhes, para a janela de listagens nunca esvaziar)
+        yield from self.schedule_pagination(response, page_num)
+
+        # Estimativa de progresso (Log) com o total real de páginas
+        total_pages = self.total_pages()
+        if total_pages:
+            elapsed = time.time() - self.start_time
+            avg_time = elapsed / self.pages_processed
+            pages_left = max(0, total_pages - self.pages_processed)
+            eta_min = int((avg_time * pages_left) // 60)
+            self.logger.info(f"✅ Pág {page_num} | Items: {num_cards} | {self.pages_processed}/{total_pages} págs | ETA: ~{eta_min} min")
+        else:
+            self.logger.info(f"✅ Pág {page_num} | Items: {num_cards}")
 
-        TTL_DAYS = 7 
-        now = datetime.now()
+        today = epoch_day(datetime.now())
 
+        listings = []
         for card in cards:
             link_relativo = card.attrib.get('href')
             if not link_relativo: continue
 
             full_link = link_relativo if link_relativo.startswith('http') else f"https://remax.pt{link_relativo}"
-            id_match = re.search(r'/(\d+-\d+)$', full_link)
-            current_id = id_match.group(1) if id_match else None
-            
+            current_id = extract_url_id(full_link)
+            listings.append((card, full_link, current_id))
+
+        # Modo lazy: uma única query indexada para todos os IDs da página
+        try:
+            self.existing_listings.prefetch([current_id for _, _, current_id in listings])
+        except Exception as e:
+            self.logger.warning(f"⚠️ Erro ao consultar cache TTL da página {page_num}: {e}")
+
+        price_rows = []
+        for card, full_link, current_id in listings:
             price_val = self.extract_price(card)
             area_val = self.extract_area(card)
             freguesia_val = self.extract_freguesia(card)
 
+            # --- PRICE SWEEP: imóvel conhecido e dentro do TTL -> só o preço do cartão ---
+            if self.mode == 'price_sweep':
+                db_data = self.existing_listings.get(current_id)
+                if db_data is not None and not self.is_stale(db_data[1], today):
+                    if price_val:
+                        price_rows.append((current_id, price_val))
+                        if price_val != db_data[0]:
+                            self.crawler.stats.inc_value('sweep/price_changed')
+                    continue
+
             # --- LÓGICA DE DECISÃO TTL (PULA SE NÃO HOUVE ALTERAÇÃO) ---
-            should_scrape = True
-            if current_id in self.existing_listings:
-                db_data = self.existing_listings[current_id]
-                price_changed = db_data['price'] != price_val
-                last_date = db_data['date']
-                days_since = 999
-                
-                if last_date:
-                    try:
-                        if isinstance(last_date, str):
-                            last_date = datetime.strptime(last_date.split('.')[0], '%Y-%m-%d %H:%M:%S')
-                        days_since = (now.date() - last_date.date()).days
-                    except ValueError:
-                        pass
-                
-                is_stale = days_since >= TTL_DAYS
-
-                if not price_changed and not is_stale:
-                    should_scrape = False
-            
-            if not should_scrape:
+            if not self.should_scrape(current_id, price_val, today):
+                self.crawler.stats.inc_value('ttl/skipped')
                 continue # Pula a visita ao detalhe
+            self.crawler.stats.inc_value('ttl/scheduled')
+
+            yield self.make_detail_request(full_link, {
+                'area': area_val, 'price': price_val, 
+                'freguesia': freguesia_val, 'link_completo': full_link,
+                'page_number': page_num # PASSADO PARA O LOG
+            })
+
+        if price_rows:
+            self.crawler.stats.inc_value('sweep/price_rows', len(price_rows))
+            yield PriceBatchItem(rows=price_rows, seen_at=str(datetime.now()), listing_page_number=page_num)
+
+        # CHECKPOINT: página concluída (os detalhes dela já estão em pending_details)
+        search = self.pagination.get(self.listing_key(response.url))
+        if search is not None:
+            search['done'].add(page_num)
+        if self.checkpoint:
+            self.checkpoint.maybe_save(self.pagination, self.pending_details)
 
-            yield response.follow(
-                full_link,
-                callback=self.parse_remax_imovel,
-                priority=10, # PRIORIDADE BAIXA: Processar depois de toda a paginação
-                cb_kwargs={
-                    'area': area_val, 'price': price_val, 
-                    'freguesia': freguesia_val, 'link_completo': full_link,
-                    'page_number': page_num # PASSADO PARA O LOG
-                }
-            )
-
-        # PAGINAÇÃO
-        next_button = response.css('button[aria-label="Go to next page"]')
-        if next_button and 'Mui-disabled' not in next_button.attrib.get('class', ''):
-            next_page = page_num + 1
-            next_url = self.get_next_page_url(response.url)
-            self.logger.info(f"➡️ A avançar para página {next_page}...")
-            # A chamada a make_listing_request já tem a prioridade alta (100)
-            yield self.make_listing_request(next_url, next_page)
-        else:
-            self.logger.info("🏁 Última página atingida.")
 
     # ------------------------------
     # PARSE DO DETALHE (Extração de todos os campos brutos)
     # ------------------------------
     def parse_remax_imovel(self, response, area, price, freguesia, link_completo, page_number):
-        item = ImovelItem()
-        item['preco_atual'] = price
-        item['area_bruta_m2'] = area
-        item['freguesia'] = freguesia
-        item['link'] = link_completo
-
-        def clean_num(text):
-            if not text: return 0
-            clean = re.sub(r'[^\d]', '', text)
-            return int(clean) if clean else 0
-
-        def get_detail(label):
-            return response.xpath(f"//span[contains(text(), '{label}')]/following-sibling::span/text()").get()
-
-        # EXTRAÇÃO DA DESCRIÇÃO COMPLETA (CRÍTICO PARA O FILTRO TIMESHARE)
-        desc_list = response.css('#description .custom-description *::text').getall()
-        item['descricao_bruta'] = " ".join(desc_list).strip()
-
-        # Áreas Detalhadas e Priorização
-        area_priv = get_detail("Área Bruta Privativa")
-        area_bruta = get_detail("Área Bruta")
-        item['area_terreno_m2'] = clean_num(get_detail("Área Total do Lote"))
-        item['area_util_m2'] = clean_num(get_detail("Área Útil"))
-        
-        if area_priv: item['area_bruta_m2'] = clean_num(area_priv)
-        elif area_bruta: item['area_bruta_m2'] = clean_num(area_bruta)
-
-        # Detalhes Técnicos
-        item['ano_construcao'] = clean_num(get_detail("Ano de Construção"))
-        item['num_quartos'] = clean_num(get_detail("Quartos"))
-        item['num_wc'] = clean_num(get_detail("WC") or get_detail("Casas de banho"))
-        item['estacionamento'] = get_detail("Estacionamento")
-        item['elevador'] = get_detail("Elevador")
-        
-        # Tipologia e Certificado Energético
-        page_title = response.css('title::text').get()
-        item['tipologia'] = 'Desconhecida'
-        if page_title:
-            m = re.search(r'([A-Za-z]+)\s+(T\d+)', page_title)
-            if m: item['tipologia'] = f"{m.group(1)} {m.group(2)}".strip()
-            else: 
-                tm = re.search(r'Venda-\s*([A-Za-z]+)', page_title)
-                if tm: item['tipologia'] = tm.group(1).strip()
-
-        item['certificado_energetico'] = response.xpath("//*[contains(text(), 'Eficiência energética')]/following-sibling::span//img/@alt").get()
-
-        # DADOS DE CONTROLO
-        id_match = re.search(r'/(\d+-\d+)$', response.url)
-        item['url_id'] = id_match.group(1) if id_match else response.url
-        item['data_publicacao'] = str(datetime.now().date())
-        item['last_crawled'] = str(datetime.now())
-        item['listing_page_number'] = page_number # ADICIONADO PARA O LOG
-        
+        # MODO HÍBRIDO: se o HTML simples não traz os dados, repete com Playwright
+        if self.detail_fetch_mode == 'hybrid' and not response.meta.get('playwright'):
+            if self.detail_has_data(response):
+                self.crawler.stats.inc_value('detail/fast_path/hit')
+            elif response.status != 404:
+                self.crawler.stats.inc_value('detail/fast_path/miss')
+                self.logger.debug(f"🎭 Sem dados no HTML, a renderizar com Playwright: {response.url}")
+                self.forget_detail(response.request)  # O pedido renderizado volta a registá-lo (URL final)
+                fallback = self.make_detail_request(response.url, {
+                    'area': area, 'price': price, 'freguesia': freguesia,
+                    'link_completo': link_completo, 'page_number': page_number
+                }, render=True)
+                if 'task_id' in response.meta:
+                    fallback.meta['task_id'] = response.meta['task_id']  # Continua a tarefa da fila
+                yield fallback
+                return
+
+        item = parse_detail(response, area, price, freguesia, link_completo, page_number)
+        self.forget_detail(response.request)
         self.items_processed += 1
         yield item
\ No newline at end of file
@@ -0,0 +1,149 @@
+import argparse
+import glob
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+# =========================================================================
+# SPOOL LOCAL (WRITE-BEHIND) PARA A ESCRITA NA BD
+# =========================================================================
+# Os items vão primeiro para disco, em segmentos JSON lines só de escrita no
+# fim ("00000042.jl"). O segmento atual é selado quando passa o tamanho
+# máximo (ou quando o drainer o pede) e só os selados são lidos e apagados
+# depois de gravados no Postgres. Um crash a meio de uma linha deixa uma
+# linha cortada no fim do segmento, que é ignorada na leitura.
+
+
+class Spool:
+    """Fila em disco de registos {"kind": ..., "data": ...}.
+
+    Os bytes por drenar são contados em memória (append/seal/remove/quarantine),
+    sem ler o disco a cada item. O fsync é feito ao selar e em sync(), que o
+    pipeline chama a cada SPOOL_FSYNC_INTERVAL segundos: num crash do SO perde-se
+    no máximo esse intervalo; num crash do processo não se perde nada (flush).
+    """
+
+    def __init__(self, directory, segment_bytes=8 * 1024 * 1024, fsync=True):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        os.makedirs(directory, exist_ok=True)
+        existing = self.segments()
+        # Segmentos de execuções anteriores ficam selados; escreve-se sempre num novo
+        self.next_seq = int(os.path.basename(existing[-1]).split('.')[0]) + 1 if existing else 0
+        self.current = None
+        self.current_path = None
+        self.current_bytes = 0
+        self.unsynced = False
+        # remove/quarantine correm no thread do drainer; append/seal no reactor
+        self.lock = threading.Lock()
+        self.sealed = {path: os.path.getsize(path) for path in existing}  # segmento -> bytes
+        self.sealed_bytes = sum(self.sealed.values())
+
+    def segments(self):
+        return sorted(glob.glob(os.path.join(self.directory, '*.jl')))
+
+    def sealed_segments(self):
+        with self.lock:
+            return sorted(self.sealed)
+
+    @property
+    def pending_bytes(self):
+        """Bytes por drenar (segmento atual + selados), sem ir ao disco."""
+        return self.current_bytes + self.sealed_bytes
+
+    def append(self, records):
+        if self.current is None:
+            self.current_path = os.path.join(self.directory, f"{self.next_seq:08d}.jl")
+            self.next_seq += 1
+            self.current = open(self.current_path, 'a', encoding='utf-8')
+        data = ''.join(json.dumps(record, ensure_ascii=False, default=str) + '\n' for record in records)
+        self.current.write(data)
+        self.current.flush()
+        self.unsynced = True
+        self.current_bytes += len(data.encode('utf-8'))
+        if self.current_bytes >= self.segment_bytes:
+            self.seal()
+
+    def sync(self):
+        """fsync do segmento atual, se houver escritas desde o último."""
+        if self.fsync and self.unsynced and self.current is not None:
+            os.fsync(self.current.fileno())
+        self.unsynced = False
+
+    def seal(self):
+        """Fecha o segmento atual; passa a poder ser drenado."""
+        if self.current is None:
+            return
+        self.sync()
+        self.current.close()
+        with self.lock:
+            self.sealed[self.current_path] = self.current_bytes
+            self.sealed_bytes += self.current_bytes
+        self.current = None
+        self.current_path = None
+        self.current_bytes = 0
+
+    def forget(self, path):
+        with self.lock:
+            self.sealed_bytes -= self.sealed.pop(path, 0)
+
+    def read(self, path):
+        """Registos de um segmento selado (linhas cortadas por um crash são ignoradas)."""
+        records = []
+        with open(path, encoding='utf-8') as f:
+            for n, line in enumerate(f, 1):
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    logger.warning(f"⚠️ SPOOL: linha {n} de {path} cortada/ilegível, ignorada.")
+        return records
+
+    def remove(self, path):
+        os.remove(path)
+        self.forget(path)
+
+    def quarantine(self, path):
+        """Tira um segmento da fila sem o apagar (fica em quarantine/ para análise)."""
+        directory = os.path.join(self.directory, 'quarantine')
+        os.makedirs(directory, exist_ok=True)
+        target = os.path.join(directory, os.path.basename(path))
+        os.replace(path, target)
+        self.forget(path)
+        return target
+
+    def close(self):
+        self.seal()
+
+
+# =========================================================================
+# CLI: drenar o spool sem correr o crawl
+# =========================================================================
+
+if __name__ == "__main__":
+    from scrapy import Spider
+    from scrapy.utils.project import get_project_settings
+    from MLEngine.pipelines import SpooledPostgresPipeline, DB_DOWN_ERRORS
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(name)s] %(levelname)s: %(message)s')
+    settings = get_project_settings()
+    parser = argparse.ArgumentParser(description="Grava no Postgres os items que ficaram no spool.")
+    parser.add_argument('--dir', default=settings.get('SPOOL_DIR', 'spool'), help="Pasta do spool")
+    args = parser.parse_args()
+
+    spool = Spool(args.dir)
+    print(f"📦 Spool: {len(spool.segments())} segmentos, {spool.pending_bytes / 1024:.0f} KB")
+    pipeline = SpooledPostgresPipeline(settings)
+    pipeline.spool = spool
+    spider = Spider(name='spool')
+    try:
+        segments, changes, elapsed = pipeline.drain(spider)
+        print(f"✅ {segments} segmentos drenados em {elapsed:.1f}s ({pipeline.describe_changes(changes)}).")
+    except DB_DOWN_ERRORS as e:
+        print(f"❌ BD indisponível, o spool fica como está: {e}")
+    except Exception as e:
+        print(f"❌ Falha no drain (nova tentativa na próxima execução): {e}")
+    pipeline.close_connection(spider)
@@ -0,0 +1,175 @@
+import re
+from array import array
+from collections import OrderedDict
+from bisect import bisect_left
+from datetime import date, datetime
+
+# =========================================================================
+# ÍNDICE TTL COMPACTO (url_id -> preço, dia da última recolha)
+# =========================================================================
+# Os IDs da Remax têm o formato "126191014-51". Em vez de guardar uma string
+# e um dict por imóvel, o ID é empacotado num inteiro de 64 bits e as três
+# colunas ficam em arrays contíguos (8 + 8 + 4 bytes por imóvel).
+
+ID_RE = re.compile(r'^(\d{1,11})-(\d{1,7})$')
+ID_SHIFT = 24                   # 7 dígitos de sufixo cabem em 24 bits
+NO_DAY = -1                     # last_crawled NULL (conta sempre como expirado)
+EPOCH = date(1970, 1, 1)
+
+# O ORDER BY usa a mesma chave que pack_id(), por isso os arrays chegam já
+# ordenados e não é preciso reordenar em Python. IDs fora do formato vêm no fim.
+TTL_QUERY = f"""
+    SELECT url_id,
+           COALESCE(preco_atual, 0),
+           COALESCE(last_crawled::date - DATE '1970-01-01', {NO_DAY})
+    FROM imoveis
+    ORDER BY CASE WHEN url_id ~ '^[0-9]{{1,11}}-[0-9]{{1,7}}$'
+                  THEN split_part(url_id, '-', 1)::bigint * {1 << ID_SHIFT}
+                       + split_part(url_id, '-', 2)::bigint
+             END
+"""
+
+# Modo lazy: só as linhas dos cartões da página atual (usa a PRIMARY KEY).
+LOOKUP_QUERY = f"""
+    SELECT url_id,
+           COALESCE(preco_atual, 0),
+           COALESCE(last_crawled::date - DATE '1970-01-01', {NO_DAY})
+    FROM imoveis
+    WHERE url_id = ANY(%s)
+"""
+
+_MISSING = (None, None)         # marca "não está na BD" dentro do LRU
+
+
+def pack_id(url_id):
+    """Converte '126191014-51' num inteiro ordenável (None se fora do formato)."""
+    m = ID_RE.match(url_id) if isinstance(url_id, str) else None
+    if not m:
+        return None
+    return (int(m.group(1)) << ID_SHIFT) | int(m.group(2))
+
+
+def epoch_day(value):
+    """Dias desde 1970-01-01 para date/datetime/str ('%Y-%m-%d %H:%M:%S')."""
+    if value is None:
+        return NO_DAY
+    if isinstance(value, str):
+        try:
+            value = datetime.strptime(value.split('.')[0], '%Y-%m-%d %H:%M:%S')
+        except ValueError:
+            return NO_DAY
+    if isinstance(value, datetime):
+        value = value.date()
+    return (value - EPOCH).days
+
+
+class TTLIndex:
+    """Índice ordenado por ID empacotado, com pesquisa binária O(log n)."""
+
+    def __init__(self):
+        self._keys = array('q')
+        self._prices = array('d')
+        self._days = array('i')
+        self._extra = {}        # IDs que não seguem o formato (raros)
+        self._sorted = True
+
+    def __len__(self):
+        return len(self._keys) + len(self._extra)
+
+    @property
+    def nbytes(self):
+        return sum(a.itemsize * len(a) for a in (self._keys, self._prices, self._days))
+
+    def add(self, url_id, price, day):
+        key = pack_id(url_id)
+        if key is None:
+            self._extra[url_id] = (float(price or 0.0), day)
+            return
+        if self._keys and key <= self._keys[-1]:
+            self._sorted = False
+        self._keys.append(key)
+        self._prices.append(float(price or 0.0))
+        self._days.append(day)
+
+    def finalize(self):
+        """Reordena os arrays se as linhas não chegaram por ordem de chave."""
+        if self._sorted:
+            return
+        order = sorted(range(len(self._keys)), key=self._keys.__getitem__)
+        self._keys = array('q', (self._keys[i] for i in order))
+        self._prices = array('d', (self._prices[i] for i in order))
+        self._days = array('i', (self._days[i] for i in order))
+        self._sorted = True
+
+    def get(self, url_id):
+        """Devolve (preço, dia) ou None se o imóvel não está na BD."""
+        key = pack_id(url_id)
+        if key is None:
+            return self._extra.get(url_id)
+        i = bisect_left(self._keys, key)
+        if i < len(self._keys) and self._keys[i] == key:
+            return self._prices[i], self._days[i]
+        return None
+
+    def prefetch(self, url_ids):
+        """Nada a fazer: o índice eager já tem a tabela toda em memória."""
+
+    def close(self):
+        pass
+
+    @classmethod
+    def load(cls, conn, chunk_size=50000):
+        """Preenche o índice por blocos a partir de um cursor do lado do servidor."""
+        index = cls()
+        with conn.cursor(name='ttl_index') as cur:
+            cur.itersize = chunk_size
+            cur.execute(TTL_QUERY)
+            while True:
+                rows = cur.fetchmany(chunk_size)
+                if not rows:
+                    break
+                for url_id, price, day in rows:
+                    index.add(url_id, price, day)
+        index.finalize()
+        return index
+
+
+class LazyTTLLookup:
+    """Resolve os IDs de cada página numa única query, com um LRU entre páginas."""
+
+    def __init__(self, conn, max_size=20000):
+        self.conn = conn
+        self.conn.autocommit = True     # leituras avulsas, sem transação aberta
+        self.max_size = max_size
+        self.queries = 0
+        self._cache = OrderedDict()
+
+    def __len__(self):
+        return len(self._cache)
+
+    def prefetch(self, url_ids):
+        """Carrega para o LRU os IDs da página que ainda não conhecemos."""
+        missing = [i for i in dict.fromkeys(url_ids) if i is not None and i not in self._cache]
+        if not missing:
+            return
+        found = {}
+        with self.conn.cursor() as cur:
+            cur.execute(LOOKUP_QUERY, (missing,))
+            for url_id, price, day in cur:
+                found[url_id] = (float(price), day)
+        self.queries += 1
+        for url_id in missing:
+            self._cache[url_id] = found.get(url_id, _MISSING)
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+
+    def get(self, url_id):
+        """Devolve (preço, dia) ou None se o imóvel não está na BD (ou no LRU)."""
+        entry = self._cache.get(url_id)
+        if entry is None:
+            return None
+        self._cache.move_to_end(url_id)
+        return None if entry is _MISSING else entry
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,200 @@
+import argparse
+import json
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+# =========================================================================
+# FILA DE TRABALHO EM POSTGRES (CRAWL DISTRIBUÍDO)
+# =========================================================================
+# Páginas de listagem e detalhes passam a ser tarefas numa tabela. Cada
+# worker reclama um lote com FOR UPDATE SKIP LOCKED (nenhum worker fica à
+# espera dos locks de outro) e recebe uma "lease" com prazo. Se o worker
+# morrer, a lease expira e a tarefa volta a ser reclamável por outro.
+# O UNIQUE (crawl_id, kind, url) garante que cada detalhe é visitado uma vez.
+
+CREATE_TABLE = """
+    CREATE TABLE IF NOT EXISTS crawl_tasks (
+        id BIGSERIAL PRIMARY KEY,
+        crawl_id VARCHAR NOT NULL,
+        kind VARCHAR NOT NULL,              -- 'listing' | 'detail'
+        url TEXT NOT NULL,
+        payload JSONB NOT NULL DEFAULT '{}',
+        priority INTEGER NOT NULL DEFAULT 0,
+        status VARCHAR NOT NULL DEFAULT 'pending',  -- pending | leased | done | failed
+        lease_owner VARCHAR,
+        lease_expires TIMESTAMP,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        last_error TEXT,
+        created_at TIMESTAMP NOT NULL DEFAULT now(),
+        updated_at TIMESTAMP NOT NULL DEFAULT now(),
+        UNIQUE (crawl_id, kind, url)
+    );
+    CREATE INDEX IF NOT EXISTS crawl_tasks_claim_idx
+        ON crawl_tasks (crawl_id, status, priority DESC, id);
+"""
+
+ENQUEUE_QUERY = """
+    INSERT INTO crawl_tasks (crawl_id, kind, url, payload, priority)
+    VALUES %s
+    ON CONFLICT (crawl_id, kind, url) DO NOTHING
+"""
+
+# Pendentes ou com a lease expirada (worker morto), por prioridade.
+CLAIM_QUERY = """
+    UPDATE crawl_tasks
+    SET status = 'leased', lease_owner = %(worker)s,
+        lease_expires = now() + %(lease)s * interval '1 second',
+        attempts = attempts + 1, updated_at = now()
+    WHERE id IN (
+        SELECT id FROM crawl_tasks
+        WHERE crawl_id = %(crawl_id)s
+          AND (status = 'pending' OR (status = 'leased' AND lease_expires < now()))
+        ORDER BY priority DESC, id
+        LIMIT %(limit)s
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING id, kind, url, payload, attempts
+"""
+
+HEARTBEAT_QUERY = """
+    UPDATE crawl_tasks
+    SET lease_expires = now() + %s * interval '1 second', updated_at = now()
+    WHERE id = ANY(%s) AND lease_owner = %s AND status = 'leased'
+"""
+
+COMPLETE_QUERY = """
+    UPDATE crawl_tasks
+    SET status = 'done', lease_owner = NULL, lease_expires = NULL, updated_at = now()
+    WHERE id = %s AND lease_owner = %s
+"""
+
+# Volta a 'pending' até esgotar as tentativas; depois fica 'failed'.
+FAIL_QUERY = """
+    UPDATE crawl_tasks
+    SET status = CASE WHEN attempts >= %s THEN 'failed' ELSE 'pending' END,
+        lease_owner = NULL, lease_expires = NULL, last_error = %s, updated_at = now()
+    WHERE id = %s AND lease_owner = %s
+    RETURNING status
+"""
+
+# Worker a sair: as tarefas que ainda tinha voltam logo à fila (sem gastar tentativa).
+RELEASE_QUERY = """
+    UPDATE crawl_tasks
+    SET status = 'pending', lease_owner = NULL, lease_expires = NULL,
+        attempts = GREATEST(attempts - 1, 0), updated_at = now()
+    WHERE crawl_id = %s AND lease_owner = %s AND status = 'leased'
+"""
+
+COUNTS_QUERY = """
+    SELECT kind, status, count(*) FROM crawl_tasks
+    WHERE crawl_id = %s GROUP BY kind, status ORDER BY kind, status
+"""
+
+
+class WorkQueue:
+    """Fila de tarefas partilhada por vários workers `remax_imovel`."""
+
+    def __init__(self, conn, crawl_id, worker_id, lease_seconds=300, max_attempts=3):
+        self.conn = conn
+        self.conn.autocommit = True     # cada operação é a sua própria transação curta
+        self.crawl_id = crawl_id
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+    def create_table(self):
+        # Vários workers a arrancar ao mesmo tempo: o IF NOT EXISTS não chega (corrida no catálogo)
+        with self.conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_lock(hashtext('crawl_tasks'))")
+            try:
+                cur.execute(CREATE_TABLE)
+            finally:
+                cur.execute("SELECT pg_advisory_unlock(hashtext('crawl_tasks'))")
+
+    def enqueue(self, tasks):
+        """Insere tarefas (kind, url, payload, priority). As repetidas são ignoradas."""
+        rows = [(self.crawl_id, kind, url, json.dumps(payload), priority) for kind, url, payload, priority in tasks]
+        if not rows:
+            return 0
+        with self.conn.cursor() as cur:
+            execute_values(cur, ENQUEUE_QUERY, rows)
+            return cur.rowcount
+
+    def claim(self, limit):
+        """Reclama até `limit` tarefas. Devolve [(id, kind, url, payload, attempts)]."""
+        with self.conn.cursor() as cur:
+            cur.execute(CLAIM_QUERY, {
+                'worker': self.worker_id, 'lease': self.lease_seconds,
+                'crawl_id': self.crawl_id, 'limit': limit,
+            })
+            return cur.fetchall()
+
+    def heartbeat(self, task_ids):
+        """Prolonga a lease das tarefas ainda em curso neste worker."""
+        if not task_ids:
+            return 0
+        with self.conn.cursor() as cur:
+            cur.execute(HEARTBEAT_QUERY, (self.lease_seconds, list(task_ids), self.worker_id))
+            return cur.rowcount
+
+    def complete(self, task_id):
+        with self.conn.cursor() as cur:
+            cur.execute(COMPLETE_QUERY, (task_id, self.worker_id))
+
+    def fail(self, task_id, error):
+        """Devolve a tarefa à fila (ou marca 'failed'). Devolve o novo estado."""
+        with self.conn.cursor() as cur:
+            cur.execute(FAIL_QUERY, (self.max_attempts, str(error)[:1000], task_id, self.worker_id))
+            row = cur.fetchone()
+            return row[0] if row else None
+
+    def release(self):
+        """Devolve à fila todas as tarefas ainda reclamadas por este worker."""
+        with self.conn.cursor() as cur:
+            cur.execute(RELEASE_QUERY, (self.crawl_id, self.worker_id))
+            return cur.rowcount
+
+    def counts(self):
+        """{(kind, status): n} para este crawl."""
+        with self.conn.cursor() as cur:
+            cur.execute(COUNTS_QUERY, (self.crawl_id,))
+            return {(kind, status): n for kind, status, n in cur.fetchall()}
+
+    def has_open_tasks(self):
+        """Ainda há tarefas pendentes ou em curso (noutros workers)?"""
+        return any(status in ('pending', 'leased') for _, status in self.counts())
+
+    def close(self):
+        self.conn.close()
+
+
+# =========================================================================
+# CLI: estado da fila
+# =========================================================================
+
+if __name__ == "__main__":
+    from scrapy.utils.project import get_project_settings
+
+    parser = argparse.ArgumentParser(description="Estado da fila de tarefas do crawl distribuído.")
+    parser.add_argument('crawl_id', help="Identificador do crawl (ex: 2025-01-31)")
+    parser.add_argument('--retry-failed', action='store_true', help="Devolve as tarefas 'failed' à fila")
+    args = parser.parse_args()
+
+    settings = get_project_settings()
+    conn = psycopg2.connect(
+        host=settings.get('PGHOST'), user=settings.get('PGUSER'),
+        password=settings.get('PGPASSWORD'), dbname=settings.get('PGDATABASE'),
+        port=settings.get('PGPORT')
+    )
+    queue = WorkQueue(conn, args.crawl_id, worker_id='cli')
+    if args.retry_failed:
+        with conn.cursor() as cur:
+            cur.execute(
+                "UPDATE crawl_tasks SET status = 'pending', attempts = 0 WHERE crawl_id = %s AND status = 'failed'",
+                (args.crawl_id,)
+            )
+            print(f"🔁 {cur.rowcount} tarefas devolvidas à fila.")
+    for (kind, status), n in queue.counts().items():
+        print(f"{kind:8} {status:8} {n}")
+    queue.close()
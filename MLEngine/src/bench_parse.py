@@ -0,0 +1,131 @@
+"""
+Benchmark offline do parse das páginas de detalhe.
+
+Corre o extrator antigo (um XPath por etiqueta) e o novo (DetailFields, uma só
+passagem) sobre páginas HTML guardadas, confirma que o ImovelItem é igual e
+mostra o custo por página. A mesma paridade e um benchmark correm no pytest
+(tests/test_detail_parser.py, com pytest-benchmark).
+
+Uso:
+    cd MLEngine/src/
+    python bench_parse.py tests/fixtures/      # pasta com *.html guardados do site
+    python bench_parse.py pagina1.html pagina2.html --repeat 500
+"""
+import argparse
+import glob
+import os
+import re
+import time
+from datetime import datetime
+from scrapy.http import HtmlResponse
+from MLEngine.items import ImovelItem
+from MLEngine.detail_parser import parse_detail
+
+CB_KWARGS = {'area': 0, 'price': 0.0, 'freguesia': 'Desconhecido', 'link_completo': '', 'page_number': 1}
+IGNORED = ('data_publicacao', 'last_crawled')   # dependem do relógio
+
+
+def legacy_parse_detail(response, area, price, freguesia, link_completo, page_number):
+    """Cópia da implementação anterior do parse_remax_imovel (referência)."""
+    item = ImovelItem()
+    item['preco_atual'] = price
+    item['area_bruta_m2'] = area
+    item['freguesia'] = freguesia
+    item['link'] = link_completo
+
+    def clean_num(text):
+        if not text: return 0
+        clean = re.sub(r'[^\d]', '', text)
+        return int(clean) if clean else 0
+
+    def get_detail(label):
+        return response.xpath(f"//span[contains(text(), '{label}')]/following-sibling::span/text()").get()
+
+    desc_list = response.css('#description .custom-description *::text').getall()
+    item['descricao_bruta'] = " ".join(desc_list).strip()
+
+    area_priv = get_detail("Área Bruta Privativa")
+    area_bruta = get_detail("Área Bruta")
+    item['area_terreno_m2'] = clean_num(get_detail("Área Total do Lote"))
+    item['area_util_m2'] = clean_num(get_detail("Área Útil"))
+
+    if area_priv: item['area_bruta_m2'] = clean_num(area_priv)
+    elif area_bruta: item['area_bruta_m2'] = clean_num(area_bruta)
+
+    item['ano_construcao'] = clean_num(get_detail("Ano de Construção"))
+    item['num_quartos'] = clean_num(get_detail("Quartos"))
+    item['num_wc'] = clean_num(get_detail("WC") or get_detail("Casas de banho"))
+    item['estacionamento'] = get_detail("Estacionamento")
+    item['elevador'] = get_detail("Elevador")
+
+    page_title = response.css('title::text').get()
+    item['tipologia'] = 'Desconhecida'
+    if page_title:
+        m = re.search(r'([A-Za-z]+)\s+(T\d+)', page_title)
+        if m: item['tipologia'] = f"{m.group(1)} {m.group(2)}".strip()
+        else:
+            tm = re.search(r'Venda-\s*([A-Za-z]+)', page_title)
+            if tm: item['tipologia'] = tm.group(1).strip()
+
+    item['certificado_energetico'] = response.xpath("//*[contains(text(), 'Eficiência energética')]/following-sibling::span//img/@alt").get()
+
+    id_match = re.search(r'/(\d+-\d+)$', response.url)
+    item['url_id'] = id_match.group(1) if id_match else response.url
+    item['data_publicacao'] = str(datetime.now().date())
+    item['last_crawled'] = str(datetime.now())
+    item['listing_page_number'] = page_number
+    return item
+
+
+def load_fixture(path):
+    """A página é servida com um URL fictício que acaba no ID do ficheiro (ex: 124881063-239.html)."""
+    with open(path, 'rb') as f:
+        body = f.read()
+    name = os.path.splitext(os.path.basename(path))[0]
+    return HtmlResponse(url=f"https://remax.pt/pt/imoveis/fixture/{name}", body=body, encoding='utf-8')
+
+
+def time_per_page(func, responses, repeat, reparse=False):
+    """ms por página. Com reparse=True cada repetição inclui o parse do HTML pelo lxml."""
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for r in responses:
+            func(r.replace(body=r.body) if reparse else r, **CB_KWARGS)
+    return (time.perf_counter() - t0) / (repeat * len(responses)) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do parse das páginas de detalhe")
+    parser.add_argument('paths', nargs='+', help="Ficheiros .html ou pastas com páginas de detalhe guardadas")
+    parser.add_argument('--repeat', type=int, default=200, help="Repetições por página")
+    args = parser.parse_args()
+
+    files = []
+    for p in args.paths:
+        files.extend(sorted(glob.glob(os.path.join(p, '*.html'))) if os.path.isdir(p) else [p])
+    if not files:
+        print("❌ Nenhuma página HTML encontrada.")
+        return
+
+    responses = [load_fixture(f) for f in files]
+
+    # 1. Paridade: o item novo tem de ser igual ao antigo
+    diferencas = 0
+    for f, r in zip(files, responses):
+        old = {k: v for k, v in legacy_parse_detail(r, **CB_KWARGS).items() if k not in IGNORED}
+        new = {k: v for k, v in parse_detail(r, **CB_KWARGS).items() if k not in IGNORED}
+        if old != new:
+            diferencas += 1
+            campos = sorted(k for k in old.keys() | new.keys() if old.get(k) != new.get(k))
+            print(f"⚠️ {os.path.basename(f)}: campos diferentes {campos}")
+    print(f"✅ Paridade: {len(files) - diferencas}/{len(files)} páginas idênticas.")
+
+    # 2. Custo por página: só a extração (árvore já em cache no Selector) e com o parse do HTML
+    for titulo, reparse in (("Extração", False), ("Total c/ parse HTML", True)):
+        t_old = time_per_page(legacy_parse_detail, responses, args.repeat, reparse)
+        t_new = time_per_page(parse_detail, responses, args.repeat, reparse)
+        print(f"⏱️ {titulo}: antigo {t_old:.3f} ms/página | novo {t_new:.3f} ms/página | {t_old / t_new:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Benchmark da escrita na BD (PostgresPipeline) com vários tamanhos de lote.
+
+PIPELINE_BATCH_SIZE=1 reproduz o comportamento antigo (um INSERT e um commit
+por imóvel). Usa a BD configurada nas variáveis PG*; escreve imóveis com
+url_id 'bench-...' e apaga-os no fim.
+
+Uso:
+    cd MLEngine/src/
+    python bench_pipeline.py                     # 5000 imóveis, lotes 1, 50, 200, 1000
+    python bench_pipeline.py -n 20000 --batch 1 500
+"""
+import argparse
+import logging
+import time
+from datetime import datetime
+from scrapy import Spider
+from scrapy.utils.project import get_project_settings
+from scrapy.utils.test import get_crawler
+from MLEngine.items import ImovelItem
+from MLEngine.pipelines import PostgresPipeline
+
+
+def make_items(n, run):
+    now = datetime.now()
+    for i in range(n):
+        yield ImovelItem(
+            url_id=f"bench-{run}-{i}", link=f"https://remax.pt/pt/imoveis/bench/{i}",
+            last_crawled=str(now), data_publicacao=str(now.date()), listing_page_number=i // 24,
+            preco_atual=150000.0 + i, freguesia='Arroios', tipologia='Apartamento T2',
+            area_bruta_m2=80 + i % 50, area_util_m2=70, area_terreno_m2=0,
+            ano_construcao=1990, num_quartos=2, num_wc=1,
+            estacionamento='1 Lugar', elevador='Sim', certificado_energetico='C',
+            descricao_bruta='Apartamento de teste ' * 20,
+        )
+
+
+def run(n, batch_size, spider):
+    pipeline = PostgresPipeline(get_project_settings())
+    pipeline.batch_size = batch_size
+    t0 = time.perf_counter()
+    for item in make_items(n, batch_size):
+        pipeline.process_item(item, spider)
+    pipeline.flush(spider)
+    elapsed = time.perf_counter() - t0
+    pipeline.cursor.execute("DELETE FROM imoveis WHERE url_id LIKE 'bench-%%'")
+    pipeline.connection.commit()
+    pipeline.close_spider(spider)
+    return elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Linhas/s do PostgresPipeline por tamanho de lote.")
+    parser.add_argument('-n', type=int, default=5000, help="Imóveis por corrida")
+    parser.add_argument('--batch', type=int, nargs='+', default=[1, 50, 200, 1000])
+    args = parser.parse_args()
+
+    spider = Spider.from_crawler(get_crawler(Spider), name='bench')
+    logging.getLogger('bench').setLevel(logging.WARNING)
+
+    print(f"{'lote':>6} | {'tempo (s)':>9} | {'linhas/s':>9}")
+    for batch_size in args.batch:
+        elapsed = run(args.n, batch_size, spider)
+        print(f"{batch_size:>6} | {elapsed:>9.2f} | {args.n / elapsed:>9.0f}")
@@ -0,0 +1,63 @@
+"""
+AdaptiveConcurrencyMiddleware quando o Scrapy apaga um slot parado e cria outro.
+
+Uso:
+    cd MLEngine/src/
+    python -m pytest tests
+"""
+import time
+from types import SimpleNamespace
+
+from scrapy.core.downloader import Slot
+from scrapy.http import Request, Response
+from scrapy.utils.test import get_crawler
+
+from MLEngine import middlewares
+from MLEngine.middlewares import AdaptiveConcurrencyMiddleware
+
+KEY = 'www.remax.pt'
+
+
+def make_middleware():
+    crawler = get_crawler(settings_dict={
+        'ADAPTIVE_CONCURRENCY_ENABLED': True,
+        'ADAPTIVE_START_CONCURRENCY': 2,
+        'ADAPTIVE_MAX_CONCURRENCY': 8,
+        'ADAPTIVE_MIN_DELAY': 0.5,
+    })
+    crawler.stats = SimpleNamespace(inc_value=lambda *a, **k: None)
+    downloader = SimpleNamespace(slots={}, get_slot_key=lambda request: KEY)
+    crawler.engine = SimpleNamespace(downloader=downloader)
+    return AdaptiveConcurrencyMiddleware(crawler), downloader
+
+
+def respond(middleware, n, status=200):
+    for _ in range(n):
+        request = Request(f'https://{KEY}/x', meta={'download_latency': 1.0})
+        middleware.process_response(request, Response(request.url, status=status, request=request), None)
+
+
+def test_recreated_slot_gets_the_controller_state_back():
+    middleware, downloader = make_middleware()
+    downloader.slots[KEY] = Slot(1, 0.5)
+    respond(middleware, 2 + 3 + 4)   # Três rondas boas com o delay no mínimo: 2 -> 3 -> 4 -> 5
+    assert downloader.slots[KEY].concurrency == 5
+
+    downloader.slots[KEY] = Slot(1, 2.5)    # O Scrapy recriou o slot com os valores por omissão
+    respond(middleware, 1)
+    assert downloader.slots[KEY].concurrency == 5
+    assert downloader.slots[KEY].delay == 0.5
+
+
+def test_state_of_long_gone_slots_is_dropped(monkeypatch):
+    middleware, downloader = make_middleware()
+    downloader.slots[KEY] = Slot(1, 0.5)
+    respond(middleware, 1)
+    del downloader.slots[KEY]
+
+    later = time.time() + middlewares.SLOT_STATE_TTL + 1
+    monkeypatch.setattr(middlewares.time, 'time', lambda: later)
+    downloader.get_slot_key = lambda request: 'outro.pt'
+    downloader.slots['outro.pt'] = Slot(1, 0.5)
+    respond(middleware, 1)
+    assert list(middleware.slots) == ['outro.pt']
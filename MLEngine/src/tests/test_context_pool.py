@@ -0,0 +1,124 @@
+"""
+Pool de contextos do Playwright: páginas devolvidas ao pool, fechadas em erro
+e contextos reformados fechados quando ficam sem pedidos.
+
+Sem browser: páginas e contextos são imitações com o que o middleware usa.
+
+Uso:
+    cd MLEngine/src/
+    python -m pytest tests
+"""
+import asyncio
+
+from scrapy.http import HtmlResponse, Request
+from scrapy.utils.test import get_crawler
+
+from MLEngine.middlewares import ContextPoolMiddleware
+from MLEngine.spiders.remax_spider import RemaxSpider
+
+SETTINGS = {
+    'PLAYWRIGHT_POOL_ENABLED': True,
+    'PLAYWRIGHT_POOL_SIZE': 1,
+    'PLAYWRIGHT_POOL_MAX_PAGES': 100,
+    'PLAYWRIGHT_CONTEXT_KWARGS': {'locale': 'pt-PT'},
+}
+
+
+class FakeContext:
+    def __init__(self):
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+
+class FakePage:
+    def __init__(self, context, heap=0):
+        self.context = context
+        self.heap = heap
+        self.closed = False
+
+    def is_closed(self):
+        return self.closed
+
+    async def close(self):
+        self.closed = True
+
+    async def evaluate(self, script):
+        return self.heap
+
+
+def pool_for(**overrides):
+    return ContextPoolMiddleware(get_crawler(settings_dict={**SETTINGS, **overrides}))
+
+
+def playwright_request(pool):
+    request = Request('https://www.remax.pt/comprar', meta={'playwright': True})
+    pool.process_request(request, None)
+    return request
+
+
+def finish(pool, request, page, error=None):
+    """O que o handler do scrapy-playwright faz: a página do pedido vai na meta até ao fim."""
+    if page is not None:
+        request.meta['playwright_page'] = page
+    if error is None:
+        response = HtmlResponse(request.url, body=b'', request=request)
+        return asyncio.run(pool.process_response(request, response, None))
+    return asyncio.run(pool.process_exception(request, error, None))
+
+
+def test_page_goes_back_to_the_pool_and_is_reused():
+    pool = pool_for()
+    context = FakeContext()
+    page = FakePage(context)
+
+    first = playwright_request(pool)
+    assert first.meta['playwright_context'] == 'pool-0-g0'
+    assert first.meta['playwright_context_kwargs'] == {'locale': 'pt-PT'}
+    assert 'playwright_page' not in first.meta
+    finish(pool, first, page)
+
+    second = playwright_request(pool)
+    assert second.meta['playwright_page'] is page
+    assert not page.closed
+    assert pool.in_flight['pool-0-g0'] == 1
+
+
+def test_page_is_closed_on_error_and_not_reused():
+    pool = pool_for()
+    page = FakePage(FakeContext())
+
+    request = playwright_request(pool)
+    finish(pool, request, page, error=TimeoutError('networkidle'))
+
+    assert page.closed
+    assert pool.idle_pages.get('pool-0-g0', []) == []
+    assert pool.in_flight['pool-0-g0'] == 0
+    assert 'playwright_page' not in playwright_request(pool).meta
+
+
+def test_retired_context_is_closed_with_its_idle_pages():
+    pool = pool_for(PLAYWRIGHT_POOL_MAX_PAGES=2)
+    context = FakeContext()
+    idle, last = FakePage(context), FakePage(context)
+
+    first = playwright_request(pool)
+    second = playwright_request(pool)   # 2ª navegação: o contexto é reformado
+    assert pool.active == ['pool-0-g1']
+    finish(pool, first, idle)
+    assert not context.closed           # Ainda há um pedido em voo
+    finish(pool, second, last, error=RuntimeError('crash'))
+
+    assert idle.closed and last.closed and context.closed
+    assert playwright_request(pool).meta['playwright_context'] == 'pool-0-g1'
+
+
+def test_listing_request_uses_crawler_context_kwargs():
+    crawler = get_crawler(RemaxSpider, {'PLAYWRIGHT_CONTEXT_KWARGS': {'locale': 'en-GB'}})
+    spider = RemaxSpider()
+    spider._set_crawler(crawler)
+
+    request = spider.make_listing_request('https://www.remax.pt/comprar', page_number=1)
+
+    assert request.meta['playwright_context_kwargs'] == {'locale': 'en-GB'}
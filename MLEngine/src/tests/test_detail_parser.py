@@ -0,0 +1,51 @@
+"""
+Extrator da página de detalhe (DetailFields, uma só passagem) contra o antigo
+(um XPath por etiqueta, em bench_parse.legacy_parse_detail), sobre as páginas
+guardadas em tests/fixtures/.
+
+Uso:
+    cd MLEngine/src/
+    python -m pytest tests/test_detail_parser.py                  # paridade + benchmark
+    python -m pytest tests/test_detail_parser.py --benchmark-skip # só paridade
+"""
+import glob
+import os
+
+import pytest
+
+from bench_parse import IGNORED, legacy_parse_detail, load_fixture
+from MLEngine.detail_parser import parse_detail
+
+FIXTURES = sorted(glob.glob(os.path.join(os.path.dirname(__file__), 'fixtures', '*.html')))
+CB_KWARGS = {'area': 55, 'price': 185000.0, 'freguesia': 'Arroios', 'link_completo': 'https://remax.pt/x', 'page_number': 3}
+
+
+@pytest.fixture(scope='module')
+def responses():
+    return [load_fixture(f) for f in FIXTURES]
+
+
+def test_fixtures_present():
+    assert len(FIXTURES) >= 3
+
+
+@pytest.mark.parametrize('path', FIXTURES, ids=os.path.basename)
+def test_single_pass_matches_legacy_selectors(path):
+    response = load_fixture(path)
+    old = legacy_parse_detail(response, **CB_KWARGS)
+    new = parse_detail(response, **CB_KWARGS)
+
+    assert set(new) == set(old)
+    for field in old:
+        if field not in IGNORED:
+            assert new[field] == old[field], field
+
+
+@pytest.mark.parametrize('parser', [parse_detail, legacy_parse_detail], ids=['single_pass', 'legacy'])
+def test_benchmark_detail_parse(benchmark, responses, parser):
+    # Cada ronda volta a construir o Response: inclui o parse do HTML pelo lxml, como no crawl
+    def parse_all():
+        return [parser(r.replace(body=r.body), **CB_KWARGS) for r in responses]
+
+    items = benchmark(parse_all)
+    assert len(items) == len(responses)
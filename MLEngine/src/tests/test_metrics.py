@@ -0,0 +1,60 @@
+"""
+Texto Prometheus do /metrics: cada família com # HELP e # TYPE antes das amostras.
+
+Uso:
+    cd MLEngine/src/
+    python -m pytest tests
+"""
+from scrapy.utils.test import get_crawler
+
+from MLEngine.extensions import CrawlMetrics
+
+
+def metrics():
+    crawler = get_crawler(settings_dict={'METRICS_ENABLED': True})
+    ext = CrawlMetrics(crawler)
+    ext.observe('download', 'http', 0.3)
+    ext.observe('download', 'playwright', 4.0)
+    ext.observe('parse', 'parse', 0.02)
+    crawler.stats.set_value('response_received_count', 12)
+    crawler.stats.set_value('ttl/skipped', 3)
+    return ext
+
+
+def families(text):
+    """Nome da família -> (tipo declarado, posição do # TYPE, posições das amostras)."""
+    lines = text.splitlines()
+    declared, samples = {}, {}
+    for i, line in enumerate(lines):
+        if line.startswith('# TYPE '):
+            _, _, name, kind = line.split()
+            assert name not in declared, f'{name} declarado duas vezes'
+            declared[name] = (kind, i)
+        elif not line.startswith('#'):
+            sample = line.split('{')[0].split(' ')[0]
+            family = next((n for n in declared if sample == n or sample.startswith(n + '_')), sample)
+            samples.setdefault(family, []).append(i)
+    return declared, samples
+
+
+def test_every_family_is_typed_before_its_samples():
+    text = metrics().prometheus()
+    declared, samples = families(text)
+
+    assert declared['remax_download_seconds'][0] == 'histogram'
+    assert declared['remax_parse_seconds'][0] == 'histogram'
+    assert declared['remax_pages_per_minute'][0] == 'gauge'
+    assert declared['scrapy_stat'][0] == 'gauge'
+    for family, positions in samples.items():
+        assert family in declared, f'{family} sem # TYPE'
+        assert declared[family][1] < min(positions)
+        assert f'# HELP {family} ' in text
+
+
+def test_histogram_family_keeps_all_labels_under_one_header():
+    text = metrics().prometheus()
+
+    assert text.count('# TYPE remax_download_seconds histogram') == 1
+    assert 'remax_download_seconds_bucket{label="http",le="0.5"} 1' in text
+    assert 'remax_download_seconds_bucket{label="playwright",le="+Inf"} 1' in text
+    assert 'remax_download_seconds_count{label="playwright"} 1' in text
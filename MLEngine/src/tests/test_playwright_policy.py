@@ -0,0 +1,66 @@
+"""
+Política de recursos do Playwright: o que é cortado e o que passa, com os settings do crawler.
+
+Uso:
+    cd MLEngine/src/
+    python -m pytest tests
+"""
+from types import SimpleNamespace
+from unittest import mock
+
+from scrapy.utils.misc import load_object
+from scrapy.utils.test import get_crawler
+from scrapy_playwright.handler import ScrapyPlaywrightDownloadHandler
+
+from MLEngine.playwright_policy import PolicyDownloadHandler, ResourcePolicy, project_policy
+
+SETTINGS = {
+    'PLAYWRIGHT_ABORT_REQUEST': 'MLEngine.playwright_policy.should_abort_request',
+    'PLAYWRIGHT_BLOCKED_RESOURCE_TYPES': ['image', 'media', 'font', 'stylesheet'],
+    'PLAYWRIGHT_ALLOWED_DOMAINS': ['remax.pt'],
+}
+
+
+def browser_request(url, resource_type, navigation=False):
+    """Imitação do playwright.async_api.Request (só o que a política usa)."""
+    return SimpleNamespace(url=url, resource_type=resource_type, is_navigation_request=lambda: navigation)
+
+
+def handler_for(settings):
+    """PolicyDownloadHandler sem browser: o __init__ do scrapy-playwright só carrega o PLAYWRIGHT_ABORT_REQUEST."""
+    def fake_init(self, crawler):
+        self.abort_request = load_object(crawler.settings['PLAYWRIGHT_ABORT_REQUEST'])
+
+    with mock.patch.object(ScrapyPlaywrightDownloadHandler, '__init__', fake_init):
+        return PolicyDownloadHandler(get_crawler(settings_dict=settings))
+
+
+def test_policy_aborts_images_and_third_parties_but_keeps_first_party_documents():
+    abort = handler_for(SETTINGS).abort_request
+    assert isinstance(abort, ResourcePolicy)
+
+    assert abort(browser_request('https://www.remax.pt/imoveis/1', 'document', navigation=True)) is False
+    assert abort(browser_request('https://www.remax.pt/_next/static/app.js', 'script')) is False
+    assert abort(browser_request('https://api.remax.pt/listings', 'xhr')) is False
+    assert abort(browser_request('https://www.remax.pt/foto.jpg', 'image')) is True
+    assert abort(browser_request('https://www.google-analytics.com/collect', 'xhr')) is True
+    assert abort(browser_request('https://maps.example.com/embed', 'document')) is True
+    # A navegação principal nunca é cortada, mesmo para fora da allowlist
+    assert abort(browser_request('https://outro-site.pt/', 'document', navigation=True)) is False
+
+
+def test_policy_follows_crawler_setting_overrides():
+    abort = handler_for({
+        **SETTINGS,
+        'PLAYWRIGHT_BLOCKED_RESOURCE_TYPES': ['font'],
+        'PLAYWRIGHT_ALLOWED_DOMAINS': [],
+    }).abort_request
+
+    assert abort(browser_request('https://www.remax.pt/foto.jpg', 'image')) is False
+    assert abort(browser_request('https://www.google-analytics.com/collect', 'xhr')) is False
+    assert abort(browser_request('https://fonts.gstatic.com/x.woff2', 'font')) is True
+
+
+def test_custom_abort_request_is_kept():
+    custom = 'MLEngine.playwright_policy.project_policy'
+    assert handler_for({**SETTINGS, 'PLAYWRIGHT_ABORT_REQUEST': custom}).abort_request is project_policy
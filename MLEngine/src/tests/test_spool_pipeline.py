@@ -0,0 +1,171 @@
+"""
+Drain do SpooledPostgresPipeline com um registo de preços mau a meio do spool.
+
+Sem Postgres: a ligação é um MagicMock e o execute_values do pipeline é trocado
+por um falso que rejeita preços não numéricos (como o ::float do UPDATE).
+
+Uso:
+    cd MLEngine/src/
+    python -m pytest tests
+"""
+import os
+from unittest import mock
+
+import psycopg2
+import pytest
+from scrapy import Spider
+from scrapy.settings import Settings
+from scrapy.utils.test import get_crawler
+
+from MLEngine import pipelines
+from MLEngine.pipelines import PRICE_SWEEP_QUERY, UPSERT_QUERY, SpooledPostgresPipeline
+from MLEngine.spool import Spool
+
+
+class FakeDB:
+    """execute_values falso: guarda o que foi gravado; um preço inválido aborta o statement."""
+
+    def __init__(self):
+        self.prices = []
+        self.upserts = []
+
+    def execute_values(self, cursor, query, rows, template=None, page_size=None, fetch=False):
+        if query is PRICE_SWEEP_QUERY:
+            for url_id, price, seen_at in rows:
+                try:
+                    float(price)
+                except (TypeError, ValueError):
+                    raise psycopg2.DataError(f'invalid input syntax for type double precision: "{price}"')
+            self.prices += [row[0] for row in rows]
+            cursor.rowcount = len(rows)
+        elif query is UPSERT_QUERY:
+            self.upserts += [row[0] for row in rows]
+            return [(row[0], True) for row in rows]
+
+
+@pytest.fixture
+def pipeline(tmp_path):
+    pipeline = SpooledPostgresPipeline(Settings({'SPOOL_DIR': str(tmp_path / 'spool'), 'SPOOL_FSYNC': False}))
+    pipeline.connection = mock.MagicMock(closed=False)
+    pipeline.cursor = pipeline.connection.cursor.return_value
+    return pipeline
+
+
+@pytest.fixture
+def db():
+    db = FakeDB()
+    with mock.patch.object(pipelines, 'execute_values', db.execute_values):
+        yield db
+
+
+def imovel(url_id):
+    return {'kind': 'imovel', 'data': {'url_id': url_id, 'link': f'https://remax.pt/{url_id}'}}
+
+
+def prices(rows, seen_at='2025-01-31 10:00:00'):
+    data = {'rows': rows, 'listing_page_number': 1}
+    if seen_at is not None:
+        data['seen_at'] = seen_at
+    return {'kind': 'prices', 'data': data}
+
+
+def write_segment(spool, records):
+    spool.append(records)
+    spool.seal()
+
+
+def test_bad_price_record_does_not_block_later_segments(pipeline, db):
+    spider = Spider(name='spool')
+    write_segment(pipeline.spool, [
+        imovel('a'),
+        prices([['1', 100.0], ['2', 'abc'], ['3', 300.0]]),   # Um preço mau no meio do lote
+        prices([['9', 900.0]], seen_at=None),                 # Registo sem seen_at
+    ])
+    write_segment(pipeline.spool, [imovel('b'), prices([['4', 400.0]])])
+
+    segments, changes, _ = pipeline.drain(spider)
+
+    assert segments == 2
+    assert pipeline.spool.segments() == []
+    assert db.upserts == ['a', 'b']
+    assert db.prices == ['1', '3', '4']
+    assert pipeline.fail_count == 2
+    pipeline.connection.rollback.assert_called()
+
+
+def test_failing_segment_is_quarantined_and_the_rest_drains(pipeline, db):
+    spider = Spider(name='spool')
+    pipeline.max_segment_failures = 2
+    write_segment(pipeline.spool, [imovel('a')])
+    write_segment(pipeline.spool, [imovel('b')])
+    bad, good = pipeline.spool.segments()
+
+    drain_segment = pipeline.drain_segment
+
+    def failing(path, spider):
+        if path == bad:
+            raise RuntimeError("segmento ilegível")
+        return drain_segment(path, spider)
+
+    with mock.patch.object(pipeline, 'drain_segment', failing):
+        with pytest.raises(RuntimeError):
+            pipeline.drain(spider)
+        assert pipeline.spool.segments() == [bad, good]     # Mantém a ordem e tenta de novo
+
+        segments, _, _ = pipeline.drain(spider)
+
+    assert segments == 1
+    assert pipeline.spool.segments() == []
+    assert pipeline.quarantined == 1
+    assert db.upserts == ['b']
+    assert os.listdir(os.path.join(pipeline.spool.directory, 'quarantine')) == [os.path.basename(bad)]
+
+
+def test_pipeline_reads_the_crawler_settings(tmp_path):
+    crawler = get_crawler(settings_dict={
+        'SPOOL_DIR': str(tmp_path / 'outro'), 'SPOOL_MAX_BYTES': 1024, 'PIPELINE_BATCH_SIZE': 7,
+    })
+    pipeline = SpooledPostgresPipeline.from_crawler(crawler)
+
+    assert pipeline.settings is crawler.settings
+    assert pipeline.spool.directory == str(tmp_path / 'outro')
+    assert pipeline.max_bytes == 1024
+    assert pipeline.batch_size == 7
+
+
+def test_pending_bytes_are_tracked_without_touching_the_disk(tmp_path):
+    spool = Spool(str(tmp_path / 'spool'), fsync=True)
+    with mock.patch('os.fsync') as fsync, mock.patch('os.path.getsize') as getsize, \
+            mock.patch('glob.glob') as glob:
+        for url_id in 'abc':
+            spool.append([imovel(url_id)])
+            assert spool.pending_bytes == spool.current_bytes
+        assert fsync.call_count == 0        # Nada de fsync por item
+        first = spool.current_bytes
+        spool.seal()
+        assert fsync.call_count == 1        # Só ao selar
+        spool.append([imovel('d')])
+        spool.sync()
+        spool.sync()                        # Sem escritas novas: não repete
+        assert fsync.call_count == 2
+        assert spool.pending_bytes == first + spool.current_bytes
+        getsize.assert_not_called()
+        glob.assert_not_called()
+
+    sealed, = spool.sealed_segments()
+    assert os.path.getsize(sealed) == first
+    spool.remove(sealed)
+    assert spool.pending_bytes == spool.current_bytes
+    spool.seal()
+    spool.quarantine(spool.sealed_segments()[0])
+    assert spool.pending_bytes == 0
+
+
+def test_segments_left_by_a_previous_run_count_as_pending(tmp_path):
+    old = Spool(str(tmp_path / 'spool'), fsync=False)
+    write_segment(old, [imovel('a'), imovel('b')])
+
+    spool = Spool(str(tmp_path / 'spool'), fsync=False)
+
+    assert spool.sealed_segments() == old.segments()
+    assert spool.pending_bytes == old.pending_bytes > 0
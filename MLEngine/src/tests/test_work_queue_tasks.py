@@ -0,0 +1,103 @@
+"""
+Tarefas da fila distribuída no spider: conclusão, falha e fecho.
+
+Sem Postgres: a fila é um MagicMock e as chamadas à fila correm no próprio
+teste em vez do thread da fila.
+
+Uso:
+    cd MLEngine/src/
+    python -m pytest tests
+"""
+import asyncio
+from unittest import mock
+
+import pytest
+from scrapy.exceptions import DontCloseSpider
+from scrapy.http import HtmlResponse, Request
+from scrapy.utils.test import get_crawler
+from twisted.internet import defer
+
+from MLEngine.spiders.remax_spider import RemaxSpider
+
+
+@pytest.fixture
+def spider():
+    crawler = get_crawler(RemaxSpider)
+    crawler.stats = mock.MagicMock()
+    crawler.engine = mock.MagicMock()
+    spider = RemaxSpider()
+    spider._set_crawler(crawler)
+    spider.queue = mock.MagicMock()
+    spider.queue.claim.return_value = []
+    spider.queue_call = lambda func, *args: defer.succeed(func(*args))
+    return spider
+
+
+async def no_thread(func, *args):
+    return func(*args)
+
+
+def task_response(spider, task_id, callback):
+    setattr(spider, callback.__name__, callback)
+    request = spider.bind_task(Request('https://www.remax.pt/imoveis/1', callback=callback), task_id)
+    spider.leased_tasks.add(task_id)
+    return HtmlResponse(request.url, body=b'<html></html>', request=request)
+
+
+def run_task(spider, response):
+    async def collect():
+        return [r async for r in spider.parse_task(response)]
+
+    with mock.patch.object(spider, 'queue_await', no_thread):
+        return asyncio.run(collect())
+
+
+def test_task_is_completed_after_its_callback(spider):
+    def parse_ok(response):
+        yield {'url_id': '1'}
+        yield Request('https://www.remax.pt/imoveis/2', callback=parse_ok)
+
+    results = run_task(spider, task_response(spider, 7, parse_ok))
+
+    assert results == [{'url_id': '1'}]
+    spider.queue.enqueue.assert_called_once()
+    spider.queue.complete.assert_called_once_with(7)
+    spider.queue.fail.assert_not_called()
+    assert 7 not in spider.leased_tasks
+
+
+@pytest.mark.parametrize('where', ['callback', 'enqueue', 'complete'])
+def test_failing_task_is_failed_and_leaves_the_heartbeat(spider, where):
+    error = RuntimeError('rebentou')
+
+    def parse_boom(response):
+        yield {'url_id': '1'}
+        if where == 'callback':
+            raise error
+
+    if where == 'enqueue':
+        spider.queue.enqueue.side_effect = error
+    if where == 'complete':
+        spider.queue.complete.side_effect = error
+    spider.queue.fail.return_value = 'pending'
+
+    results = run_task(spider, task_response(spider, 7, parse_boom))
+
+    assert results == []
+    spider.queue.fail.assert_called_once_with(7, error)
+    assert 7 not in spider.leased_tasks
+    if where == 'callback':
+        spider.queue.complete.assert_not_called()
+
+
+def test_idle_spider_closes_only_when_the_queue_is_empty(spider):
+    spider.queue.has_open_tasks.return_value = True
+    with pytest.raises(DontCloseSpider):
+        spider.spider_idle(spider)
+
+    spider.queue.has_open_tasks.return_value = False
+    with pytest.raises(DontCloseSpider):
+        spider.spider_idle(spider)  # Esta volta ainda vai à fila e vê-a vazia
+
+    spider.spider_idle(spider)
+    assert spider.queue.has_open_tasks.call_count == 2
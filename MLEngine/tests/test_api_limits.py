@@ -0,0 +1,78 @@
+"""
+Limites do /predict/batch e numeração das linhas do /predict/stream.
+
+Sem modelos: o predict_cached da API é trocado por um falso que devolve a freguesia.
+
+Uso:
+    cd MLEngine/
+    python -m pytest tests
+"""
+import importlib.util
+import json
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+API_MAIN = os.path.join(os.path.dirname(__file__), '..', 'api', 'main.py')
+
+
+@pytest.fixture(scope='module')
+def api():
+    spec = importlib.util.spec_from_file_location('api_main', API_MAIN)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def client(api, monkeypatch):
+    monkeypatch.setattr(api, 'predict_cached', lambda imoveis: [{"freguesia": i.freguesia} for i in imoveis])
+    monkeypatch.setattr(api.registry, 'models', {'apartamento': object()})
+    monkeypatch.setattr(api, 'BATCH_MAX_ITEMS', 2)
+    monkeypatch.setattr(api, 'PREDICT_CHUNK_SIZE', 2)
+    return TestClient(api.app)
+
+
+def imovel(freguesia):
+    return {"area_bruta_m2": 80, "freguesia": freguesia}
+
+
+def test_batch_within_the_limit(client):
+    response = client.post('/predict/batch', json=[imovel('Arroios'), imovel('Alvalade')])
+    assert response.status_code == 200
+    assert response.json() == [{"freguesia": "Arroios"}, {"freguesia": "Alvalade"}]
+
+
+def test_batch_above_the_item_limit_is_413(client):
+    response = client.post('/predict/batch', json=[imovel('Arroios')] * 3)
+    assert response.status_code == 413
+    assert '/predict/stream' in response.json()['detail']
+
+
+def test_batch_above_the_byte_limit_is_413_before_parsing(api, client, monkeypatch):
+    monkeypatch.setattr(api, 'BATCH_MAX_BYTES', 10)
+    response = client.post('/predict/batch', content=b'[' + b' ' * 20 + b']',
+                           headers={'content-type': 'application/json'})
+    assert response.status_code == 413
+
+
+def test_stream_error_lines_count_blank_lines(client):
+    body = '\n'.join([
+        json.dumps(imovel('Arroios')),
+        '',
+        '   ',
+        '{"freguesia": "Benfica"}',             # Linha 4: falta a área
+        json.dumps(imovel('Alvalade')),
+        '',
+        'isto não é json',                      # Linha 7
+    ]) + '\n'
+
+    response = client.post('/predict/stream', content=body.encode('utf-8'))
+
+    resultados = [json.loads(linha) for linha in response.text.splitlines()]
+    assert resultados[0] == {"freguesia": "Arroios"}
+    assert resultados[1]['linha'] == 4
+    assert resultados[2] == {"freguesia": "Alvalade"}
+    assert resultados[3]['linha'] == 7
+    assert len(resultados) == 4
@@ -0,0 +1,99 @@
+"""
+Reload dos modelos com um treino a meio: o modelo antigo nunca é carregado com o
+encoder/colunas novos.
+
+Uso:
+    cd MLEngine/
+    python -m pytest tests
+"""
+import os
+import sys
+
+import joblib
+import pytest
+
+root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(root_dir)
+from common.encoding import SparseEncoder
+from common.model_registry import ModelRegistry
+
+T0 = 1_700_000_000
+
+
+class FakeModel:
+    def __init__(self, generation):
+        self.generation = generation
+
+
+def write(path, obj, mtime):
+    """Grava e fixa o mtime (os testes não dependem da resolução do relógio do FS)."""
+    if isinstance(obj, SparseEncoder):
+        obj.save(path)
+    else:
+        joblib.dump(obj, path)
+    os.utime(path, (mtime, mtime))
+
+
+def train(registry, generation, mtime, model=True):
+    """O que o treino_modelo.py grava, pela mesma ordem: colunas, encoder e por último o modelo."""
+    columns = ['area_relevante_m2', f'freg_gen{generation}']
+    path_model, path_encoder, path_cols = registry.paths('terreno')
+    write(path_cols, columns, mtime)
+    write(path_encoder, SparseEncoder(columns), mtime + 1)
+    if model:
+        write(path_model, FakeModel(generation), mtime + 2)
+
+
+@pytest.fixture
+def registry(tmp_path):
+    registry = ModelRegistry(str(tmp_path), names=('terreno',))
+    train(registry, 1, T0)
+    assert registry.refresh(wait_stable=False) == ['terreno']
+    return registry
+
+
+def loaded(registry):
+    entry = registry.models['terreno']
+    return entry.model.generation, entry.encoder.columns[-1]
+
+
+def test_new_encoder_with_old_model_is_not_loaded(registry):
+    train(registry, 2, T0 + 100, model=False)   # Treino a meio: o modelo ainda é o da geração 1
+
+    assert registry.refresh(wait_stable=False) == []
+    assert registry.refresh() == []
+    assert registry.refresh() == []
+    assert loaded(registry) == (1, 'freg_gen1')
+
+    path_model = registry.paths('terreno')[0]
+    write(path_model, FakeModel(2), T0 + 110)   # O treino acaba
+
+    assert registry.refresh() == []             # wait_stable: primeira vez que o vê
+    assert registry.refresh() == ['terreno']
+    assert loaded(registry) == (2, 'freg_gen2')
+
+
+def test_encoder_touched_without_a_new_model_does_not_reload(registry):
+    path_encoder = registry.paths('terreno')[1]
+    os.utime(path_encoder, (T0 - 50, T0 - 50))  # Mais antigo que o modelo, mas diferente
+
+    assert registry.refresh(wait_stable=False) == []
+    assert loaded(registry) == (1, 'freg_gen1')
+
+
+def test_files_replaced_during_the_load_are_retried(registry, monkeypatch):
+    train(registry, 2, T0 + 100)
+    load = registry.load
+
+    def load_while_training(name, signature):
+        entry = load(name, signature)
+        train(registry, 3, T0 + 200)            # Outro treino grava por cima a meio do load
+        return entry
+
+    monkeypatch.setattr(registry, 'load', load_while_training)
+    assert registry.refresh(wait_stable=False) == []
+    assert loaded(registry) == (1, 'freg_gen1')
+
+    monkeypatch.setattr(registry, 'load', load)
+    assert registry.refresh(wait_stable=False) == ['terreno']
+    assert loaded(registry) == (3, 'freg_gen3')
@@ -0,0 +1,96 @@
+"""
+Paridade do RowTransformer (API, um imóvel sem pandas) com o caminho do treino
+(build_base_features + SparseEncoder.transform): as mesmas linhas esparsas.
+
+Uso:
+    cd MLEngine/
+    python -m pytest tests
+"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(root_dir)
+from common.encoding import CATEGORICAL_PREFIXES, SparseEncoder
+from common.processing import build_base_features
+from common.row_features import RowTransformer
+
+NUMERIC = [
+    'area_relevante_m2', 'area_bruta_m2', 'area_util_m2', 'area_terreno_m2', 'ano_construcao',
+    'num_quartos', 'num_wc', 'score_estado', 'flag_urgente', 'flag_ruina', 'flag_novo',
+    'flag_urbano', 'flag_rustico', 'flag_viabilidade', 'tem_elevador', 'tem_estacionamento',
+    'preco_m2_relevante',
+]
+
+# Vocabulário do "treino": o que o modelo viu
+TRAIN = pd.DataFrame({
+    'link': ['https://remax.pt/pt/imoveis/venda-apartamento/1', 'https://remax.pt/pt/imoveis/venda-moradia/2',
+             'https://remax.pt/pt/imoveis/venda-terreno/3', 'https://remax.pt/pt/imoveis/venda-apartamento/4'],
+    'freguesia': ['Arroios', 'Alvalade', 'Avenidas Novas', 'Arroios'],
+    'tipologia': ['Apartamento T2', 'Moradia T4', 'Terreno', 'Apartamento T1'],
+    'certificado_energetico': ['A', 'C', 'D', None],
+    'area_bruta_m2': [80.0, 200.0, 0.0, 50.0],
+})
+
+# Imóveis a prever: categorias novas, vazios, áreas em falta e a zero
+ROWS = pd.DataFrame({
+    'link': [
+        'https://remax.pt/pt/imoveis/venda-apartamento/10',
+        'https://remax.pt/pt/imoveis/venda-moradia/11',
+        'https://remax.pt/pt/imoveis/venda-terreno/12',
+        'https://remax.pt/pt/imoveis/arrendamento-loja/13',    # listing_type fora do vocabulário
+        None,                                                  # sem link: 'outra'
+        'https://remax.pt/pt/imoveis/venda-estudio/15',
+    ],
+    'preco_atual': [185000.0, 420000.0, 60000.0, 1200.0, np.nan, 99000.0],
+    'area_bruta_m2': [80.0, np.nan, 0.0, 0.0, np.nan, 30.0],
+    'area_bruta_privativa_m2': [75.0, 150.0, np.nan, np.nan, np.nan, 0.0],
+    'area_util_m2': [70.0, np.nan, np.nan, 45.0, np.nan, np.nan],
+    'area_terreno_m2': [0.0, 800.0, np.nan, np.nan, 0.0, np.nan],
+    'area_total_do_lote_m2': [np.nan, np.nan, 2500.0, np.nan, np.nan, np.nan],
+    'ano_construcao': [1990, np.nan, np.nan, 2005, None, 2021],
+    'num_quartos': [2, 4, np.nan, 0, np.nan, 0],
+    'num_wc': [1, 3, np.nan, 1, np.nan, 1],
+    'freguesia': [' Arroios', 'ALVALADE', 'Parque das Nações', None, 'Benfica', 'Avenidas Novas '],
+    'tipologia': ['Apartamento T2', 'Moradia T5', ' Terreno', 'Loja', None, 'Apartamento T0'],
+    'certificado_energetico': ['C', 'A+', None, 'D', np.nan, 'A'],
+    'descricao_bruta': ['Apartamento remodelado, urgente!', 'Moradia para recuperar, em ruína',
+                        'Terreno urbano com viabilidade de construção', None, '', 'Estúdio novo, nunca habitado'],
+    'ai_estado': [4, np.nan, np.nan, 2, np.nan, 5],
+    'ai_urgente': [True, False, None, np.nan, True, False],
+    'elevador': ['Sim', 'Não', None, 'Sim', np.nan, 'Sim'],
+    'estacionamento': ['1 Lugar', 'Não', None, np.nan, 'Garagem', 'Não'],
+})
+
+
+@pytest.fixture(scope='module')
+def encoder():
+    return SparseEncoder.fit(build_base_features(TRAIN.copy()), NUMERIC, categorical=list(CATEGORICAL_PREFIXES))
+
+
+@pytest.mark.parametrize('drop', [[], ['descricao_bruta', 'ai_estado', 'ai_urgente'], ['elevador', 'estacionamento']],
+                         ids=['completo', 'sem_descricao', 'sem_binarios'])
+def test_row_transformer_matches_base_features_and_encoder(encoder, drop):
+    df = ROWS.drop(columns=drop)
+    esperado = encoder.transform(build_base_features(df.copy())).toarray()
+    transformer = RowTransformer(encoder)
+
+    for i, record in enumerate(df.to_dict('records')):
+        obtido = transformer.transform(record)[0]
+        diferentes = [encoder.columns[j] for j in np.flatnonzero(~np.isclose(esperado[i], obtido))]
+        assert not diferentes, f"linha {i}: {diferentes}"
+
+
+def test_synthetic_rows_cover_unseen_categories_and_empty_areas(encoder):
+    features = build_base_features(ROWS.copy())
+    unseen = encoder.unseen(features)
+    assert {'benfica', 'parque das nações', 'desconhecido'} <= set(unseen['freguesia_limpa'])
+    assert {'moradia t5', 'loja', 'outra'} <= set(unseen['tipologia_limpa'])
+    assert 'A+' in unseen['certificado_energetico']
+    # Área relevante a zero ou em falta fica NaN (0 na matriz), nunca divide o preço por zero
+    assert features['area_relevante_m2'].isna().sum() >= 2
+    assert not np.isinf(features['preco_m2_relevante']).any()